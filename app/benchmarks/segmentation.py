@@ -0,0 +1,58 @@
+''' Compares the sentence segmentation of the segmenter with splitting one paragraph after the other.
+
+    python -m app.benchmarks.segmentation [number of paragraphs] [workers]
+'''
+from __future__ import annotations
+import random
+import sys
+import time
+from typing import Callable, List
+from app.internal.segmentation import SentenceSegmenter, split_sentences
+
+WORDS = ['the', 'friction', 'coefficient', 'of', 'steel', 'on', 'brass', 'decreases', 'with', 'sliding', 'velocity',
+         'lubricated', 'contact', 'wear', 'rate', 'Fig', '2', 'shows', 'Smith', 'et al.', 'measured', 'at', '20 °C']
+
+
+def _paragraphs(number: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    paragraphs = []
+    for _ in range(number):
+        sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 30))).capitalize() + "."
+                     for _ in range(rng.randint(2, 8))]
+        paragraphs.append(" ".join(sentences))
+    return paragraphs
+
+
+def _measure(name: str, function: Callable[[], List], repeat: int = 3) -> List:
+    best = float('inf')
+    res = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = function()
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:<28}{best * 1000:>10.1f} ms")
+    return res
+
+
+def main(number: int = 5000, workers: int = 4) -> None:
+    paragraphs = _paragraphs(number)
+    print(f"{number} paragraphs, {sum(len(_) for _ in paragraphs)} characters, {workers} workers")
+    expected = _measure("serial (current path)", lambda: [split_sentences(_) for _ in paragraphs])
+
+    serial = SentenceSegmenter(workers=0)
+    parallel = SentenceSegmenter(workers=workers, parallel_threshold=0)
+    # Start the processes before measuring.
+    parallel.split_many(_paragraphs(workers * parallel.batch_size, seed=1))
+
+    def cold(segmenter: SentenceSegmenter) -> List:
+        segmenter.clear()
+        return segmenter.split_many(paragraphs)
+
+    assert _measure("segmenter, cold", lambda: cold(serial)) == expected
+    assert _measure("segmenter, cold, parallel", lambda: cold(parallel)) == expected
+    assert _measure("segmenter, memoized", lambda: parallel.split_many(paragraphs)) == expected
+    parallel.close()
+
+
+if __name__ == '__main__':
+    main(*[int(_) for _ in sys.argv[1:3]])
@@ -58,11 +58,80 @@ indexs = {
             'triple_template': 'database/files/indexes/triple_templates.json'
         }
 
+# The pipeline state (uploaded, extracted, annotated, analysed) of every document.
+states_index = 'database/files/indexes/states.json'
+
+# The metadata (doi, issn, title, authors, journal) of the annotated documents for lookups.
+metadata_index = 'database/files/indexes/metadata.json'
+
+# The full-text index over the sentences and the knowledge object labels of the documents.
+fulltext_index = 'database/files/fulltext.sqlite3'
+
+# The indexs whose documents keep a version history of their edits.
+versioned_indexes = ['extract', 'annotate']
+history_database = 'database/files/history.sqlite3'
+
+###############################################################################
+###############################################################################
+###############################################################################
+# Storage backend:
+# 'file' keeps every document as a json file in the database_folders and every
+# index as a json file. 'sqlite' keeps the documents and the indexs in one
+# embedded SQLite database (WAL mode).
+
+DATABASE_BACKEND = 'file'
+sqlite_database = 'database/files/database.sqlite3'
+
+# The pdfs and images of the documents are stored once by their content hash.
+blob_folder = 'database/files/blobs'
+
+# The codec ('zstd', 'gzip' or 'none') of the files of an index. Without the zstandard
+# package 'zstd' falls back to 'gzip'. Run app/database/compression.py to compress existing files.
+database_compression = {
+            'extract': 'zstd',
+            'annotate': 'zstd'
+        }
+compression_dictionaries = 'database/files/dictionaries'
+
+# The maximal size of the serialized documents that are kept in memory (in bytes).
+DOCUMENT_CACHE_SIZE = 256 * 1024 * 1024
+# The maximal size of the full texts and offset maps of the documents kept in memory (in bytes).
+TEXT_VIEW_CACHE_SIZE = 64 * 1024 * 1024
+
+# Garbage collection: temporary files (static/tmp: pdfs, renditions, pages, downloads) are
+# deleted after TMP_TTL seconds without use or, the least recently used first, once they need
+# more than TMP_MAX_SIZE bytes. Leased files are kept. Unreferenced files in the
+# database folders and unreferenced blobs are only deleted after GC_GRACE_PERIOD seconds.
+TMP_TTL = 24 * 60 * 60
+TMP_MAX_SIZE = 1024 * 1024 * 1024
+# Temporary files that are sent in a response are kept for at least TMP_LEASE seconds.
+TMP_LEASE = 60
+GC_GRACE_PERIOD = 60 * 60
+
+# The renditions of the images (static/tmp/renditions) are served at RENDITION_URL. Their names
+# depend on their content, so browsers may keep them for RENDITION_MAX_AGE seconds.
+RENDITION_URL = '/renditions'
+RENDITION_MAX_AGE = 365 * 24 * 60 * 60
+
+# Sentence segmentation: the sentences of up to SEGMENTATION_CACHE_SIZE paragraphs are kept in
+# memory. If more than SEGMENTATION_PARALLEL_THRESHOLD characters have to be segmented at once,
+# they are split by SEGMENTATION_WORKERS processes (0 or 1 segments in the calling process).
+SEGMENTATION_CACHE_SIZE = 100000
+SEGMENTATION_WORKERS = min(4, os.cpu_count() or 1)
+SEGMENTATION_PARALLEL_THRESHOLD = 200000
+
 ##################
 # Paths
 
 PATH_TO_APP = os.path.abspath(main.__file__).replace("__init__.py", "")
 DATABASE_PATHS = {type: os.path.join(PATH_TO_APP, rel_path) for type, rel_path in database_folders.items()}
 PATH_TO_TMP = os.path.join(PATH_TO_APP, "static/tmp")
+PATH_TO_RENDITIONS = os.path.join(PATH_TO_TMP, "renditions")
 PATH_TO_QUESTIONTEMPLATE = os.path.join(PATH_TO_APP, "files/question_templates.json")
-PATH_TO_TRIPLEFILE = os.path.join(PATH_TO_APP, "files/test_triple.txt")
\ No newline at end of file
+PATH_TO_TRIPLEFILE = os.path.join(PATH_TO_APP, "files/test_triple.txt")
+PATH_TO_SQLITE = os.path.join(PATH_TO_APP, sqlite_database)
+PATH_TO_BLOBS = os.path.join(PATH_TO_APP, blob_folder)
+PATH_TO_DICTIONARIES = os.path.join(PATH_TO_APP, compression_dictionaries)
+PATH_TO_METADATA_INDEX = os.path.join(PATH_TO_APP, metadata_index)
+PATH_TO_FULLTEXT_INDEX = os.path.join(PATH_TO_APP, fulltext_index)
+PATH_TO_HISTORY = os.path.join(PATH_TO_APP, history_database)
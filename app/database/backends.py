@@ -0,0 +1,300 @@
+from __future__ import annotations
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from app.config import indexs, states_index, database_compression, PATH_TO_APP, PATH_TO_SQLITE, \
+    PATH_TO_DICTIONARIES, DATABASE_BACKEND
+from app.database.compression import Compression
+from app.database.index import Index, IndexElement
+from app.database.journal import Journal
+
+
+class StorageBackend(ABC):
+    ''' A storage backend keeps the documents and the indexs of the database. '''
+    # The folder of the database, data that belongs to the documents (e.g. their history) is kept there.
+    folder: str
+
+    def has_index(self, index: str) -> bool:
+        ''' Checks if the backend knows the index. '''
+        return index in self.get_indexes()
+
+    def find_index(self, file_id: str, path_to_file: str = '') -> Optional[str]:
+        ''' Returns the index that contains the file or None. '''
+        for index in self.get_indexes():
+            element = self.get_element(index, file_id)
+            if element is not None and (path_to_file == '' or element.path == path_to_file):
+                return index
+        return None
+
+    @abstractmethod
+    def get_indexes(self) -> Iterable[str]:
+        ''' Returns the names of all indexs. '''
+
+    @abstractmethod
+    def get_index_data(self, index: str) -> Dict[str, IndexElement]:
+        ''' Returns all elements of an index by their id. '''
+
+    @abstractmethod
+    def get_element(self, index: str, file_id: str) -> Optional[IndexElement]:
+        ''' Returns the element of a file or None. '''
+
+    @abstractmethod
+    def read(self, index: str, file_id: str) -> Optional[str]:
+        ''' Returns the serialized file or None. '''
+
+    @abstractmethod
+    def write(self, index: str, element: IndexElement, content: str) -> None:
+        ''' Writes the serialized file, adds it to the index and bumps its version. '''
+
+    def write_many(self, items: List[Tuple[str, IndexElement, str]]) -> None:
+        ''' Writes several files (index, element, content) at once. '''
+        for index, element, content in items:
+            self.write(index, element, content)
+
+    @abstractmethod
+    def delete(self, index: str, file_id: str) -> bool:
+        ''' Deletes a file and its index entry. '''
+
+    @abstractmethod
+    def get_states(self) -> Dict[str, Dict]:
+        ''' Returns the pipeline states of all documents by their id. '''
+
+    @abstractmethod
+    def put_state(self, record: Dict) -> None:
+        ''' Adds or replaces the pipeline state of a document. '''
+
+    @abstractmethod
+    def delete_state(self, file_id: str) -> None:
+        ''' Deletes the pipeline state of a document. '''
+
+    def save(self) -> None:
+        ''' Persists pending changes of the indexs. '''
+
+
+class FileBackend(StorageBackend):
+    ''' Keeps every document as a json file and every index as a json array. '''
+
+    def __init__(self, index_paths: Dict[str, str], path_to_states: str = None, compression: Compression = None):
+        self.indexs: Dict[str, Index] = {idx: Index(path) for idx, path in index_paths.items()}
+        self.compression: Compression = compression if compression is not None else Compression()
+        if path_to_states is None:
+            path_to_states = os.path.join(os.path.dirname(next(iter(index_paths.values()))), "states.json")
+        self.states: Journal = Journal(path_to_states)
+        self.state_data: Dict[str, Dict] = self.states.load()
+        # The indexs are kept in a sub folder (indexes) of the database folder.
+        self.folder: str = os.path.dirname(os.path.dirname(os.path.abspath(path_to_states)))
+
+    def get_indexes(self) -> Iterable[str]:
+        return self.indexs.keys()
+
+    def get_index_data(self, index: str) -> Dict[str, IndexElement]:
+        return self.indexs[index].data
+
+    def get_element(self, index: str, file_id: str) -> Optional[IndexElement]:
+        return self.indexs[index].data.get(file_id)
+
+    def read(self, index: str, file_id: str) -> Optional[str]:
+        element = self.get_element(index, file_id)
+        if element is None:
+            return None
+        with open(element.path, "rb") as file:
+            return self.compression.decode(file.read())
+
+    def write(self, index: str, element: IndexElement, content: str) -> None:
+        self.write_many([(index, element, content)])
+
+    def write_many(self, items: List[Tuple[str, IndexElement, str]]) -> None:
+        ''' Writes every file to a temporary file and replaces the old files once all of them are synced.
+
+        A crash during the write leaves either the old or the new file but never a partial one.
+        '''
+        tmp_paths = []
+        for index, element, content in items:
+            tmp_path = f"{element.path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(self.compression.encode(index, content))
+                f.flush()
+                os.fsync(f.fileno())
+            tmp_paths.append(tmp_path)
+        for (index, element, _), tmp_path in zip(items, tmp_paths):
+            os.replace(tmp_path, element.path)
+            self.indexs[index].add_id(element.id, element.path, element.name)
+        for folder in {os.path.dirname(element.path) for _, element, _ in items}:
+            _fsync_folder(folder)
+
+    def delete(self, index: str, file_id: str) -> bool:
+        return self.indexs[index].del_id(file_id)
+
+    def get_states(self) -> Dict[str, Dict]:
+        self.states.refresh(self.state_data)
+        return self.state_data
+
+    def put_state(self, record: Dict) -> None:
+        with self.states.locked():
+            self.states.refresh(self.state_data)
+            self.state_data[record['id']] = record
+            self.states.put(record['id'], record)
+
+    def delete_state(self, file_id: str) -> None:
+        with self.states.locked():
+            self.states.refresh(self.state_data)
+            if self.state_data.pop(file_id, None) is not None:
+                self.states.delete(file_id)
+
+    def save(self) -> None:
+        for idx in self.indexs.values():
+            idx.save_index()
+        self.states.sync()
+        if self.states.needs_compaction():
+            with self.states.locked():
+                self.states.refresh(self.state_data)
+                self.states.compact(self.state_data, background=True)
+
+
+class SQLiteBackend(StorageBackend):
+    ''' Keeps the documents and the indexs in an embedded SQLite database (WAL mode). '''
+
+    def __init__(self, path_to_db: str, index_names: Iterable[str], compression: Compression = None):
+        self.path_to_db: str = path_to_db
+        self.folder: str = os.path.dirname(os.path.abspath(path_to_db))
+        self.index_names = list(index_names)
+        self.compression: Compression = compression if compression is not None else Compression()
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path_to_db), exist_ok=True)
+        with self._connection() as connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS documents (
+                                    idx TEXT NOT NULL,
+                                    id TEXT NOT NULL,
+                                    name TEXT NOT NULL,
+                                    path TEXT NOT NULL,
+                                    content TEXT NOT NULL,
+                                    version INTEGER NOT NULL DEFAULT 0,
+                                    generation INTEGER NOT NULL DEFAULT 0,
+                                    PRIMARY KEY (idx, id))""")
+            columns = [_[1] for _ in connection.execute("PRAGMA table_info(documents)")]
+            if 'generation' not in columns:
+                connection.execute("ALTER TABLE documents ADD COLUMN generation INTEGER NOT NULL DEFAULT 0")
+            connection.execute("""CREATE TABLE IF NOT EXISTS states (
+                                    id TEXT PRIMARY KEY,
+                                    record TEXT NOT NULL)""")
+
+    def _connection(self) -> sqlite3.Connection:
+        ''' Returns the connection of the current thread. '''
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path_to_db, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get_indexes(self) -> Iterable[str]:
+        return self.index_names
+
+    def get_index_data(self, index: str) -> Dict[str, IndexElement]:
+        rows = self._connection().execute("SELECT id, path, name, version, generation FROM documents "
+                                          "WHERE idx = ? ORDER BY rowid", (index,))
+        return {_id: IndexElement(id=_id, path=path, name=name, version=version, generation=generation)
+                for _id, path, name, version, generation in rows}
+
+    def get_element(self, index: str, file_id: str) -> Optional[IndexElement]:
+        row = self._connection().execute("SELECT id, path, name, version, generation FROM documents "
+                                         "WHERE idx = ? AND id = ?", (index, file_id)).fetchone()
+        if row is None:
+            return None
+        return IndexElement(id=row[0], path=row[1], name=row[2], version=row[3], generation=row[4])
+
+    def read(self, index: str, file_id: str) -> Optional[str]:
+        row = self._connection().execute("SELECT content FROM documents WHERE idx = ? AND id = ?",
+                                         (index, file_id)).fetchone()
+        return None if row is None else self.compression.decode(row[0])
+
+    def write(self, index: str, element: IndexElement, content: str) -> None:
+        self.write_many([(index, element, content)])
+
+    def write_many(self, items: List[Tuple[str, IndexElement, str]]) -> None:
+        ''' Writes all files in one transaction. '''
+        with self._connection() as connection:
+            generation = time.time_ns()
+            connection.executemany("""INSERT INTO documents (idx, id, name, path, content, generation)
+                                      VALUES (?, ?, ?, ?, ?, ?)
+                                      ON CONFLICT (idx, id) DO UPDATE SET
+                                      name = excluded.name, path = excluded.path, content = excluded.content,
+                                      version = documents.version + 1""",
+                                   [(index, element.id, element.name, element.path, self._encode(index, content),
+                                     generation) for index, element, content in items])
+
+    def _encode(self, index: str, content: str) -> Union[str, bytes]:
+        ''' Compresses the content, uncompressed files are kept as text. '''
+        if self.compression.get_codec(index) == 'none':
+            return content
+        return self.compression.encode(index, content)
+
+    def delete(self, index: str, file_id: str) -> bool:
+        with self._connection() as connection:
+            connection.execute("DELETE FROM documents WHERE idx = ? AND id = ?", (index, file_id))
+        return True
+
+    def get_states(self) -> Dict[str, Dict]:
+        rows = self._connection().execute("SELECT id, record FROM states ORDER BY rowid")
+        return {_id: json.loads(record) for _id, record in rows}
+
+    def put_state(self, record: Dict) -> None:
+        with self._connection() as connection:
+            connection.execute("INSERT OR REPLACE INTO states (id, record) VALUES (?, ?)",
+                               (record['id'], json.dumps(record)))
+
+    def delete_state(self, file_id: str) -> None:
+        with self._connection() as connection:
+            connection.execute("DELETE FROM states WHERE id = ?", (file_id,))
+
+
+def _fsync_folder(folder: str) -> None:
+    ''' Syncs the entries of a folder, so replaced files survive a crash. '''
+    try:
+        fd = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def copy_backend(source: StorageBackend, target: StorageBackend) -> int:
+    ''' Copies all indexed files from one backend to another and returns the number of copied files. '''
+    copied = 0
+    for index in source.get_indexes():
+        for element in list(source.get_index_data(index).values()):
+            try:
+                content = source.read(index, element.id)
+            except OSError:
+                continue
+            if content is not None:
+                target.write(index, element, content)
+                copied += 1
+    for record in source.get_states().values():
+        target.put_state(record)
+    target.save()
+    return copied
+
+
+def create_backend(name: str = DATABASE_BACKEND) -> StorageBackend:
+    ''' Creates the storage backend that is configured in the config. '''
+    compression = Compression(database_compression, PATH_TO_DICTIONARIES)
+    if name == 'sqlite':
+        return SQLiteBackend(PATH_TO_SQLITE, indexs.keys(), compression)
+    return FileBackend({idx: os.path.join(PATH_TO_APP, path) for idx, path in indexs.items()},
+                       os.path.join(PATH_TO_APP, states_index), compression)
+
+
+if __name__ == '__main__':
+    # Migrates the json files into the SQLite database.
+    print(f"Copied {copy_backend(create_backend('file'), create_backend('sqlite'))} files.")
@@ -0,0 +1,76 @@
+from __future__ import annotations
+import hashlib
+import os
+import uuid
+from typing import Iterator
+from app.config import PATH_TO_BLOBS
+
+
+class BlobStore:
+    ''' Stores binary files (pdfs, images) content addressed by their SHA-256 hash.
+
+    Identical files are stored only once. The files are written to a temporary file first
+    and moved into place, so a reference always points to a complete file.
+    '''
+
+    def __init__(self, folder: str):
+        self.folder: str = folder
+
+    def path(self, ref: str) -> str:
+        ''' Returns the path to the blob. '''
+        return os.path.join(self.folder, ref[:2], ref)
+
+    def exists(self, ref: str) -> bool:
+        return os.path.isfile(self.path(ref))
+
+    def put(self, data: bytes) -> str:
+        ''' Stores the data if it is not stored yet and returns its reference. '''
+        ref: str = hashlib.sha256(data).hexdigest()
+        path_to_blob: str = self.path(ref)
+        if not os.path.isfile(path_to_blob):
+            os.makedirs(os.path.dirname(path_to_blob), exist_ok=True)
+            tmp_path = f"{path_to_blob}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, 'wb') as blob:
+                blob.write(data)
+            os.replace(tmp_path, path_to_blob)
+        return ref
+
+    def get(self, ref: str) -> bytes:
+        ''' Returns the data of a blob. '''
+        with open(self.path(ref), 'rb') as blob:
+            return blob.read()
+
+    def delete(self, ref: str) -> int:
+        ''' Deletes a blob and returns the number of freed bytes. '''
+        path_to_blob: str = self.path(ref)
+        if not os.path.isfile(path_to_blob):
+            return 0
+        size = os.path.getsize(path_to_blob)
+        os.remove(path_to_blob)
+        return size
+
+    def refs(self) -> Iterator[str]:
+        ''' Iterates over the references of all stored blobs. '''
+        if not os.path.isdir(self.folder):
+            return
+        for prefix in os.listdir(self.folder):
+            folder = os.path.join(self.folder, prefix)
+            if os.path.isdir(folder):
+                for name in os.listdir(folder):
+                    if not name.endswith(".tmp"):
+                        yield name
+
+
+blob_store = BlobStore(PATH_TO_BLOBS)
+
+
+if __name__ == '__main__':
+    # Moves the base64 files of the stored documents into the blob store.
+    from app.database.database import db
+    from app.internal.internal_datamodels import Document
+    for index in ['upload', 'extract', 'annotate']:
+        for element in list(db.get_all_index_data(index)):
+            file = db.get_file(index, element.id)
+            if file is not None:
+                db.update_file(Document(**file), index)
+    db.flush()
@@ -0,0 +1,77 @@
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class DocumentCache:
+    ''' A LRU cache for serialized documents that is bounded by the size of its entries.
+
+    Every entry is stored with the version of the document it was read at. A lookup with
+    another version (the database stamps every write) is a miss and drops the stale entry.
+    The cache keeps the serialized documents, so every caller decodes its own copy. Other
+    immutable entries can be cached with a sizeof function that returns their size.
+    '''
+
+    def __init__(self, max_size: int, sizeof: Callable[[Any], int] = len):
+        self.max_size: int = max_size
+        self.sizeof: Callable[[Any], int] = sizeof
+        self.size: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self._entries: OrderedDict[Tuple[str, str], Tuple[Any, Any, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, index: str, file_id: str, version: Any) -> Optional[Any]:
+        ''' Returns the cached document if it was cached at the given version. '''
+        key = (index, file_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, index: str, file_id: str, version: Any, content: Any) -> None:
+        ''' Adds a document and evicts the least recently used documents if the cache is full. '''
+        size = self.sizeof(content)
+        if size > self.max_size:
+            return
+        key = (index, file_id)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (version, content, size)
+            self.size += size
+            while self.size > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def discard(self, index: str, file_id: str) -> None:
+        ''' Removes a document from the cache. '''
+        with self._lock:
+            if (index, file_id) in self._entries:
+                self._remove((index, file_id))
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        _, _, size = self._entries.pop(key)
+        self.size -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def statistics(self) -> Dict[str, int]:
+        ''' Returns the counters of the cache. '''
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'size': self.size,
+                'max_size': self.max_size}
@@ -0,0 +1,166 @@
+from __future__ import annotations
+import os
+import re
+import time
+from typing import Dict, Iterable, List, Set, Tuple
+from pydantic import BaseModel, Field
+from app.database.serialization import loads
+
+BLOB_REF = re.compile(r'"blob_ref": ?"([0-9a-f]{64})"')
+_REF = re.compile(r'[0-9a-f]{64}')
+
+
+class CleanupReport(BaseModel):
+    ''' What a garbage collection removed (or would remove in a dry run). '''
+    orphaned_files: List[str] = Field(default=[])
+    dangling_entries: List[Tuple[str, str]] = Field(default=[])
+    blobs: List[str] = Field(default=[])
+    tmp_files: List[str] = Field(default=[])
+    freed_bytes: int = Field(default=0)
+    dry_run: bool = Field(default=False)
+    # Why a part of the collection was skipped, e.g. documents that could not be read.
+    errors: List[str] = Field(default=[])
+
+    def merge(self, other: CleanupReport) -> CleanupReport:
+        self.orphaned_files += other.orphaned_files
+        self.dangling_entries += other.dangling_entries
+        self.blobs += other.blobs
+        self.tmp_files += other.tmp_files
+        self.freed_bytes += other.freed_bytes
+        self.errors += other.errors
+        return self
+
+
+def _remove(path: str, dry_run: bool) -> int:
+    ''' Deletes a file and returns the number of freed bytes. '''
+    try:
+        size = os.path.getsize(path)
+        if not dry_run:
+            os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+def _files(folder: str) -> Iterable[os.DirEntry]:
+    ''' Iterates over the files of a folder and its sub folders, hidden files (.gitkeep) are skipped. '''
+    if not os.path.isdir(folder):
+        return
+    for entry in os.scandir(folder):
+        if entry.name.startswith("."):
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            yield from _files(entry.path)
+        elif entry.is_file(follow_symlinks=False):
+            yield entry
+
+
+def collect_orphans(backend: 'FileBackend', folders: Dict[str, str], grace_period: float = 3600,
+                    dry_run: bool = False) -> CleanupReport:
+    ''' Reconciles the indexs with their folders.
+
+    Files in a folder that no index refers to (e.g. from aborted pipelines or interrupted writes)
+    are deleted, entries of an index whose file is missing are removed from the index. Files
+    younger than the grace period are kept, they may belong to a write that is not finished yet.
+    '''
+    report = CleanupReport(dry_run=dry_run)
+    deadline = time.time() - grace_period
+    referenced: Set[str] = set()
+    for index in backend.get_indexes():
+        for element in list(backend.get_index_data(index).values()):
+            path = os.path.abspath(element.path)
+            referenced.add(path)
+            if not os.path.isfile(path):
+                report.dangling_entries.append((index, element.id))
+                if not dry_run:
+                    backend.indexs[index].del_id(element.id)
+    for index, folder in folders.items():
+        for entry in _files(folder):
+            if os.path.abspath(entry.path) not in referenced and entry.stat().st_mtime < deadline:
+                report.orphaned_files.append(entry.path)
+                report.freed_bytes += _remove(entry.path, dry_run)
+    return report
+
+
+def blob_refs(content: str) -> Set[str]:
+    ''' Returns the blobs a serialized document or a stored version refers to.
+
+    A delta of a version can replace a reference on its own, e.g.
+    {"op": "replace", "path": "/images/1/blob_ref", "value": "<ref>"}, so the values of these
+    operations are references as well.
+    '''
+    refs = set(BLOB_REF.findall(content))
+    if '/blob_ref"' in content:
+        operations = loads(content)
+        if isinstance(operations, list):
+            for operation in operations:
+                if isinstance(operation, dict) and str(operation.get('path', '')).endswith('/blob_ref') and \
+                        isinstance(operation.get('value'), str) and _REF.fullmatch(operation['value']):
+                    refs.add(operation['value'])
+    return refs
+
+
+def collect_blobs(blob_store: 'BlobStore', contents: Iterable[str], grace_period: float = 3600,
+                  dry_run: bool = False) -> CleanupReport:
+    ''' Deletes the blobs that none of the serialized documents (contents) refers to.
+
+    If any document can not be read, its references are unknown, so no blob is deleted and the
+    error is reported.
+    '''
+    report = CleanupReport(dry_run=dry_run)
+    referenced: Set[str] = set()
+    try:
+        for content in contents:
+            referenced.update(blob_refs(content))
+    except Exception as error:
+        report.errors.append(f"No blobs were deleted, a document could not be read: {error!r}")
+        return report
+    deadline = time.time() - grace_period
+    for ref in list(blob_store.refs()):
+        path = blob_store.path(ref)
+        if ref not in referenced and os.path.getmtime(path) < deadline:
+            report.blobs.append(ref)
+            report.freed_bytes += _remove(path, dry_run)
+    return report
+
+
+def collect_tmp(folder: str, ttl: float, max_size: int, dry_run: bool = False,
+                keep: Iterable[str] = ()) -> CleanupReport:
+    ''' Deletes the temporary files that are older than the ttl and the oldest files above the size budget.
+
+    The files in keep (e.g. leased artifacts) are never deleted, but count towards the budget.
+    '''
+    report = CleanupReport(dry_run=dry_run)
+    now = time.time()
+    keep = {os.path.abspath(_) for _ in keep}
+    files: List[Tuple[float, int, str]] = []
+    for entry in _files(folder):
+        stat = entry.stat()
+        if os.path.abspath(entry.path) in keep:
+            max_size -= stat.st_size
+            continue
+        last_used = max(stat.st_atime, stat.st_mtime)
+        if now - last_used > ttl:
+            report.tmp_files.append(entry.path)
+            report.freed_bytes += _remove(entry.path, dry_run)
+        else:
+            files.append((last_used, stat.st_size, entry.path))
+    size = sum(_[1] for _ in files)
+    for _, file_size, path in sorted(files):
+        if size <= max_size:
+            break
+        report.tmp_files.append(path)
+        report.freed_bytes += _remove(path, dry_run)
+        size -= file_size
+    return report
+
+
+if __name__ == '__main__':
+    import sys
+    from app.database.database import db
+    report = db.collect_garbage(dry_run='--dry-run' in sys.argv)
+    print(f"{'Would free' if report.dry_run else 'Freed'} {report.freed_bytes} bytes: "
+          f"{len(report.orphaned_files)} orphaned files, {len(report.dangling_entries)} dangling index entries, "
+          f"{len(report.blobs)} blobs and {len(report.tmp_files)} temporary files.")
+    for error in report.errors:
+        print(error)
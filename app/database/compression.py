@@ -0,0 +1,124 @@
+from __future__ import annotations
+import gzip
+import os
+from typing import Dict, Iterable, List, Optional, Union
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+class Compression:
+    ''' Compresses the serialized documents per index.
+
+    The codec of an index is 'zstd' (with a trained dictionary if one exists), 'gzip' or 'none'.
+    Without the zstandard package 'zstd' falls back to 'gzip'. Reading detects the format by its
+    magic bytes, so indexs can hold compressed and uncompressed files at the same time.
+    '''
+
+    def __init__(self, codecs: Dict[str, str] = None, path_to_dictionaries: str = None, level: int = 3):
+        self.codecs: Dict[str, str] = codecs if codecs is not None else {}
+        self.path_to_dictionaries: str = path_to_dictionaries
+        self.level: int = level
+        self.dictionaries: Dict[str, 'zstandard.ZstdCompressionDict'] = {}
+        self._dictionaries_by_id: Dict[int, 'zstandard.ZstdCompressionDict'] = {}
+        self.load_dictionaries()
+
+    def load_dictionaries(self) -> None:
+        ''' Loads the trained dictionaries of all indexs.
+
+        Older dictionaries are kept to read the files that were compressed with them,
+        new files are compressed with the newest dictionary of the index.
+        '''
+        if zstandard is None or self.path_to_dictionaries is None or not os.path.isdir(self.path_to_dictionaries):
+            return
+        paths = [os.path.join(self.path_to_dictionaries, _) for _ in os.listdir(self.path_to_dictionaries)
+                 if _.endswith(".dict")]
+        for path_to_dictionary in sorted(paths, key=os.path.getmtime):
+            with open(path_to_dictionary, 'rb') as file:
+                index = os.path.basename(path_to_dictionary).rsplit("-", 1)[0]
+                self._add_dictionary(index, zstandard.ZstdCompressionDict(file.read()))
+
+    def _add_dictionary(self, index: str, dictionary: 'zstandard.ZstdCompressionDict') -> None:
+        self.dictionaries[index] = dictionary
+        self._dictionaries_by_id[dictionary.dict_id()] = dictionary
+
+    def get_codec(self, index: str) -> str:
+        codec = self.codecs.get(index, 'none')
+        if codec == 'zstd' and zstandard is None:
+            return 'gzip'
+        return codec
+
+    def encode(self, index: str, content: str) -> bytes:
+        ''' Compresses the content with the codec of the index. '''
+        data = content.encode('utf-8')
+        codec = self.get_codec(index)
+        if codec == 'zstd':
+            compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self.dictionaries.get(index))
+            return compressor.compress(data)
+        if codec == 'gzip':
+            return gzip.compress(data, compresslevel=6)
+        return data
+
+    def decode(self, data: Union[bytes, str]) -> str:
+        ''' Decompresses the data, independent of the codec it was written with. '''
+        if isinstance(data, str):
+            return data
+        if data[:4] == ZSTD_MAGIC:
+            if zstandard is None:
+                raise RuntimeError("The zstandard package is needed to read zstd compressed documents.")
+            dict_id = zstandard.get_frame_parameters(data).dict_id
+            if dict_id != 0 and dict_id not in self._dictionaries_by_id:
+                # The dictionary was trained by another process.
+                self.load_dictionaries()
+            decompressor = zstandard.ZstdDecompressor(dict_data=self._dictionaries_by_id.get(dict_id))
+            return decompressor.decompress(data).decode('utf-8')
+        if data[:2] == GZIP_MAGIC:
+            return gzip.decompress(data).decode('utf-8')
+        return data.decode('utf-8')
+
+    def train_dictionary(self, index: str, samples: Iterable[str], size: int = 112640) -> Optional[str]:
+        ''' Trains a zstd dictionary for an index from sample documents and stores it. '''
+        if zstandard is None or self.path_to_dictionaries is None:
+            return None
+        samples: List[bytes] = [_.encode('utf-8') for _ in samples]
+        if len(samples) < 8:
+            return None
+        dictionary = zstandard.train_dictionary(size, samples, level=self.level)
+        os.makedirs(self.path_to_dictionaries, exist_ok=True)
+        path_to_dictionary = os.path.join(self.path_to_dictionaries, f"{index}-{dictionary.dict_id()}.dict")
+        with open(path_to_dictionary, 'wb') as file:
+            file.write(dictionary.as_bytes())
+        self._add_dictionary(index, dictionary)
+        return path_to_dictionary
+
+
+def migrate(backend: 'StorageBackend', compression: Compression, indexes: Iterable[str] = None,
+            train: bool = True, max_samples: int = 1000) -> int:
+    ''' Rewrites the files of the indexs with their configured codec and returns the number of rewritten files. '''
+    rewritten = 0
+    for index in indexes if indexes is not None else compression.codecs:
+        if not backend.has_index(index):
+            continue
+        elements = list(backend.get_index_data(index).values())
+        if train and compression.get_codec(index) == 'zstd':
+            samples = [backend.read(index, _.id) for _ in elements[:max_samples]]
+            compression.train_dictionary(index, [_ for _ in samples if _ is not None])
+        for element in elements:
+            content = backend.read(index, element.id)
+            if content is not None:
+                backend.write(index, element, content)
+                rewritten += 1
+    backend.save()
+    return rewritten
+
+
+if __name__ == '__main__':
+    # Compresses the already stored files of the indexs that have a codec in the config.
+    from app.database.backends import create_backend
+    backend = create_backend()
+    print(f"Compressed {migrate(backend, backend.compression)} files.")
@@ -1,185 +1,441 @@
 from __future__ import annotations
+import atexit
 import os
-from typing import Dict, Union
-import json
-from json.decoder import JSONDecodeError
-from app.config import database_folders, indexs, PATH_TO_APP
-from app.internal.internal_datamodels import Document, QuestionTemplate, QuestionTemplateList
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterator, Optional, Set, Tuple, Union
+from app.config import DOCUMENT_CACHE_SIZE, TEXT_VIEW_CACHE_SIZE, PATH_TO_METADATA_INDEX, PATH_TO_FULLTEXT_INDEX, PATH_TO_HISTORY, \
+    DATABASE_PATHS, GC_GRACE_PERIOD, versioned_indexes
+from app.database.backends import FileBackend, StorageBackend, create_backend
+from app.database.blobs import blob_store
+from app.database.cleanup import CleanupReport, collect_blobs, collect_orphans
+from app.database.cache import DocumentCache
+from app.database.fulltext import FullTextIndex
+from app.database.history import VersionHistory
+from app.database.index import Index, IndexElement
+from app.database.metadata import MetadataIndex
+from app.database.projection import load_fields
+from app.database.serialization import loads
+from app.database.writer import WriteBehindWriter
+from app.internal.artifacts import artifacts
+from app.internal.construct import construct
+from app.internal.internal_datamodels import Document, QuestionTemplate, QuestionTemplateList, Text
+from app.internal.textview import TextView
 from typing import List
-from functools import lru_cache
-from pydantic import BaseModel, Field
-
-class IndexElement(BaseModel):
-    id: str
-    path: str
-    name: str
-
-
-class Index:
-
-    def __init__(self, file_path):
-        self.file_path: str = file_path
-        self.data: Dict[str, IndexElement] = self._create_index(file_path)
-
-
-    def _create_index(self, path_to_index: str):
-        ''' Creates a search index for the files already in the database. '''
-        file_exists: bool = os.path.isfile(path_to_index)
-
-        if not file_exists:
-            os.makedirs(os.path.dirname(path_to_index), exist_ok=True)
-            return {}
-        with open(path_to_index, 'r', encoding='utf-8') as index_file:
-            try:
-                index = {}
-                zwerg = [IndexElement(**_) for _ in json.load(index_file)]
-                for element in zwerg:
-                    index[element.id] = element
-            except JSONDecodeError:
-                index = {}
-
-        return index
-
-    def save_index(self):
-        ''' Savs the index. '''
-        with open(self.file_path, 'w', encoding='utf-8') as index_file:
-            json.dump([_.dict() for _ in self.data.values()], index_file)
-
-    def update_index(self, id: str, path_to_file: str, name: str = '') -> bool:
-        ''' Updates the index if possible and returns true '''
-        try:
-            if name == '':
-                name: str = self.data[id].name
-            self.data[id] = IndexElement(id=id,
-                                         name=name,
-                                         path=path_to_file)
-            return True
-        except KeyError:
-            return False
-
-    def add_id(self, id: str, path_to_file: str, name: str) -> bool:
-        return self.update_index(id, path_to_file, name)
-
-    def del_id(self, id: str) -> bool:
-        ''' Deletes an id from the index if avaiable. '''
-        if id in self.data:
-            file_path = self.data[id].path
-            del self.data[id]
-            try:
-                os.remove(file_path)
-            except:
-                return False
-            return True
-        return True
-        
-class DataBase:
-
 
-    _indexs: Dict[str, Index] = {idx: Index(os.path.join(PATH_TO_APP, path)) for idx, path in indexs.items()}
 
-
-    def get_file(self, index: str, file_id: str, cached: bool = True) -> Dict:
-        """ Method to get a file. """
-        if cached:
-            return self._get_cached_file(index, file_id)
-        else:
-            return self._get_file(index, file_id)
+# The pipeline state a document reaches when it is stored in an index, in the order of the pipeline.
+STAGES: Dict[str, str] = {'upload': 'uploaded',
+                          'extract': 'extracted',
+                          'annotate': 'annotated',
+                          'analyse': 'analysed'}
 
 
+class DataBase:
 
-    @lru_cache()
-    def _get_cached_file(self, index: str, file_id: str) -> Dict:
-        """ If cached data is available use the cached fil.e"""
-        return self._get_file(index, file_id)
 
-    def _get_file(self, index: str, file_id: str) -> Dict:
-        ''' Loads and returns the document if found else it returns false. '''
-        _index = self._indexs[index]
-        if file_id in _index.data:
-            path_to_file: str = _index.data[file_id].path
-            with open(path_to_file, "r") as file:
-                data = json.load(file)
-            return data
+    _backend: StorageBackend = create_backend()
+    _cache: DocumentCache = DocumentCache(DOCUMENT_CACHE_SIZE)
+    _views: DocumentCache = DocumentCache(TEXT_VIEW_CACHE_SIZE, sizeof=TextView.size)
+    _writer: WriteBehindWriter = WriteBehindWriter(_backend)
+    _metadata: MetadataIndex = MetadataIndex(PATH_TO_METADATA_INDEX)
+    _fulltext: FullTextIndex = FullTextIndex(PATH_TO_FULLTEXT_INDEX)
+    _history: VersionHistory = VersionHistory(PATH_TO_HISTORY)
+
+    def __init__(self, backend: StorageBackend = None, cache: DocumentCache = None, metadata: MetadataIndex = None,
+                 fulltext: FullTextIndex = None, history: VersionHistory = None):
+        if backend is not None:
+            self._backend = backend
+            self._cache = DocumentCache(DOCUMENT_CACHE_SIZE)
+            self._views = DocumentCache(TEXT_VIEW_CACHE_SIZE, sizeof=TextView.size)
+            self._writer = WriteBehindWriter(backend)
+            # The history belongs to the documents, so it is kept next to them.
+            self._history = VersionHistory(os.path.join(backend.folder, os.path.basename(PATH_TO_HISTORY)))
+        if cache is not None:
+            self._cache = cache
+        if metadata is not None:
+            self._metadata = metadata
+        if fulltext is not None:
+            self._fulltext = fulltext
+        if history is not None:
+            self._history = history
+
+
+    def get_file(self, index: str, file_id: str, cached: bool = True, fields: List[str] = None) -> Dict:
+        """ Method to get a file. If fields are given only these top-level fields are decoded. """
+        content = self._read(index, file_id, cached)
+        if content is not None:
+            if fields is not None:
+                return load_fields(content, fields)
+            return loads(content)
         return None
 
-
-
-    def get_all_files(self, index: str, cached: bool = True) -> List[Document]:
-        """ Returns all files from a given index. """
+    def get_document(self, index: str, file_id: str) -> Optional[Document]:
+        """ Returns a stored document as model.
+
+        The stored documents were validated when they were added, so the model is built
+        without validating it again and the words are kept in a columnar token store.
+        """
+        file = self.get_file(index, file_id)
+        if file is None:
+            return None
+        return Document.load_columnar(file, validate=False)
+
+    def get_text_view(self, index: str, file_id: str) -> Optional[TextView]:
+        """ Returns the full text and the offset map of the text of a document.
+
+        The view is cached for the version of the document, so it is only built again after the
+        document changed. While a write of the document is pending the view is not cached.
+        """
+        element = self._backend.get_element(index, file_id)
+        if element is None:
+            return None
+        pending = self._writer.get_pending(index, file_id) is not None
+        view = None if pending else self._views.get(index, file_id, element.stamp)
+        if view is None:
+            file = self.get_file(index, file_id, fields=['text'])
+            if file is None:
+                return None
+            text = construct(Text, file['text']) if file.get('text') is not None else Text()
+            view = text.get_view()
+            if not pending:
+                self._views.put(index, file_id, element.stamp, view)
+        return view
+
+    def _read(self, index: str, file_id: str, cached: bool = True) -> Optional[str]:
+        ''' Returns the serialized file, from the cache if it is still up to date. '''
+        element = self._backend.get_element(index, file_id)
+        if element is None:
+            return None
+        content = self._writer.get_pending(index, file_id)
+        if content is not None:
+            return content
         if cached:
-            return self._get_cached_all_files(index)
-        else:
-            return self._get_all_files(index)
-
-    @lru_cache()
-    def _get_cached_all_files(self, index: str) -> List[Document]:
-        return self._get_all_files(index)
-
-    def _get_all_files(self, index: str) -> List[Document]:
+            content = self._cache.get(index, file_id, element.stamp)
+            if content is not None:
+                return content
+        content = self._backend.read(index, file_id)
+        if content is not None:
+            self._cache.put(index, file_id, element.stamp, content)
+        return content
+
+    def get_all_files(self, index: str, cached: bool = True) -> List[Dict]:
         """ Returns all files from a given index. """
+        if not cached:
+            return list(self.iter_files(index))
         res = []
-        _index = self._indexs[index]
-        for path_to_file in _index.data.values():
-            with open(path_to_file, "r") as file:
-                res.append(json.load(file))
+        for file_id in list(self._backend.get_index_data(index)):
+            file = self.get_file(index, file_id)
+            if file is not None:
+                res.append(file)
         return res
 
+    def iter_files(self, index: str, batch_size: int = 32, fields: List[str] = None,
+                   workers: int = 4) -> Iterator[Dict]:
+        """ Iterates over all files of an index.
+
+        The files are read in batches by a thread pool, while the next batch is read the
+        current one is decoded. At most two batches are in memory and the document cache is bypassed.
+        """
+        file_ids = list(self._backend.get_index_data(index))
+        batches = [file_ids[num:num + batch_size] for num in range(0, len(file_ids), batch_size)]
+        if len(batches) == 0:
+            return
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = [pool.submit(self._read_uncached, index, file_id) for file_id in batches[0]]
+            for num in range(len(batches)):
+                contents = [_.result() for _ in pending]
+                if num + 1 < len(batches):
+                    pending = [pool.submit(self._read_uncached, index, file_id) for file_id in batches[num + 1]]
+                for content in contents:
+                    if content is not None:
+                        yield loads(content) if fields is None else load_fields(content, fields)
+
+    def _read_uncached(self, index: str, file_id: str) -> Optional[str]:
+        ''' Returns the serialized file without touching the document cache. '''
+        content = self._writer.get_pending(index, file_id)
+        if content is not None:
+            return content
+        return self._backend.read(index, file_id)
+
+    def get_cache_statistics(self) -> Dict[str, int]:
+        """ Returns the hit, miss and eviction counters of the document cache. """
+        return self._cache.statistics()
+
     def add_file(self, file: Union[Document, QuestionTemplate, 'TripleTemplate'], file_type, overwrite=False):
         ''' Adds a new file to the db. '''
-        if file_type in self._indexs:
-            index = self._indexs[file_type]
-            if file.id in index.data and not overwrite:
+        if self._backend.has_index(file_type):
+            if self._backend.get_element(file_type, file.id) is not None and not overwrite:
                 return False
             else:
-                index.add_id(file.id, file.file_path, file.file_name)
-                with open(file.file_path, 'w') as f:
-                    f.write(file.to_json())
+                if isinstance(file, Document):
+                    file.store_files()
+                content = file.to_json()
+                self._record_version(file_type, file.id, content)
+                self._writer.discard(file_type, file.id)
+                self._views.discard(file_type, file.id)
+                element = IndexElement(id=file.id, path=file.file_path, name=file.file_name)
+                self._backend.write(file_type, element, content)
+                self._update_metadata(file, file_type)
+                self._update_fulltext(file, file_type, content)
                 return True
         else:
             return False
 
-    def update_file(self, file: Union[Document, QuestionTemplate, 'TripleTemplate']):
-        ''' Updates the files. '''
-        file_path = file.file_path
-        with open(file_path, "w") as f:
-            json.dump(file.dict(), f)
-        
+    def update_file(self, file: Union[Document, QuestionTemplate, 'TripleTemplate'], file_type: str = None):
+        ''' Updates the files. The file is written in the background, reads see the update immediately. '''
+        if file_type is None:
+            file_type = self._backend.find_index(file.id, file.file_path)
+        if file_type is None:
+            return False
+        element = self._backend.get_element(file_type, file.id)
+        if element is None:
+            return False
+        if isinstance(file, Document):
+            file.store_files()
+        content = file.to_json()
+        self._record_version(file_type, file.id, content)
+        self._writer.submit(file_type, element, content)
+        self._update_metadata(file, file_type)
+        self._update_fulltext(file, file_type, content)
+        return True
+
+    def _record_version(self, file_type: str, file_id: str, content: str) -> None:
+        if file_type not in versioned_indexes:
+            return
+        # The state before the first recorded change becomes version 0, later changes are diffed against the history.
+        old = None if self._history.has_versions(file_type, file_id) else self._read_uncached(file_type, file_id)
+        # The version is recorded in the background, not while the request waits.
+        self._history.submit(file_type, file_id, old, content)
+
+    def get_versions(self, index: str, file_id: str) -> List[Dict]:
+        """ Returns the stored versions (number, kind, size and creation time) of a document. """
+        self._history.flush()
+        return self._history.get_versions(index, file_id)
+
+    def get_version(self, index: str, file_id: str, version: int) -> Optional[Dict]:
+        """ Returns a previous version of a document. """
+        self._history.flush()
+        return self._history.get(index, file_id, version)
+
+    def diff_versions(self, index: str, file_id: str, version_a: int, version_b: int) -> Optional[List[Dict]]:
+        """ Returns the changes between two versions of a document as JSON Patch. """
+        self._history.flush()
+        return self._history.diff(index, file_id, version_a, version_b)
+
+    def restore_version(self, index: str, file_id: str, version: int) -> bool:
+        """ Makes a previous version the current version of a document, the restore is a new version itself. """
+        self._history.flush()
+        document = self._history.get(index, file_id, version)
+        if document is None or not self._backend.has_index(index) or self._backend.get_element(index, file_id) is None:
+            return False
+        return self.update_file(Document(**document), index)
+
+    def _update_metadata(self, file, file_type: str) -> None:
+        if file_type == 'annotate' and isinstance(file, Document):
+            self._metadata.put(file.id, file.metadata.dict() if file.metadata is not None else None)
+
+    def _update_fulltext(self, file, file_type: str, content: str) -> None:
+        # The annotated document replaces the extracted one, it has the same text plus the labels.
+        if not isinstance(file, Document) or file_type not in ['extract', 'annotate']:
+            return
+        if file_type == 'extract' and self._backend.has_index('annotate') and \
+                self._backend.get_element('annotate', file.id) is not None:
+            return
+
+        def load():
+            data = load_fields(content, ['text', 'knowledgeObjects'])
+            return data.get('text'), data.get('knowledgeObjects') or []
+        # The changed units are indexed in the background, not while the request waits.
+        self._fulltext.submit(file.id, load)
+
+    def search(self, query: str, level: str = 'sentence', limit: int = 20) -> List[Dict]:
+        """ Searches the text and the knowledge object labels of all documents.
+
+        Quoted phrases have to occur, the other words rank the hits with BM25. The level
+        ('document', 'chapter', 'paragraph' or 'sentence') is the granularity of the hits.
+        """
+        self._fulltext.flush()
+        return self._fulltext.search(query, level, limit)
+
+    def rebuild_fulltext_index(self) -> None:
+        """ Adds the extracted and annotated documents to the full-text index. """
+        for index in ['extract', 'annotate']:
+            if not self._backend.has_index(index):
+                continue
+            for file in self.iter_files(index, fields=['id', 'text', 'knowledgeObjects']):
+                if index == 'extract' and self._backend.has_index('annotate') and \
+                        self._backend.get_element('annotate', file['id']) is not None:
+                    continue
+                self._fulltext.index_document(file['id'], file.get('text'), file.get('knowledgeObjects') or [])
+
+    def find_documents(self, doi: str = None, issn: str = None, title: str = None, author: str = None,
+                       journal: str = None) -> List[Dict]:
+        """ Returns the metadata of the annotated documents that match all given criteria.
+
+        DOI and ISSN have to match exactly, for title, author and journal every word of the
+        query has to be the prefix of a word, e.g. find_documents(author="schm", title="friction").
+        """
+        if self._backend.has_index('annotate') and len(self._metadata) < len(self._backend.get_index_data('annotate')):
+            self.rebuild_metadata_index()
+        ids = self._metadata.find(doi=doi, issn=issn, title=title, author=author, journal=journal)
+        return [_ for _ in map(self._metadata.get, ids) if _ is not None]
+
+    def rebuild_metadata_index(self) -> None:
+        """ Adds the annotated documents that are missing in the metadata index, e.g. those stored before it existed. """
+        for file in self.iter_files('annotate', fields=['id', 'metadata']):
+            if self._metadata.get(file['id']) is None:
+                self._metadata.put(file['id'], file.get('metadata'))
+
+    def flush(self, timeout: float = None) -> bool:
+        ''' Waits until all updated files are written, indexed and their versions are recorded. '''
+        written = self._writer.flush(timeout)
+        return self._fulltext.flush(timeout) and self._history.flush(timeout) and written
+
     def del_file(self, file, file_type: str):
         ''' Deletes the file and reload the indexs. '''
-
-        if file_type == 'all':
-            res = []
-            for idx in self._indexs.keys():
-                result = self._indexs[idx].del_id(file.id)
-                res.append(result)
-            return any(res)
-        else:
-            if file_type in self._indexs:
-                index = self._indexs[file_type]
-                return index.del_id(file.id)
+        return self.del_file_by_id(file.id, file_type)
 
     def del_file_by_id(self, _id: str, file_type: str):
         ''' Deletes the file by id and reload the indexs. '''
 
         if file_type == 'all':
             res = []
-            for idx in self._indexs.keys():
-                result = self._indexs[idx].del_id(_id)
+            for idx in self._backend.get_indexes():
+                self._writer.discard(idx, _id)
+                self._cache.discard(idx, _id)
+                self._views.discard(idx, _id)
+                result = self._backend.delete(idx, _id)
                 res.append(result)
+            self._backend.delete_state(_id)
+            self._metadata.delete(_id)
+            self._fulltext.discard(_id)
+            self._fulltext.delete_document(_id)
+            for idx in versioned_indexes:
+                self._history.delete(idx, _id)
             return any(res)
         else:
-            if file_type in self._indexs:
-                index = self._indexs[file_type]
-                return index.del_id(_id)
+            if self._backend.has_index(file_type):
+                self._writer.discard(file_type, _id)
+                self._cache.discard(file_type, _id)
+                self._views.discard(file_type, _id)
+                result = self._backend.delete(file_type, _id)
+                self._history.delete(file_type, _id)
+                if file_type == 'annotate':
+                    self._metadata.delete(_id)
+                if file_type in ['extract', 'annotate']:
+                    self._fulltext.discard(_id)
+                    self._fulltext.delete_document(_id)
+                    file = self.get_file('extract', _id, fields=['text', 'knowledgeObjects']) \
+                        if file_type == 'annotate' and self._backend.has_index('extract') else None
+                    if file is not None:
+                        self._fulltext.index_document(_id, file.get('text'), file.get('knowledgeObjects') or [])
+                if file_type in STAGES:
+                    self._update_state_from_indexes(_id)
+                return result
 
     def save_indexes(self):
         ''' Save all indexes. '''
-        for idx in self._indexs.values():
-            idx.save_index()
+        self._backend.save()
+        self._metadata.save()
+
+    def set_state(self, file_id: str, state: str, name: str = '', error: str = '') -> None:
+        """ Updates the pipeline state of a document and the time it reached the state. """
+        record = self._backend.get_states().get(file_id)
+        record = {'id': file_id, 'name': '', 'state': state, 'timestamps': {}} if record is None else dict(record)
+        now = datetime.now().isoformat(timespec='seconds')
+        record['name'] = name if name != '' else record['name']
+        record['state'] = state
+        record['timestamps'] = dict(record['timestamps'], **{state: now})
+        record['error'] = error
+        record['updated'] = now
+        self._backend.put_state(record)
+
+    def set_error(self, file_id: str, error: str) -> None:
+        """ Records the last error of a document without changing its state. """
+        record = self._backend.get_states().get(file_id)
+        if record is None:
+            return
+        record = dict(record, error=error, updated=datetime.now().isoformat(timespec='seconds'))
+        self._backend.put_state(record)
+
+    def get_states(self, states: List[str] = None) -> List[Dict]:
+        """ Returns the pipeline states of all documents, optionally only those in the given states. """
+        records = self._backend.get_states()
+        if self._backend.has_index('upload') and len(records) < len(self._backend.get_index_data('upload')):
+            records = self.rebuild_states()
+        return [_ for _ in records.values() if states is None or _['state'] in states]
+
+    def rebuild_states(self) -> Dict[str, Dict]:
+        """ Derives the missing pipeline states from the indexs, e.g. for documents stored before states existed. """
+        records = self._backend.get_states()
+        for element in list(self._backend.get_index_data('upload').values()):
+            if element.id not in records:
+                self._update_state_from_indexes(element.id, element.name)
+        return self._backend.get_states()
+
+    def _update_state_from_indexes(self, file_id: str, name: str = '') -> None:
+        """ Sets the state of a document to the last stage whose index contains it. """
+        state = None
+        for index, stage in STAGES.items():
+            if self._backend.has_index(index) and self._backend.get_element(index, file_id) is not None:
+                state = stage
+        if state is None:
+            self._backend.delete_state(file_id)
+        else:
+            self.set_state(file_id, state, name)
+
+    def collect_garbage(self, dry_run: bool = False, grace_period: float = GC_GRACE_PERIOD) -> CleanupReport:
+        """ Deletes orphaned database files, unreferenced blobs and expired temporary files.
+
+        Returns what was deleted and the freed bytes. With dry_run nothing is deleted.
+        """
+        self.flush()
+        report = CleanupReport(dry_run=dry_run)
+        if isinstance(self._backend, FileBackend):
+            folders = {idx: DATABASE_PATHS[idx] for idx in self._backend.get_indexes() if idx in DATABASE_PATHS}
+            orphans = collect_orphans(self._backend, folders, grace_period, dry_run)
+            if not dry_run:
+                # The entries are gone, the state, metadata, full text and history of the files go as well.
+                for index, file_id in orphans.dangling_entries:
+                    self.del_file_by_id(file_id, index)
+            report.merge(orphans)
+        # In a dry run the dangling entries are still there, their files are gone and refer to nothing.
+        skip = set(report.dangling_entries)
+        report.merge(collect_blobs(blob_store, self._iter_contents(skip), grace_period, dry_run))
+        report.merge(self.collect_tmp(dry_run))
+        return report
+
+    def _iter_contents(self, skip: Set[Tuple[str, str]] = frozenset()) -> Iterator[str]:
+        """ Iterates over the serialized files of all indexs and the stored versions.
+
+        Raises if a file can not be read, only files that were deleted meanwhile and the
+        (index, id) in skip are skipped.
+        """
+        for idx in list(self._backend.get_indexes()):
+            for element in list(self._backend.get_index_data(idx).values()):
+                if (idx, element.id) in skip:
+                    continue
+                try:
+                    content = self._read_uncached(idx, element.id)
+                except FileNotFoundError:
+                    if self._backend.get_element(idx, element.id) is None:
+                        continue
+                    raise
+                if content is not None:
+                    yield content
+        yield from self._history.iter_data()
+
+    def collect_tmp(self, dry_run: bool = False) -> CleanupReport:
+        """ Deletes the temporary files that expired or exceed the size budget, leased files are kept. """
+        return artifacts.sweep(dry_run)
 
     def get_all_index_data(self, index: str) -> List[IndexElement]:
         """ Returns a list of all indexed files from a index. """
-        if index in self._indexs:
-            return self._indexs[index].data.values()
+        if self._backend.has_index(index):
+            return self._backend.get_index_data(index).values()
 
-db = DataBase()
\ No newline at end of file
+db = DataBase()
+# Writes, versions and full-text updates run in daemon threads, scripts that end without the
+# shutdown of the server would lose the ones that are still pending.
+atexit.register(db.flush)
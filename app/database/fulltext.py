@@ -0,0 +1,323 @@
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from app.database.metadata import normalize
+
+logger = logging.getLogger(__name__)
+
+# Words that are too frequent to help the ranking, they are skipped in queries outside of phrases.
+STOP_WORDS = {'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is', 'it', 'of', 'on',
+              'or', 'that', 'the', 'to', 'was', 'were', 'which', 'with'}
+LEVELS = ['document', 'chapter', 'paragraph', 'sentence']
+_PHRASE = re.compile(r'"([^"]*)"')
+
+
+def _hash(value) -> str:
+    return hashlib.sha1(json.dumps(value, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def tokenize_sentence(sentence: Dict) -> Tuple[Dict[str, List[int]], int]:
+    ''' Returns the positions of every term of a sentence and the number of positions.
+
+    Annotated sentences are indexed by their words, the normalized form of a word is indexed at
+    the same position as the word itself. Sentences without words are indexed by their text.
+    '''
+    positions: Dict[str, List[int]] = defaultdict(list)
+    pos = 0
+    words = sentence.get('words') or []
+    if len(words) == 0:
+        words = [{'text': sentence.get('text', '')}]
+    for word in words:
+        tokens = normalize(word.get('text', '')).split()
+        for num, token in enumerate(tokens):
+            positions[token].append(pos + num)
+        for num, token in enumerate(normalize(word.get('normalized_text', '')).split()):
+            if token not in tokens and pos + num not in positions[token]:
+                positions[token].append(pos + num)
+        pos += len(tokens)
+    return positions, pos
+
+
+class FullTextIndex:
+    ''' An inverted index with positional postings over the sentences and the knowledge object labels.
+
+    Every sentence and every knowledge object is a unit that is ranked with BM25. The postings are
+    kept in an SQLite database (WAL mode), so all workers share the index. An update of a document
+    replaces the units that changed in one transaction.
+    '''
+
+    def __init__(self, path_to_db: str, k1: float = 1.2, b: float = 0.75):
+        self.path_to_db: str = path_to_db
+        self.k1: float = k1
+        self.b: float = b
+        self._local = threading.local()
+        # Documents waiting to be indexed in the background and the one that is indexed now.
+        self._pending: Dict[str, Callable[[], Tuple[Optional[Dict], List[Dict]]]] = {}
+        self._indexing: Optional[str] = None
+        self._condition = threading.Condition()
+        self._thread: threading.Thread = None
+
+    def _connection(self) -> sqlite3.Connection:
+        ''' Returns the connection of the current thread. '''
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # The database is created on the first use, not when the index is opened.
+            os.makedirs(os.path.dirname(self.path_to_db), exist_ok=True)
+            connection = sqlite3.connect(self.path_to_db, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._create_tables(connection)
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _create_tables(connection: sqlite3.Connection) -> None:
+        with connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS documents (
+                                    id TEXT PRIMARY KEY,
+                                    hash TEXT NOT NULL)""")
+            connection.execute("""CREATE TABLE IF NOT EXISTS units (
+                                    unit INTEGER PRIMARY KEY,
+                                    doc TEXT NOT NULL,
+                                    chapter INTEGER,
+                                    paragraph INTEGER,
+                                    sentence INTEGER,
+                                    kobj INTEGER,
+                                    length INTEGER NOT NULL,
+                                    text TEXT NOT NULL,
+                                    hash TEXT NOT NULL DEFAULT '')""")
+            if 'hash' not in [_[1] for _ in connection.execute("PRAGMA table_info(units)")]:
+                # Units of older indexes have no hash, they are indexed again on the next update.
+                connection.execute("ALTER TABLE units ADD COLUMN hash TEXT NOT NULL DEFAULT ''")
+            connection.execute("CREATE INDEX IF NOT EXISTS units_doc ON units (doc)")
+            connection.execute("""CREATE TABLE IF NOT EXISTS postings (
+                                    term TEXT NOT NULL,
+                                    unit INTEGER NOT NULL,
+                                    positions TEXT NOT NULL,
+                                    PRIMARY KEY (term, unit)) WITHOUT ROWID""")
+            connection.execute("CREATE INDEX IF NOT EXISTS postings_unit ON postings (unit)")
+
+    @staticmethod
+    def _units(text: Optional[Dict], knowledge_objects: Iterable[Dict]) -> Dict[Tuple, Tuple[str, str, Dict]]:
+        ''' Returns the hash, the text and the source (sentence or knowledge object) of every unit.
+
+        The units are keyed by (chapter, paragraph, sentence, kobj), the abstract is chapter -1
+        and the chapters of the text start with 0. The hash covers what is indexed of a unit.
+        '''
+        units = {}
+        if text is not None:
+            chapters = [(-1, text.get('abstract'))] + list(enumerate(text.get('chapters') or []))
+            for chapter_num, chapter in chapters:
+                for paragraph_num, paragraph in enumerate((chapter or {}).get('paragraphs') or []):
+                    for sentence_num, sentence in enumerate(paragraph.get('sentences') or []):
+                        words = [(_.get('text', ''), _.get('normalized_text', '')) for _ in sentence.get('words') or []]
+                        digest = _hash([sentence.get('text', ''), words])
+                        units[(chapter_num, paragraph_num, sentence_num, None)] = \
+                            (digest, sentence.get('text', ''), sentence)
+        for kobj in knowledge_objects:
+            labels = kobj.get('labels') or []
+            units[(None, None, None, kobj['id'])] = (_hash(labels), ", ".join(labels), kobj)
+        return units
+
+    @staticmethod
+    def _tokenize(kobj: Optional[int], source: Dict) -> Tuple[Dict[str, List[int]], int]:
+        ''' Returns the positions of the terms of a unit and the number of positions. '''
+        if kobj is None:
+            return tokenize_sentence(source)
+        positions: Dict[str, List[int]] = defaultdict(list)
+        pos = 0
+        for label in source.get('labels') or []:
+            for token in normalize(label).split():
+                positions[token].append(pos)
+                pos += 1
+            # Phrases should not match across two labels.
+            pos += 1
+        return positions, pos
+
+    def index_document(self, doc_id: str, text: Optional[Dict], knowledge_objects: Iterable[Dict] = ()) -> bool:
+        ''' Updates the units of a document that changed and returns true if anything changed.
+
+        Only the units (sentences and knowledge objects) whose content or location changed are
+        deleted and inserted again, e.g. a new label changes the postings of one knowledge object.
+        '''
+        units = self._units(text, knowledge_objects)
+        connection = self._connection()
+        stored = {(chapter, paragraph, sentence, kobj): (unit, digest) for unit, chapter, paragraph, sentence, kobj, digest
+                  in connection.execute("""SELECT unit, chapter, paragraph, sentence, kobj, hash FROM units
+                                           WHERE doc = ?""", (doc_id,))}
+        removed = [unit for key, (unit, digest) in stored.items() if key not in units or units[key][0] != digest]
+        added = [key for key, (digest, _, _) in units.items() if key not in stored or stored[key][1] != digest]
+        if len(removed) + len(added) == 0 and self.has_document(doc_id):
+            return False
+        with connection:
+            for num in range(0, len(removed), 500):
+                chunk = removed[num:num + 500]
+                marks = ','.join('?' * len(chunk))
+                connection.execute(f"DELETE FROM postings WHERE unit IN ({marks})", chunk)
+                connection.execute(f"DELETE FROM units WHERE unit IN ({marks})", chunk)
+            for chapter, paragraph, sentence, kobj in added:
+                digest, unit_text, source = units[(chapter, paragraph, sentence, kobj)]
+                positions, length = self._tokenize(kobj, source)
+                unit = connection.execute("""INSERT INTO units (doc, chapter, paragraph, sentence, kobj, length, text, hash)
+                                             VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                                          (doc_id, chapter, paragraph, sentence, kobj, length, unit_text,
+                                           digest)).lastrowid
+                connection.executemany("INSERT INTO postings (term, unit, positions) VALUES (?, ?, ?)",
+                                       [(term, unit, ",".join(map(str, pos))) for term, pos in positions.items()])
+            connection.execute("INSERT OR REPLACE INTO documents (id, hash) VALUES (?, ?)",
+                               (doc_id, _hash(sorted(_[0] for _ in units.values()))))
+        return True
+
+    @staticmethod
+    def _delete(connection: sqlite3.Connection, doc_id: str) -> None:
+        connection.execute("DELETE FROM postings WHERE unit IN (SELECT unit FROM units WHERE doc = ?)", (doc_id,))
+        connection.execute("DELETE FROM units WHERE doc = ?", (doc_id,))
+        connection.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+
+    def submit(self, doc_id: str, load: Callable[[], Tuple[Optional[Dict], List[Dict]]]) -> None:
+        ''' Indexes a document in a background thread, load returns its text and knowledge objects.
+
+        Updates of a document that wait to be indexed replace each other.
+        '''
+        with self._condition:
+            self._pending[doc_id] = load
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def discard(self, doc_id: str) -> None:
+        ''' Drops a waiting update of a document and waits until it is no longer indexed. '''
+        with self._condition:
+            self._pending.pop(doc_id, None)
+            self._condition.wait_for(lambda: self._indexing != doc_id)
+
+    def flush(self, timeout: float = None) -> bool:
+        ''' Waits until all submitted documents are indexed. '''
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self._pending) == 0 and self._indexing is None, timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self._pending) > 0)
+                doc_id = self._indexing = next(iter(self._pending))
+                load = self._pending.pop(doc_id)
+            try:
+                self.index_document(doc_id, *load())
+            except Exception:
+                # The index is derived from the documents, rebuild_fulltext_index adds missed updates.
+                logger.exception("Could not index the document %s.", doc_id)
+            finally:
+                with self._condition:
+                    self._indexing = None
+                    self._condition.notify_all()
+
+    def delete_document(self, doc_id: str) -> None:
+        with self._connection() as connection:
+            self._delete(connection, doc_id)
+
+    def has_document(self, doc_id: str) -> bool:
+        return self._connection().execute("SELECT 1 FROM documents WHERE id = ?", (doc_id,)).fetchone() is not None
+
+    def _postings(self, term: str) -> Dict[int, List[int]]:
+        rows = self._connection().execute("SELECT unit, positions FROM postings WHERE term = ?", (term,))
+        return {unit: [int(_) for _ in positions.split(",")] for unit, positions in rows}
+
+    def _phrase_postings(self, terms: List[str]) -> Dict[int, List[int]]:
+        ''' Returns the start positions of the phrase in every unit that contains it. '''
+        res = self._postings(terms[0])
+        for offset, term in enumerate(terms[1:], 1):
+            postings = self._postings(term)
+            matched = {}
+            for unit, starts in res.items():
+                positions = set(postings.get(unit, ()))
+                starts = [pos for pos in starts if pos + offset in positions]
+                if len(starts) > 0:
+                    matched[unit] = starts
+            res = matched
+        return res
+
+    def search(self, query: str, level: str = 'sentence', limit: int = 20) -> List[Dict]:
+        ''' Returns the best matching units for a query, ranked with BM25.
+
+        Quoted phrases ("sliding velocity") have to occur in a unit, the other words are optional
+        and rank the units. On the chapter, paragraph and document level the scores of the
+        sentences and labels they contain are summed up.
+        '''
+        phrases = [normalize(_).split() for _ in _PHRASE.findall(query)]
+        phrases = [_ for _ in phrases if len(_) > 0]
+        terms = [_ for _ in normalize(_PHRASE.sub(' ', query)).split() if _ not in STOP_WORDS]
+        if len(phrases) + len(terms) == 0:
+            return []
+        connection = self._connection()
+        units, total_length = connection.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM units").fetchone()
+        if units == 0:
+            return []
+        average_length = total_length / units
+
+        matches: List[Dict[int, List[int]]] = [self._phrase_postings(_) for _ in phrases]
+        matches += [self._postings(_) for _ in dict.fromkeys(terms)]
+        required = set.intersection(*[set(_) for _ in matches[:len(phrases)]]) if len(phrases) > 0 else None
+        candidates = required if required is not None else set().union(*[set(_) for _ in matches])
+        if len(candidates) == 0:
+            return []
+        lengths = {}
+        candidate_list = list(candidates)
+        for num in range(0, len(candidate_list), 500):
+            chunk = candidate_list[num:num + 500]
+            rows = connection.execute(f"SELECT unit, length FROM units WHERE unit IN ({','.join('?' * len(chunk))})",
+                                      chunk)
+            lengths.update(rows)
+
+        scores: Dict[int, float] = defaultdict(float)
+        for postings in matches:
+            idf = math.log(1 + (units - len(postings) + 0.5) / (len(postings) + 0.5))
+            for unit, positions in postings.items():
+                if unit in candidates:
+                    tf = len(positions)
+                    norm = self.k1 * (1 - self.b + self.b * lengths[unit] / average_length)
+                    scores[unit] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return self._collect(scores, level, limit)
+
+    def _collect(self, scores: Dict[int, float], level: str, limit: int) -> List[Dict]:
+        ''' Groups the scores of the units by the level and loads the best units. '''
+        connection = self._connection()
+        depth = LEVELS.index(level) + 1
+        groups: Dict[Tuple, List] = {}
+        ranked = sorted(scores.items(), key=lambda _: -_[1])
+        for num in range(0, len(ranked), 500):
+            chunk = dict(ranked[num:num + 500])
+            rows = connection.execute(f"""SELECT unit, doc, chapter, paragraph, sentence, kobj, text FROM units
+                                          WHERE unit IN ({','.join('?' * len(chunk))})""", list(chunk))
+            for unit, doc, chapter, paragraph, sentence, kobj, text in rows:
+                location = (doc, chapter, paragraph, sentence)
+                # Labels of knowledge objects belong to the document, but to no chapter.
+                key = location[:depth] if kobj is None or depth == 1 else location + (kobj,)
+                group = groups.setdefault(key, [0.0, None, 0.0])
+                group[0] += chunk[unit]
+                if chunk[unit] > group[2]:
+                    group[1], group[2] = (location, kobj, text), chunk[unit]
+        res = []
+        for score, (location, kobj, text), _ in sorted(groups.values(), key=lambda _: -_[0])[:limit]:
+            hit = {'document_id': location[0], 'score': round(score, 4), 'text': text}
+            if kobj is not None:
+                hit['knowledgeObject_id'] = kobj
+            for name, value in zip(LEVELS[1:], location[1:depth]):
+                hit[name] = value
+            res.append(hit)
+        return res
+
+
+if __name__ == '__main__':
+    # Adds the already stored documents to the full-text index.
+    from app.database.database import db
+    db.rebuild_fulltext_index()
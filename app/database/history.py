@@ -0,0 +1,299 @@
+from __future__ import annotations
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from copy import deepcopy
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+from app.database.serialization import loads
+
+logger = logging.getLogger(__name__)
+
+
+def _pointer(path: List) -> str:
+    return "".join("/" + str(_).replace("~", "~0").replace("/", "~1") for _ in path)
+
+
+def _parse_pointer(pointer: str) -> List[str]:
+    return [_.replace("~1", "/").replace("~0", "~") for _ in pointer.split("/")[1:]]
+
+
+def _size(value: Any, limit: int) -> int:
+    ''' Returns the length of the value as json, or a number above limit once it is exceeded. '''
+    size = 0
+    stack = [value]
+    while len(stack) > 0 and size <= limit:
+        value = stack.pop()
+        if isinstance(value, dict):
+            size += 2 + 4 * len(value) + sum(len(str(_)) for _ in value)
+            stack.extend(value.values())
+        elif isinstance(value, list):
+            size += 2 + 2 * len(value)
+            stack.extend(value)
+        else:
+            size += len(str(value))
+    return size
+
+
+def make_patch(old: Any, new: Any) -> List[Dict]:
+    ''' Returns the JSON Patch (RFC 6902) operations that turn old into new.
+
+    Only add, remove and replace are used. Lists are compared after their common prefix and
+    suffix, so inserting or removing an element in the middle does not rewrite the whole list.
+    '''
+    patch: List[Dict] = []
+    _diff(old, new, [], patch)
+    return patch
+
+
+def _diff(old: Any, new: Any, path: List, patch: List[Dict]) -> None:
+    if old == new:
+        return
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key not in new:
+                patch.append({'op': 'remove', 'path': _pointer(path + [key])})
+        for key, value in new.items():
+            if key not in old:
+                patch.append({'op': 'add', 'path': _pointer(path + [key]), 'value': value})
+            else:
+                _diff(old[key], value, path + [key], patch)
+    elif isinstance(old, list) and isinstance(new, list):
+        start = 0
+        while start < len(old) and start < len(new) and old[start] == new[start]:
+            start += 1
+        end_old, end_new = len(old), len(new)
+        while end_old > start and end_new > start and old[end_old - 1] == new[end_new - 1]:
+            end_old -= 1
+            end_new -= 1
+        common = min(end_old, end_new) - start
+        for num in range(start, start + common):
+            _diff(old[num], new[num], path + [num], patch)
+        # Remove from the back, so the indexes of the remaining elements stay valid.
+        for num in reversed(range(start + common, end_old)):
+            patch.append({'op': 'remove', 'path': _pointer(path + [num])})
+        for num in range(start + common, end_new):
+            patch.append({'op': 'add', 'path': _pointer(path + [num]), 'value': new[num]})
+    else:
+        patch.append({'op': 'replace', 'path': _pointer(path), 'value': new})
+
+
+def apply_patch(document: Any, patch: List[Dict], copy: bool = True) -> Any:
+    ''' Applies JSON Patch operations (add, remove, replace) to a copy of the document (or to the document). '''
+    if copy:
+        document = deepcopy(document)
+    for operation in patch:
+        path = _parse_pointer(operation['path'])
+        if len(path) == 0:
+            document = deepcopy(operation['value'])
+            continue
+        parent = document
+        for key in path[:-1]:
+            parent = parent[int(key)] if isinstance(parent, list) else parent[key]
+        key = path[-1]
+        if isinstance(parent, list):
+            key = len(parent) if key == '-' else int(key)
+            if operation['op'] == 'add':
+                parent.insert(key, deepcopy(operation['value']))
+            elif operation['op'] == 'remove':
+                del parent[key]
+            else:
+                parent[key] = deepcopy(operation['value'])
+        else:
+            if operation['op'] == 'remove':
+                del parent[key]
+            else:
+                parent[key] = deepcopy(operation['value'])
+    return document
+
+
+class VersionHistory:
+    ''' Keeps the previous versions of the documents as JSON Patch deltas against full snapshots.
+
+    Every version is stored as the delta to the version before. After snapshot_interval deltas,
+    or if a delta is not smaller than half of the document, a full snapshot is stored instead.
+    The versions are kept in an SQLite database (WAL mode), so all workers share them. The last
+    version of recently edited documents is kept in memory, so a new version is diffed against
+    it without rebuilding it from the deltas. submit records versions in a background thread.
+    '''
+
+    def __init__(self, path_to_db: str, snapshot_interval: int = 20, cache_size: int = 64):
+        self.path_to_db: str = path_to_db
+        self.snapshot_interval: int = snapshot_interval
+        self.cache_size: int = cache_size
+        self._local = threading.local()
+        # (index, id) -> (version, document) of the last recorded versions, the least recently used first.
+        self._last: OrderedDict[Tuple[str, str], Tuple[int, Dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        # Versions waiting to be recorded (index, id, old, new) and the document that is recorded now.
+        self._queue: Deque[Tuple[str, str, Optional[str], str]] = deque()
+        self._recording: Optional[Tuple[str, str]] = None
+        self._condition = threading.Condition()
+        self._thread: threading.Thread = None
+
+    def _connection(self) -> sqlite3.Connection:
+        ''' Returns the connection of the current thread. '''
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # The database is created on the first use, not when the history is opened.
+            os.makedirs(os.path.dirname(self.path_to_db), exist_ok=True)
+            connection = sqlite3.connect(self.path_to_db, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with connection:
+                connection.execute("""CREATE TABLE IF NOT EXISTS versions (
+                                        idx TEXT NOT NULL,
+                                        id TEXT NOT NULL,
+                                        version INTEGER NOT NULL,
+                                        kind TEXT NOT NULL,
+                                        data TEXT NOT NULL,
+                                        created TEXT NOT NULL,
+                                        PRIMARY KEY (idx, id, version))""")
+            self._local.connection = connection
+        return connection
+
+    def submit(self, index: str, file_id: str, old: Optional[str], new: str) -> None:
+        ''' Records the serialized new state of a document in a background thread, in the order of the calls. '''
+        with self._condition:
+            self._queue.append((index, file_id, old, new))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def flush(self, timeout: float = None) -> bool:
+        ''' Waits until all submitted versions are recorded. '''
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self._queue) == 0 and self._recording is None, timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self._queue) > 0)
+                index, file_id, old, new = self._queue.popleft()
+                self._recording = (index, file_id)
+            try:
+                self.record(index, file_id, loads(old) if old is not None else None, loads(new), new)
+            except Exception:
+                logger.exception("Could not record a version of %s in %s.", file_id, index)
+            finally:
+                with self._condition:
+                    self._recording = None
+                    self._condition.notify_all()
+
+    def record(self, index: str, file_id: str, old: Optional[Dict], new: Dict,
+               serialized: str = None) -> Optional[int]:
+        ''' Stores the new state of a document and returns its version.
+
+        The first recorded change also stores the state before it (old) as version 0, later
+        changes are diffed against the last stored version. Returns None if nothing changed.
+        serialized is new as json if the caller has it, new must not be changed afterwards.
+        '''
+        now = datetime.now().isoformat(timespec='seconds')
+        key = (index, file_id)
+        with self._connection() as connection:
+            last = connection.execute("SELECT MAX(version) FROM versions WHERE idx = ? AND id = ?",
+                                      (index, file_id)).fetchone()[0]
+            if last is None:
+                if old is None:
+                    last = -1
+                else:
+                    connection.execute("INSERT INTO versions VALUES (?, ?, 0, 'snapshot', ?, ?)",
+                                       (index, file_id, json.dumps(old), now))
+                    last = 0
+                    self._remember(key, 0, old)
+            version = last + 1
+            kind = 'snapshot'
+            if last >= 0:
+                patch = make_patch(self._get_last(connection, index, file_id, last), new)
+                if len(patch) == 0:
+                    return None
+                deltas = connection.execute("""SELECT COUNT(*) FROM versions WHERE idx = ? AND id = ? AND version >
+                                               (SELECT MAX(version) FROM versions WHERE idx = ? AND id = ?
+                                                AND kind = 'snapshot')""",
+                                            (index, file_id, index, file_id)).fetchone()[0]
+                data = json.dumps(patch)
+                # The size of the snapshot, without serializing the document only to compare the sizes.
+                size = len(serialized) if serialized is not None else _size(new, 2 * len(data))
+                if deltas + 1 < self.snapshot_interval and len(data) * 2 < size:
+                    kind = 'delta'
+            if kind == 'snapshot':
+                data = serialized if serialized is not None else json.dumps(new)
+            connection.execute("INSERT INTO versions VALUES (?, ?, ?, ?, ?, ?)",
+                               (index, file_id, version, kind, data, now))
+        self._remember(key, version, new)
+        return version
+
+    def _get_last(self, connection: sqlite3.Connection, index: str, file_id: str, version: int) -> Optional[Dict]:
+        ''' Returns the last version of a document, from memory if no other worker recorded a version since. '''
+        with self._lock:
+            cached = self._last.get((index, file_id))
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        return self._get(connection, index, file_id, version)
+
+    def _remember(self, key: Tuple[str, str], version: int, document: Dict) -> None:
+        with self._lock:
+            self._last[key] = (version, document)
+            self._last.move_to_end(key)
+            while len(self._last) > self.cache_size:
+                self._last.popitem(last=False)
+
+    def has_versions(self, index: str, file_id: str) -> bool:
+        return self._connection().execute("SELECT 1 FROM versions WHERE idx = ? AND id = ? LIMIT 1",
+                                          (index, file_id)).fetchone() is not None
+
+    def get_versions(self, index: str, file_id: str) -> List[Dict]:
+        ''' Returns the version number, kind, size and creation time of every stored version. '''
+        rows = self._connection().execute("""SELECT version, kind, LENGTH(data), created FROM versions
+                                             WHERE idx = ? AND id = ? ORDER BY version""", (index, file_id))
+        return [{'version': version, 'kind': kind, 'size': size, 'created': created}
+                for version, kind, size, created in rows]
+
+    def get(self, index: str, file_id: str, version: int) -> Optional[Dict]:
+        ''' Rebuilds a version from the last snapshot before it and the following deltas. '''
+        return self._get(self._connection(), index, file_id, version)
+
+    @staticmethod
+    def _get(connection: sqlite3.Connection, index: str, file_id: str, version: int) -> Optional[Dict]:
+        start = connection.execute("""SELECT MAX(version) FROM versions
+                                      WHERE idx = ? AND id = ? AND version <= ? AND kind = 'snapshot'""",
+                                   (index, file_id, version)).fetchone()[0]
+        if start is None:
+            return None
+        rows = connection.execute("""SELECT version, kind, data FROM versions
+                                     WHERE idx = ? AND id = ? AND version >= ? AND version <= ? ORDER BY version""",
+                                  (index, file_id, start, version)).fetchall()
+        if rows[-1][0] != version:
+            return None
+        document = json.loads(rows[0][2])
+        for _, kind, data in rows[1:]:
+            # The document was just decoded, so the deltas are applied to it without copying it.
+            document = apply_patch(document, json.loads(data), copy=False)
+        return document
+
+    def diff(self, index: str, file_id: str, version_a: int, version_b: int) -> Optional[List[Dict]]:
+        ''' Returns the JSON Patch that turns version a into version b. '''
+        document_a = self.get(index, file_id, version_a)
+        document_b = self.get(index, file_id, version_b)
+        if document_a is None or document_b is None:
+            return None
+        return make_patch(document_a, document_b)
+
+    def iter_data(self) -> Iterator[str]:
+        ''' Iterates over the stored snapshots and deltas, e.g. to find the blobs they refer to. '''
+        for (data,) in self._connection().execute("SELECT data FROM versions"):
+            yield data
+
+    def delete(self, index: str, file_id: str) -> None:
+        ''' Deletes the versions of a document and drops its versions that wait to be recorded. '''
+        with self._condition:
+            self._queue = deque(_ for _ in self._queue if _[:2] != (index, file_id))
+            self._condition.wait_for(lambda: self._recording != (index, file_id))
+        with self._lock:
+            self._last.pop((index, file_id), None)
+        with self._connection() as connection:
+            connection.execute("DELETE FROM versions WHERE idx = ? AND id = ?", (index, file_id))
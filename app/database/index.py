@@ -0,0 +1,94 @@
+from __future__ import annotations
+import logging
+import os
+import time
+from typing import Dict, Tuple
+from pydantic import BaseModel, Field
+from app.database.journal import Journal
+
+logger = logging.getLogger(__name__)
+
+
+class IndexElement(BaseModel):
+    id: str
+    path: str
+    name: str
+    version: int = Field(default=0)
+    # When the id was added (ns), a document that is deleted and added again gets a new generation.
+    generation: int = Field(default=0)
+
+    @property
+    def stamp(self) -> Tuple[int, int]:
+        ''' Identifies the content of the file, it changes with every write and never repeats for an id. '''
+        return self.generation, self.version
+
+
+def _to_element(record: Dict) -> IndexElement:
+    return IndexElement(**record)
+
+
+class Index:
+
+    def __init__(self, file_path):
+        self.file_path: str = file_path
+        self.journal: Journal = Journal(file_path)
+        self._data: Dict[str, IndexElement] = self._create_index(file_path)
+
+    @property
+    def data(self) -> Dict[str, IndexElement]:
+        ''' The elements of the index, including the changes of the other worker processes. '''
+        self.journal.refresh(self._data, _to_element)
+        return self._data
+
+    def _create_index(self, path_to_index: str):
+        ''' Creates a search index from the checkpoint and the journal of the index. '''
+        return self.journal.load(_to_element)
+
+    def save_index(self, background: bool = True):
+        ''' Flushes the journal and compacts it into a new checkpoint once it got too long. '''
+        self.journal.sync()
+        if self.journal.needs_compaction():
+            self.compact(background)
+
+    def compact(self, background: bool = False):
+        ''' Writes the whole index as a new checkpoint. '''
+        with self.journal.locked():
+            records = {id: element.dict() for id, element in self.data.items()}
+            self.journal.compact(records, background)
+
+    def update_index(self, id: str, path_to_file: str, name: str = '') -> bool:
+        ''' Updates the index if possible, bumps the version of the file and returns true '''
+        try:
+            with self.journal.locked():
+                data = self.data
+                if name == '':
+                    name: str = data[id].name
+                version = data[id].version + 1 if id in data else 0
+                generation = data[id].generation if id in data else time.time_ns()
+                element = IndexElement(id=id, name=name, path=path_to_file, version=version, generation=generation)
+                data[id] = element
+                self.journal.put(id, element.dict())
+            return True
+        except KeyError:
+            return False
+
+    def add_id(self, id: str, path_to_file: str, name: str) -> bool:
+        return self.update_index(id, path_to_file, name)
+
+    def del_id(self, id: str) -> bool:
+        ''' Deletes an id from the index if avaiable. '''
+        with self.journal.locked():
+            element = self.data.pop(id, None)
+            if element is not None:
+                self.journal.delete(id)
+        if element is not None:
+            try:
+                os.remove(element.path)
+            except FileNotFoundError:
+                pass
+            except OSError as error:
+                # The entry is gone, the garbage collector deletes the file once it is removable.
+                logger.warning("Could not delete %s: %s", element.path, error)
+                return False
+            return True
+        return True
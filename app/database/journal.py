@@ -0,0 +1,265 @@
+from __future__ import annotations
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from json.decoder import JSONDecodeError
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # No file locks on windows, the journal is then only safe within one process.
+    fcntl = None
+
+# Called with the id, the old and the new record of a changed record.
+Listener = Callable[[str, Optional[object], Optional[object]], None]
+
+
+class Journal:
+    ''' Persists a dict of records as a checkpoint plus an append-only journal of mutations.
+
+    The checkpoint is a json array of records (each with an 'id'), the journal contains one
+    json object per line: {"op": "put", "id": ..., "value": {...}} or {"op": "del", "id": ...}.
+
+    Several processes (e.g. gunicorn workers) can share a journal. Appends and compactions hold
+    an exclusive file lock and refresh replays the records the other processes appended since.
+    '''
+
+    def __init__(self, path_to_checkpoint: str, max_records: int = 1000):
+        self.path_to_checkpoint: str = path_to_checkpoint
+        self.path_to_journal: str = path_to_checkpoint + ".journal"
+        self.path_to_old_journal: str = path_to_checkpoint + ".journal.old"
+        self.path_to_lock: str = path_to_checkpoint + ".lock"
+        self.path_to_compaction_lock: str = path_to_checkpoint + ".compaction.lock"
+        self.max_records: int = max_records
+        self.records_in_journal: int = 0
+        self.lock = threading.RLock()
+        self._lock_file = None
+        self._lock_depth: int = 0
+        self._compaction: threading.Thread = None
+        self._compaction_lock_file = None
+        # What was read so far: the inode and the read bytes of the journal and the checkpoint.
+        self._journal_id: Optional[int] = None
+        self._offset: int = 0
+        self._checkpoint_id: Optional[Tuple[int, int]] = None
+
+    @contextmanager
+    def locked(self):
+        ''' Holds the lock of the journal against other threads and other processes. '''
+        with self.lock:
+            if self._lock_depth == 0 and self._lock_file is None:
+                # The folder and the lock are created on the first use, not when the journal is opened.
+                os.makedirs(os.path.dirname(self.path_to_lock), exist_ok=True)
+                if fcntl is not None:
+                    self._lock_file = open(self.path_to_lock, 'a')
+            if self._lock_depth == 0 and fcntl is not None:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and fcntl is not None:
+                    fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def load(self, convert: Callable[[Dict], object] = None) -> Dict[str, object]:
+        ''' Rebuilds the records from the checkpoint and the journals. '''
+        if not any(os.path.isfile(_) for _ in (self.path_to_checkpoint, self.path_to_old_journal, self.path_to_journal)):
+            # Nothing was written yet, the files are created with the first mutation.
+            self._checkpoint_id, self._journal_id, self._offset, self.records_in_journal = None, None, 0, 0
+            return {}
+        with self.locked():
+            self._checkpoint_id = self._identity(self.path_to_checkpoint)
+            data = self._read_checkpoint()
+            if convert is not None:
+                data = {id: convert(record) for id, record in data.items()}
+            self._replay(self.path_to_old_journal, data, convert=convert)
+            self._journal_id = self._identity(self.path_to_journal)[0] if os.path.isfile(self.path_to_journal) else None
+            self.records_in_journal, self._offset = self._replay(self.path_to_journal, data, convert=convert)
+            return data
+
+    def refresh(self, data: Dict[str, object], convert: Callable[[Dict], object] = None,
+                listener: Listener = None) -> bool:
+        ''' Applies the mutations that other processes made since the last load or refresh.
+
+        Usually only the new lines of the journal are read. After a compaction of another
+        process the records are loaded again. The listener is called with the id, the old and
+        the new record (None if deleted) of every changed record, so derived indexes can follow
+        the changes. Returns true if the data was changed.
+        '''
+        if not self._changed():
+            return False
+        with self.locked():
+            journal = self._identity(self.path_to_journal)
+            if self._identity(self.path_to_checkpoint) != self._checkpoint_id or \
+                    (self._journal_id is not None and (journal is None or journal[0] != self._journal_id)):
+                reloaded = self.load(convert)
+                if listener is not None:
+                    for id in [_ for _ in data if _ not in reloaded] + list(reloaded):
+                        if data.get(id) != reloaded.get(id):
+                            listener(id, data.get(id), reloaded.get(id))
+                data.clear()
+                data.update(reloaded)
+                return True
+            if journal is None:
+                return False
+            applied, self._offset = self._replay(self.path_to_journal, data, self._offset, convert, listener)
+            self._journal_id = journal[0]
+            self.records_in_journal += applied
+            return applied > 0
+
+    def _changed(self) -> bool:
+        journal = self._identity(self.path_to_journal)
+        current = None if journal is None else (journal[0], journal[1])
+        return current != ((self._journal_id, self._offset) if self._journal_id is not None else None) or \
+            self._identity(self.path_to_checkpoint) != self._checkpoint_id
+
+    @staticmethod
+    def _identity(path: str) -> Optional[Tuple[int, int]]:
+        ''' Returns the inode and the size of a file, a replaced file gets a new inode. '''
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size
+
+    def _read_checkpoint(self) -> Dict[str, Dict]:
+        if not os.path.isfile(self.path_to_checkpoint):
+            return {}
+        with open(self.path_to_checkpoint, 'r', encoding='utf-8') as checkpoint:
+            try:
+                return {record['id']: record for record in json.load(checkpoint)}
+            except JSONDecodeError:
+                # Checkpoints are replaced atomically, so this only happens for files
+                # that were written by hand or by an older version.
+                return {}
+
+    @staticmethod
+    def _replay(path_to_journal: str, data: Dict[str, object], offset: int = 0,
+                convert: Callable[[Dict], object] = None, listener: Listener = None) -> Tuple[int, int]:
+        ''' Applies the mutations of a journal from the offset on.
+
+        Returns the number of applied records and the offset after the last valid record.
+        '''
+        if not os.path.isfile(path_to_journal):
+            return 0, 0
+        applied = 0
+        valid_bytes = offset
+        with open(path_to_journal, 'rb') as journal:
+            journal.seek(offset)
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except (JSONDecodeError, UnicodeDecodeError):
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                old = data.get(record['id'])
+                if record['op'] == 'put':
+                    data[record['id']] = record['value'] if convert is None else convert(record['value'])
+                elif record['op'] == 'del':
+                    data.pop(record['id'], None)
+                if listener is not None and (old is not None or record['id'] in data):
+                    listener(record['id'], old, data.get(record['id']))
+                applied += 1
+                valid_bytes += len(line)
+        if valid_bytes < os.path.getsize(path_to_journal):
+            # A torn write at the end of the journal, everything before it is valid.
+            # Appends hold the lock, so this is never a record another process is still writing.
+            os.truncate(path_to_journal, valid_bytes)
+        return applied, valid_bytes
+
+    def put(self, id: str, value: Dict) -> None:
+        self.append([{'op': 'put', 'id': id, 'value': value}])
+
+    def delete(self, id: str) -> None:
+        self.append([{'op': 'del', 'id': id}])
+
+    def append(self, records: List[Dict]) -> None:
+        ''' Appends the mutations to the journal. '''
+        lines = "".join(json.dumps(record) + "\n" for record in records).encode('utf-8')
+        with self.locked():
+            with open(self.path_to_journal, 'ab') as journal:
+                start = journal.tell()
+                journal.write(lines)
+                journal_id = os.fstat(journal.fileno()).st_ino
+            if start == self._offset and journal_id == self._journal_id or start == 0 and self._journal_id is None:
+                # Nothing of other processes was missed, so the own records need no replay.
+                self._journal_id = journal_id
+                self._offset = start + len(lines)
+                self.records_in_journal += len(records)
+
+    def sync(self) -> None:
+        ''' Flushes the journal to the disk. '''
+        with self.lock:
+            if os.path.isfile(self.path_to_journal):
+                with open(self.path_to_journal, 'a', encoding='utf-8') as journal:
+                    os.fsync(journal.fileno())
+
+    def needs_compaction(self) -> bool:
+        return self.records_in_journal >= self.max_records
+
+    def compact(self, data: Dict[str, Dict], background: bool = False) -> None:
+        ''' Writes a new checkpoint of the data and drops the journal.
+
+        The data has to be refreshed and taken while holding the lock of the journal.
+        Only one process compacts at a time, the others skip the compaction.
+        '''
+        with self.locked():
+            if self._compaction is not None and self._compaction.is_alive():
+                return
+            if not self._acquire_compaction_lock():
+                return
+            # Everything appended from now on goes into a fresh journal.
+            if os.path.isfile(self.path_to_old_journal) and os.path.isfile(self.path_to_journal):
+                # An earlier compaction did not finish, keep its records until the checkpoint exists.
+                with open(self.path_to_journal, 'r', encoding='utf-8') as journal, \
+                        open(self.path_to_old_journal, 'a', encoding='utf-8') as old_journal:
+                    old_journal.write(journal.read())
+                os.remove(self.path_to_journal)
+            elif os.path.isfile(self.path_to_journal):
+                os.replace(self.path_to_journal, self.path_to_old_journal)
+            self.records_in_journal = 0
+            self._journal_id = None
+            self._offset = 0
+            snapshot = list(data.values())
+        if background:
+            self._compaction = threading.Thread(target=self._write_checkpoint, args=(snapshot,), daemon=True)
+            self._compaction.start()
+        else:
+            self._write_checkpoint(snapshot)
+
+    def _acquire_compaction_lock(self) -> bool:
+        if fcntl is None:
+            return True
+        if self._compaction_lock_file is None:
+            self._compaction_lock_file = open(self.path_to_compaction_lock, 'a')
+        try:
+            fcntl.flock(self._compaction_lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def _write_checkpoint(self, records: List[Dict]) -> None:
+        try:
+            tmp_path = f"{self.path_to_checkpoint}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as checkpoint:
+                json.dump(records, checkpoint)
+                checkpoint.flush()
+                os.fsync(checkpoint.fileno())
+            with self.locked():
+                os.replace(tmp_path, self.path_to_checkpoint)
+                if os.path.isfile(self.path_to_old_journal):
+                    os.remove(self.path_to_old_journal)
+                self._checkpoint_id = self._identity(self.path_to_checkpoint)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self._compaction_lock_file.fileno(), fcntl.LOCK_UN)
+
+    def wait(self) -> None:
+        ''' Waits until a running compaction is finished. '''
+        compaction = self._compaction
+        if compaction is not None:
+            compaction.join()
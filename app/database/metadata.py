@@ -0,0 +1,176 @@
+from __future__ import annotations
+import re
+import unicodedata
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from app.database.journal import Journal
+
+_NOT_ALPHANUMERIC = re.compile(r'[^0-9a-z]+')
+_DOI_PREFIX = re.compile(r'^(https?://(dx\.)?doi\.org/|doi:)', re.I)
+
+
+def normalize(text: str) -> str:
+    ''' Lowercases the text, removes accents and replaces everything except letters and digits by a space. '''
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode('ascii')
+    return _NOT_ALPHANUMERIC.sub(' ', text.lower()).strip()
+
+
+def normalize_doi(doi: str) -> str:
+    return _DOI_PREFIX.sub('', (doi or '').strip()).lower()
+
+
+def normalize_issn(issn: str) -> str:
+    return (issn or '').replace('-', '').replace(' ', '').upper()
+
+
+class PrefixIndex:
+    ''' A sorted list of (term, id) pairs to find the ids of all terms starting with a prefix. '''
+
+    def __init__(self, entries: Iterable[Tuple[str, str]] = ()):
+        # All entries are sorted at once, adding them one by one would move the list for every entry.
+        self._entries: List[Tuple[str, str]] = sorted(set(entries))
+
+    def add(self, term: str, id: str) -> None:
+        entry = (term, id)
+        pos = bisect_left(self._entries, entry)
+        if pos == len(self._entries) or self._entries[pos] != entry:
+            self._entries.insert(pos, entry)
+
+    def remove(self, term: str, id: str) -> None:
+        entry = (term, id)
+        pos = bisect_left(self._entries, entry)
+        if pos < len(self._entries) and self._entries[pos] == entry:
+            del self._entries[pos]
+
+    def find(self, prefix: str) -> Set[str]:
+        ''' Returns the ids of all terms that start with the prefix. '''
+        ids = set()
+        for term, id in self._entries[bisect_left(self._entries, (prefix, '')):]:
+            if not term.startswith(prefix):
+                break
+            ids.add(id)
+        return ids
+
+
+class MetadataIndex:
+    ''' Secondary indexes over the metadata (doi, issn, title, authors, journal) of the documents.
+
+    DOI and ISSN are matched exactly, titles, authors and journals by the prefixes of their
+    normalized words. The records are persisted in a journal, so every worker sees the same index.
+    '''
+
+    def __init__(self, path_to_index: str):
+        self.journal: Journal = Journal(path_to_index)
+        self.records: Dict[str, Dict] = self.journal.load()
+        self._build()
+
+    def _build(self) -> None:
+        self._dois: Dict[str, Set[str]] = {}
+        self._issns: Dict[str, Set[str]] = {}
+        entries: Dict[str, List[Tuple[str, str]]] = {'title': [], 'author': [], 'journal': []}
+        for record in self.records.values():
+            self._add_codes(record)
+            for field, terms in self._terms(record).items():
+                entries[field].extend((term, record['id']) for term in terms)
+        self._words: Dict[str, PrefixIndex] = {field: PrefixIndex(_) for field, _ in entries.items()}
+
+    def _refresh(self) -> None:
+        ''' Applies the changes of the other workers to the records and the indexes. '''
+        self.journal.refresh(self.records, listener=self._replace)
+
+    def _replace(self, id: str, old: Optional[Dict], new: Optional[Dict]) -> None:
+        if old is not None:
+            self._remove(old)
+        if new is not None:
+            self._add(new)
+
+    @staticmethod
+    def _terms(record: Dict) -> Dict[str, Set[str]]:
+        return {'title': set(normalize(f"{record['title']} {record['subtitle']}").split()),
+                'author': set(normalize(" ".join(record['authors'])).split()),
+                'journal': set(normalize(f"{record['journal']} {record['publisher']}").split())}
+
+    def _add_codes(self, record: Dict) -> None:
+        if record['doi'] != '':
+            self._dois.setdefault(record['doi'], set()).add(record['id'])
+        if record['issn'] != '':
+            self._issns.setdefault(record['issn'], set()).add(record['id'])
+
+    def _add(self, record: Dict) -> None:
+        self._add_codes(record)
+        for field, terms in self._terms(record).items():
+            for term in terms:
+                self._words[field].add(term, record['id'])
+
+    def _remove(self, record: Dict) -> None:
+        self._dois.get(record['doi'], set()).discard(record['id'])
+        self._issns.get(record['issn'], set()).discard(record['id'])
+        for field, terms in self._terms(record).items():
+            for term in terms:
+                self._words[field].remove(term, record['id'])
+
+    def put(self, id: str, metadata: Optional[Dict]) -> None:
+        ''' Adds or replaces the metadata of a document. '''
+        metadata = metadata if metadata is not None else {}
+        record = {'id': id,
+                  'doi': normalize_doi(metadata.get('doi', '')),
+                  'issn': normalize_issn(metadata.get('issn', '')),
+                  'title': metadata.get('title', ''),
+                  'subtitle': metadata.get('subtitle', ''),
+                  'journal': metadata.get('journal', ''),
+                  'publisher': metadata.get('publisher', ''),
+                  'authors': [f"{_['first_name']} {_['last_name']}" for _ in metadata.get('authors', [])]}
+        with self.journal.locked():
+            self._refresh()
+            old = self.records.get(id)
+            if old == record:
+                return
+            if old is not None:
+                self._remove(old)
+            self.records[id] = record
+            self._add(record)
+            self.journal.put(id, record)
+
+    def delete(self, id: str) -> None:
+        with self.journal.locked():
+            self._refresh()
+            record = self.records.pop(id, None)
+            if record is not None:
+                self._remove(record)
+                self.journal.delete(id)
+
+    def get(self, id: str) -> Optional[Dict]:
+        self._refresh()
+        return self.records.get(id)
+
+    def __len__(self) -> int:
+        self._refresh()
+        return len(self.records)
+
+    def find(self, doi: str = None, issn: str = None, title: str = None, author: str = None,
+             journal: str = None) -> List[str]:
+        ''' Returns the ids of the documents that match all given criteria.
+
+        For title, author and journal every word of the query has to be the prefix of a word
+        of the field, e.g. "fric stee" finds "Friction of steel".
+        '''
+        with self.journal.locked():
+            self._refresh()
+            matches: List[Set[str]] = []
+            if doi is not None:
+                matches.append(set(self._dois.get(normalize_doi(doi), set())))
+            if issn is not None:
+                matches.append(set(self._issns.get(normalize_issn(issn), set())))
+            for field, query in (('title', title), ('author', author), ('journal', journal)):
+                if query is not None:
+                    matches.extend(self._words[field].find(_) for _ in normalize(query).split())
+            if len(matches) == 0:
+                return []
+            return sorted(set.intersection(*matches))
+
+    def save(self) -> None:
+        self.journal.sync()
+        if self.journal.needs_compaction():
+            with self.journal.locked():
+                self._refresh()
+                self.journal.compact(self.records, background=True)
@@ -0,0 +1,62 @@
+from __future__ import annotations
+import json
+import re
+from typing import Dict, Iterable
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+_STRUCTURE = re.compile(r'["\[\]{}]')
+_LITERAL = re.compile(r'[^,}\]\s]*')
+
+
+def _skip_value(content: str, pos: int) -> int:
+    ''' Returns the position after the json value at pos without decoding it. '''
+    char = content[pos]
+    if char == '"':
+        return _STRING.match(content, pos).end()
+    if char not in '[{':
+        return _LITERAL.match(content, pos).end()
+    depth = 0
+    while True:
+        match = _STRUCTURE.search(content, pos)
+        if match is None:
+            raise ValueError("Unterminated json value.")
+        char = match.group()
+        if char == '"':
+            pos = _STRING.match(content, match.start()).end()
+            continue
+        depth += 1 if char in '[{' else -1
+        pos = match.end()
+        if depth == 0:
+            return pos
+
+
+def load_fields(content: str, fields: Iterable[str]) -> Dict:
+    ''' Decodes only the given top-level fields of a serialized json object.
+
+    The values of all other fields are skipped without being decoded, so the costs depend
+    on the size of the requested fields and not on the size of the whole document.
+    '''
+    wanted = set(fields)
+    res = {}
+    pos = _WHITESPACE.match(content, 0).end()
+    if content[pos] != '{':
+        raise ValueError("Only json objects can be projected.")
+    pos += 1
+    while len(wanted) > 0:
+        pos = _WHITESPACE.match(content, pos).end()
+        if content[pos] == '}':
+            break
+        key, pos = _decoder.raw_decode(content, pos)
+        pos = _WHITESPACE.match(content, pos).end()
+        pos = _WHITESPACE.match(content, pos + 1).end()  # skip the colon
+        if key in wanted:
+            res[key], pos = _decoder.raw_decode(content, pos)
+            wanted.discard(key)
+        else:
+            pos = _skip_value(content, pos)
+        pos = _WHITESPACE.match(content, pos).end()
+        if content[pos] == ',':
+            pos += 1
+    return res
@@ -0,0 +1,19 @@
+from __future__ import annotations
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(content: Union[str, bytes]) -> Any:
+    ''' Decodes json, with orjson if it is installed. '''
+    if orjson is not None:
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            # orjson rejects NaN, Infinity and lone surrogates, which the json module writes.
+            pass
+    return json.loads(content)
@@ -0,0 +1,129 @@
+import os
+import tempfile
+from unittest import TestCase
+from app.database.backends import FileBackend, SQLiteBackend, copy_backend
+from app.database.database import DataBase
+
+
+class Document:
+    def __init__(self, id, file_path, data):
+        self.id = id
+        self.file_name = f"{id}.pdf"
+        self.file_path = file_path
+        self.data = data
+
+    def to_json(self):
+        return self.data
+
+
+class BackendTestMixin:
+
+    def create_backend(self, folder):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.db = DataBase(self.create_backend(self.folder.name))
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def _doc(self, id, data='{"id": "1"}'):
+        return Document(id, os.path.join(self.folder.name, f"{id}.json"), data)
+
+    def test_add_and_get_file(self):
+        self.assertTrue(self.db.add_file(self._doc("1"), 'extract'))
+        self.assertFalse(self.db.add_file(self._doc("1"), 'extract'))
+        self.assertEqual(self.db.get_file('extract', "1", False), {"id": "1"})
+        self.assertIsNone(self.db.get_file('extract', "2", False))
+        self.assertEqual([_.id for _ in self.db.get_all_index_data('extract')], ["1"])
+
+    def test_update_file(self):
+        self.db.add_file(self._doc("1"), 'extract')
+        self.assertTrue(self.db.update_file(self._doc("1", '{"id": "1", "text": "a"}')))
+        self.assertEqual(self.db.get_file('extract', "1", False)['text'], "a")
+        self.assertFalse(self.db.update_file(self._doc("2")))
+        self.assertFalse(self.db.update_file(self._doc("2"), 'extract'))
+
+    def test_versions(self):
+        words = ", ".join(f'"{num}"' for num in range(20))
+        self.db.add_file(self._doc("1", f'{{"id": "1", "text": ["a", "b", {words}]}}'), 'extract')
+        self.db.update_file(self._doc("1", f'{{"id": "1", "text": ["a", "c", "b", {words}]}}'))
+        self.db.update_file(self._doc("1", f'{{"id": "1", "text": ["c", "b", {words}]}}'))
+        self.assertEqual([_['kind'] for _ in self.db.get_versions('extract', "1")], ['snapshot', 'delta', 'delta'])
+        self.assertEqual(self.db.diff_versions('extract', "1", 0, 1), [{'op': 'add', 'path': '/text/1', 'value': "c"}])
+        self.assertEqual(self.db.get_version('extract', "1", 1)['text'][:3], ["a", "c", "b"])
+        self.db.del_file_by_id("1", 'extract')
+        self.assertEqual(self.db.get_versions('extract', "1"), [])
+
+    def test_del_file_by_id(self):
+        self.db.add_file(self._doc("1"), 'extract')
+        self.db.add_file(self._doc("1"), 'upload')
+        self.assertTrue(self.db.del_file_by_id("1", 'all'))
+        self.assertEqual(len(self.db.get_all_index_data('extract')), 0)
+        self.assertEqual(len(self.db.get_all_index_data('upload')), 0)
+
+    def test_get_all_files(self):
+        self.db.add_file(self._doc("1"), 'extract')
+        self.db.add_file(self._doc("2", '{"id": "2"}'), 'extract')
+        self.assertEqual(self.db.get_all_files('extract', False), [{"id": "1"}, {"id": "2"}])
+
+    def test_iter_files(self):
+        for num in range(5):
+            self.db.add_file(self._doc(str(num), f'{{"id": "{num}", "file_name": "{num}.pdf"}}'), 'extract')
+        files = list(self.db.iter_files('extract', batch_size=2, fields=['file_name']))
+        self.assertEqual(files, [{"file_name": f"{num}.pdf"} for num in range(5)])
+        self.assertEqual(len(list(self.db.iter_files('upload'))), 0)
+
+    def test_states(self):
+        self.db.add_file(self._doc("1"), 'upload')
+        self.db.add_file(self._doc("1"), 'extract')
+        self.db.add_file(self._doc("2"), 'upload')
+        self.assertEqual({_['id']: _['state'] for _ in self.db.get_states()}, {"1": "extracted", "2": "uploaded"})
+
+        self.db.set_error("2", "extraction: timeout")
+        self.db.set_state("2", 'extracted')
+        record = [_ for _ in self.db.get_states(['extracted']) if _['id'] == "2"][0]
+        self.assertEqual(record['error'], '')
+        self.assertEqual(set(record['timestamps']), {'uploaded', 'extracted'})
+
+        self.db.del_file_by_id("1", 'extract')
+        self.assertEqual([_['id'] for _ in self.db.get_states(['uploaded'])], ["1"])
+        self.db.del_file_by_id("1", 'all')
+        self.assertEqual([_['id'] for _ in self.db.get_states()], ["2"])
+
+
+class TestFileBackend(BackendTestMixin, TestCase):
+
+    def create_backend(self, folder):
+        return FileBackend({'upload': os.path.join(folder, "indexes/uploaded.json"),
+                            'extract': os.path.join(folder, "indexes/extracted.json")})
+
+    def test_save_indexes(self):
+        self.db.add_file(self._doc("1"), 'extract')
+        self.db.save_indexes()
+        backend = self.create_backend(self.folder.name)
+        self.assertIn("1", backend.get_index_data('extract'))
+
+    def test_workers_share_indexes(self):
+        other = DataBase(self.create_backend(self.folder.name))
+        self.db.add_file(self._doc("1"), 'upload')
+        self.db.set_state("1", 'uploaded')
+        self.assertEqual(other.get_file('upload', "1"), {"id": "1"})
+        self.assertEqual([_['id'] for _ in other.get_states(['uploaded'])], ["1"])
+        other.del_file_by_id("1", 'all')
+        self.assertIsNone(self.db.get_file('upload', "1"))
+        self.assertEqual(self.db.get_states(), [])
+
+
+class TestSQLiteBackend(BackendTestMixin, TestCase):
+
+    def create_backend(self, folder):
+        return SQLiteBackend(os.path.join(folder, "database.sqlite3"), ['upload', 'extract'])
+
+    def test_copy_backend(self):
+        self.db.add_file(self._doc("1"), 'extract')
+        target = SQLiteBackend(os.path.join(self.folder.name, "copy.sqlite3"), ['upload', 'extract'])
+        self.assertEqual(copy_backend(self.db._backend, target), 1)
+        self.assertEqual(target.read('extract', "1"), '{"id": "1"}')
+
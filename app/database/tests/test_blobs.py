@@ -0,0 +1,41 @@
+import tempfile
+from base64 import urlsafe_b64encode
+from unittest import TestCase
+from unittest.mock import patch
+from app.database.blobs import BlobStore
+from app.internal.internal_datamodels import Document
+
+
+class TestBlobStore(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.store = BlobStore(self.folder.name)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_identical_files_are_stored_once(self):
+        ref = self.store.put(b"%PDF-1.4")
+        self.assertEqual(self.store.put(b"%PDF-1.4"), ref)
+        self.assertEqual(list(self.store.refs()), [ref])
+        self.assertEqual(self.store.get(ref), b"%PDF-1.4")
+
+    def test_document_keeps_only_references(self):
+        data = urlsafe_b64encode(b"%PDF-1.4").decode('utf-8')
+        doc = Document(id="1", base64_file=data, images=[{'base64_file': data}])
+        with patch('app.internal.internal_datamodels.blob_store', self.store):
+            doc.store_files()
+            self.assertEqual(doc.base64_file, '')
+            self.assertEqual(doc.blob_ref, doc.images[0].blob_ref)
+            self.assertEqual(doc.images[0].decode_file(), b"%PDF-1.4")
+            self.assertEqual(doc.get_base64_file(), data)
+
+    def test_exports_inline_the_files(self):
+        data = urlsafe_b64encode(b"%PDF-1.4").decode('utf-8')
+        doc = Document(id="1", base64_file=data, tables=[{'base64_file': data}])
+        with patch('app.internal.internal_datamodels.blob_store', self.store):
+            doc.store_files()
+            doc.load_files()
+        self.assertEqual((doc.base64_file, doc.blob_ref), (data, ''))
+        self.assertEqual((doc.tables[0].base64_file, doc.tables[0].blob_ref), (data, ''))
@@ -0,0 +1,91 @@
+import os
+import tempfile
+from unittest import TestCase
+from app.database.backends import FileBackend
+from app.database.cache import DocumentCache
+from app.database.database import DataBase
+
+
+class Document:
+    def __init__(self, id, file_path, data):
+        self.id = id
+        self.file_name = f"{id}.pdf"
+        self.file_path = file_path
+        self.data = data
+
+    def to_json(self):
+        return self.data
+
+
+class TestDocumentCache(TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = DocumentCache(max_size=10)
+        cache.put('extract', "1", 0, "aaaa")
+        cache.put('extract', "2", 0, "bbbb")
+        cache.get('extract', "1", 0)
+        cache.put('extract', "3", 0, "cccc")
+
+        self.assertEqual(cache.get('extract', "1", 0), "aaaa")
+        self.assertIsNone(cache.get('extract', "2", 0))
+        self.assertEqual(cache.statistics()['evictions'], 1)
+        self.assertEqual(cache.size, 8)
+
+    def test_newer_version_is_a_miss(self):
+        cache = DocumentCache(max_size=10)
+        cache.put('extract', "1", 0, "aaaa")
+        self.assertIsNone(cache.get('extract', "1", 1))
+        self.assertEqual(cache.size, 0)
+        self.assertEqual(cache.statistics()['misses'], 1)
+
+
+class TestCachedDataBase(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        backend = FileBackend({'extract': os.path.join(self.folder.name, "indexes/extracted.json")})
+        self.db = DataBase(backend, DocumentCache(max_size=1024))
+        self.path = os.path.join(self.folder.name, "1.json")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_updates_invalidate_cached_files(self):
+        self.db.add_file(Document("1", self.path, '{"text": "a"}'), 'extract')
+        self.assertEqual(self.db.get_file('extract', "1"), {"text": "a"})
+        self.assertEqual(self.db.get_file('extract', "1"), {"text": "a"})
+        self.db.update_file(Document("1", self.path, '{"text": "b"}'))
+
+        self.assertEqual(self.db.get_file('extract', "1"), {"text": "b"})
+        self.assertEqual(self.db.get_cache_statistics()['hits'], 1)
+
+    def test_cached_files_are_copies(self):
+        self.db.add_file(Document("1", self.path, '{"text": "a"}'), 'extract')
+        self.db.get_file('extract', "1")['text'] = "b"
+        self.assertEqual(self.db.get_file('extract', "1"), {"text": "a"})
+
+    def test_text_views_follow_versions(self):
+        text = '{"text": {"chapters": [{"paragraphs": [{"sentences": [{"text": "%s"}]}]}]}}'
+        self.db.add_file(Document("1", self.path, text % "Steel wears."), 'extract')
+        view = self.db.get_text_view('extract', "1")
+        self.assertTrue(view.fulltext.startswith("Steel wears. \n"))
+        self.assertIs(self.db.get_text_view('extract', "1"), view)
+
+        self.db.update_file(Document("1", self.path, text % "Brass wears."))
+        self.assertTrue(self.db.get_text_view('extract', "1").fulltext.startswith("Brass wears."))
+        self.db.flush()
+        view = self.db.get_text_view('extract', "1")
+        self.assertTrue(view.fulltext.startswith("Brass wears."))
+        self.assertIs(self.db.get_text_view('extract', "1"), view)
+
+    def test_readded_files_are_not_stale(self):
+        # A second worker on the same indexs still caches the deleted document.
+        paths = {'upload': os.path.join(self.folder.name, "indexes/uploaded.json")}
+        worker_a = DataBase(FileBackend(paths), DocumentCache(max_size=1024))
+        worker_b = DataBase(FileBackend(paths), DocumentCache(max_size=1024))
+        worker_a.add_file(Document("1", self.path, '{"text": "a"}'), 'upload')
+        self.assertEqual(worker_b.get_file('upload', "1"), {"text": "a"})
+
+        worker_a.del_file_by_id("1", 'upload')
+        worker_a.add_file(Document("1", self.path, '{"text": "b"}'), 'upload')
+        self.assertEqual(worker_b.get_file('upload', "1"), {"text": "b"})
@@ -0,0 +1,110 @@
+import os
+import tempfile
+import time
+from unittest import TestCase
+from unittest.mock import patch
+from app.database.backends import FileBackend
+from app.database.blobs import BlobStore
+from app.database.cleanup import collect_blobs, collect_orphans, collect_tmp
+from app.database.database import DataBase
+from app.database.index import IndexElement
+from app.internal.internal_datamodels import Document
+
+
+def _write(path, size, age=0):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(b"x" * size)
+    timestamp = time.time() - age
+    os.utime(path, (timestamp, timestamp))
+
+
+class TestCleanup(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = lambda *_: os.path.join(self.folder.name, *_)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_orphans_and_dangling_entries(self):
+        backend = FileBackend({'extract': self.path("indexes/extracted.json")})
+        os.makedirs(self.path("extracted"))
+        backend.write('extract', IndexElement(id="1", path=self.path("extracted/1.json"), name="1.pdf"), '{}')
+        backend.write('extract', IndexElement(id="2", path=self.path("extracted/2.json"), name="2.pdf"), '{}')
+        os.remove(self.path("extracted/2.json"))
+        _write(self.path("extracted/3.json"), 10, age=7200)
+        _write(self.path("extracted/4.json"), 10)
+
+        report = collect_orphans(backend, {'extract': self.path("extracted")}, dry_run=True)
+        self.assertEqual(report.orphaned_files, [self.path("extracted/3.json")])
+        self.assertEqual(report.dangling_entries, [('extract', "2")])
+        self.assertTrue(os.path.isfile(self.path("extracted/3.json")))
+
+        report = collect_orphans(backend, {'extract': self.path("extracted")})
+        self.assertEqual(report.freed_bytes, 10)
+        self.assertFalse(os.path.isfile(self.path("extracted/3.json")))
+        self.assertTrue(os.path.isfile(self.path("extracted/4.json")))
+        self.assertEqual(list(backend.get_index_data('extract')), ["1"])
+
+    def test_blobs(self):
+        store = BlobStore(self.path("blobs"))
+        used, unused = store.put(b"used"), store.put(b"unused")
+        for ref in [used, unused]:
+            os.utime(store.path(ref), (time.time() - 7200, time.time() - 7200))
+        report = collect_blobs(store, [f'{{"blob_ref": "{used}"}}'])
+        self.assertEqual(report.blobs, [unused])
+        self.assertEqual(list(store.refs()), [used])
+
+    def test_unreadable_documents_keep_all_blobs(self):
+        store = BlobStore(self.path("blobs"))
+        ref = store.put(b"pdf")
+        os.utime(store.path(ref), (time.time() - 7200, time.time() - 7200))
+        backend = FileBackend({'extract': self.path("indexes/extracted.json")})
+        os.makedirs(self.path("extracted"))
+        backend.write('extract', IndexElement(id="1", path=self.path("extracted/1.json"), name="1.pdf"),
+                      f'{{"blob_ref": "{ref}"}}')
+        db = DataBase(backend)
+
+        with patch.object(FileBackend, 'read', side_effect=OSError(5, "Input/output error")):
+            report = collect_blobs(store, db._iter_contents())
+        self.assertEqual(report.blobs, [])
+        self.assertEqual(len(report.errors), 1)
+        self.assertEqual(list(store.refs()), [ref])
+        self.assertEqual(collect_blobs(store, db._iter_contents()).blobs, [])
+
+    def test_blobs_of_versions_are_kept(self):
+        store = BlobStore(self.path("blobs"))
+        refs = [store.put(f"image {num}".encode('utf-8')) for num in range(3)]
+        for ref in refs:
+            os.utime(store.path(ref), (time.time() - 7200, time.time() - 7200))
+        os.makedirs(self.path("extracted"))
+        db = DataBase(FileBackend({'extract': self.path("indexes/extracted.json")}))
+        with patch('app.internal.internal_datamodels.blob_store', store):
+            for num, ref in enumerate(refs):
+                document = Document(id="1", file_name="1.pdf", file_path=self.path("extracted/1.json"),
+                                    images=[{'blob_ref': ref}])
+                if num == 0:
+                    db.add_file(document, 'extract')
+                else:
+                    db.update_file(document, 'extract')
+            # The second reference is only kept by the delta that replaced the reference of the image.
+            db.flush()
+            self.assertEqual([_['kind'] for _ in db.get_versions('extract', "1")], ['snapshot', 'delta', 'delta'])
+
+            self.assertEqual(collect_blobs(store, db._iter_contents()).blobs, [])
+            self.assertTrue(db.restore_version('extract', "1", 1))
+            self.assertEqual(db.get_document('extract', "1").images[0].decode_file(), b"image 1")
+
+    def test_tmp_budget(self):
+        _write(self.path("tmp/imgs/old.png"), 10, age=100)
+        _write(self.path("tmp/imgs/a.png"), 10, age=30)
+        _write(self.path("tmp/document/b.pdf"), 10, age=20)
+        _write(self.path("tmp/document/c.pdf"), 10, age=10)
+        _write(self.path("tmp/.gitkeep"), 0, age=100)
+
+        report = collect_tmp(self.path("tmp"), ttl=60, max_size=20)
+        self.assertEqual(report.tmp_files, [self.path("tmp/imgs/old.png"), self.path("tmp/imgs/a.png")])
+        self.assertEqual(report.freed_bytes, 20)
+        self.assertTrue(os.path.isfile(self.path("tmp/.gitkeep")))
@@ -0,0 +1,58 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+from app.database import compression as compression_module
+from app.database.backends import FileBackend
+from app.database.compression import Compression, migrate
+from app.database.index import IndexElement
+
+
+def _document(num: int) -> str:
+    words = [{"id": _, "text": f"word{_ % 7}", "normalized_text": f"word{_ % 7}", "enriched_text": "",
+              "annotation_id": -1, "start_pos": _ * 6, "end_pos": _ * 6 + 5, "prev_word_id": _ - 1}
+             for _ in range(num, num + 50)]
+    return json.dumps({"id": str(num), "text": {"chapters": [{"paragraphs": [{"sentences": [{"words": words}]}]}]}})
+
+
+class TestCompression(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_codecs_round_trip(self):
+        compression = Compression({'extract': 'zstd', 'annotate': 'gzip'})
+        content = _document(1)
+        for index in ['extract', 'annotate', 'upload']:
+            data = compression.encode(index, content)
+            self.assertEqual(compression.decode(data), content)
+        self.assertLess(len(compression.encode('extract', content)), len(content) / 4)
+
+    def test_zstd_falls_back_to_gzip(self):
+        zstandard = compression_module.zstandard
+        compression_module.zstandard = None
+        try:
+            compression = Compression({'extract': 'zstd'})
+            self.assertEqual(compression.encode('extract', "{}")[:2], compression_module.GZIP_MAGIC)
+        finally:
+            compression_module.zstandard = zstandard
+
+    def test_migration_with_trained_dictionary(self):
+        path_to_dictionaries = os.path.join(self.folder.name, "dictionaries")
+        backend = FileBackend({'extract': os.path.join(self.folder.name, "indexes/extracted.json")})
+        for num in range(20):
+            path = os.path.join(self.folder.name, f"{num}.json")
+            backend.write('extract', IndexElement(id=str(num), path=path, name=f"{num}.pdf"), _document(num))
+
+        backend.compression = Compression({'extract': 'zstd'}, path_to_dictionaries)
+        self.assertEqual(migrate(backend, backend.compression), 20)
+        with open(os.path.join(self.folder.name, "0.json"), 'rb') as file:
+            self.assertEqual(file.read()[:4], compression_module.ZSTD_MAGIC)
+
+        # Another process loads the dictionary from the disk.
+        backend.compression = Compression({'extract': 'zstd'}, path_to_dictionaries)
+        self.assertIn('extract', backend.compression.dictionaries)
+        self.assertEqual(backend.read('extract', "3"), _document(3))
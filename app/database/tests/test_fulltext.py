@@ -0,0 +1,79 @@
+import os
+import tempfile
+from unittest import TestCase
+from app.database.fulltext import FullTextIndex
+
+
+def _text(*chapters):
+    return {'abstract': None,
+            'chapters': [{'paragraphs': [{'sentences': [{'text': sentence, 'words': []} for sentence in paragraph]}
+                                         for paragraph in chapter]} for chapter in chapters]}
+
+
+class TestFullTextIndex(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.index = FullTextIndex(os.path.join(self.folder.name, "fulltext.sqlite3"))
+        self.index.index_document("1", _text([["The sliding velocity was 0.1 m/s.", "A steel counterbody was used."]],
+                                             [["Friction increases with the sliding velocity."]]),
+                                  [{'id': 0, 'labels': ["steel counterbody", "100Cr6"]}])
+        self.index.index_document("2", _text([["The velocity of sliding was low.", "No counterbody was used."]]))
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_database_is_created_on_first_use(self):
+        path = os.path.join(self.folder.name, "new", "fulltext.sqlite3")
+        index = FullTextIndex(path)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(index.search('velocity'), [])
+        self.assertTrue(os.path.isfile(path))
+
+    def test_phrase_and_ranking(self):
+        hits = self.index.search('"sliding velocity"')
+        self.assertEqual(sorted((_['document_id'], _['chapter'], _['sentence']) for _ in hits), [("1", 0, 0), ("1", 1, 0)])
+        hits = self.index.search('which papers mention sliding velocity with a steel counterbody', level='document')
+        self.assertEqual([_['document_id'] for _ in hits], ["1", "2"])
+        self.assertEqual(self.index.search('"counterbody steel"'), [])
+
+    def test_levels_and_labels(self):
+        hits = self.index.search('100cr6')
+        self.assertEqual(hits, [{'document_id': "1", 'score': hits[0]['score'], 'text': "steel counterbody, 100Cr6",
+                                 'knowledgeObject_id': 0, 'chapter': None, 'paragraph': None, 'sentence': None}])
+        hits = self.index.search('velocity', level='chapter')
+        self.assertEqual(sorted((_['document_id'], _['chapter']) for _ in hits), [("1", 0), ("1", 1), ("2", 0)])
+        self.assertNotIn('paragraph', hits[0])
+
+    def test_words_and_updates(self):
+        sentence = {'text': "The samples were polished.",
+                    'words': [{'text': "samples", 'normalized_text': "sample"},
+                              {'text': "polished", 'normalized_text': "polish"}]}
+        text = {'abstract': {'paragraphs': [{'sentences': [sentence]}]}, 'chapters': []}
+        self.assertTrue(self.index.index_document("2", text))
+        self.assertFalse(self.index.index_document("2", text))
+        self.assertEqual([(_['document_id'], _['chapter']) for _ in self.index.search('"sample polish"')], [("2", -1)])
+        self.assertEqual(self.index.search('counterbody', level='document')[0]['document_id'], "1")
+        self.index.delete_document("1")
+        self.assertEqual(self.index.search('velocity'), [])
+
+    def _units(self, doc_id):
+        return dict(self.index._connection().execute("SELECT unit, text FROM units WHERE doc = ?", (doc_id,)))
+
+    def test_only_changed_units_are_indexed(self):
+        text = _text([["The sliding velocity was 0.1 m/s.", "A steel counterbody was used."]],
+                     [["Friction increases with the sliding velocity."]])
+        before = self._units("1")
+        self.assertTrue(self.index.index_document("1", text, [{'id': 0, 'labels': ["steel counterbody", "AISI 52100"]}]))
+        after = self._units("1")
+        self.assertEqual([before[_] for _ in set(before) - set(after)], ["steel counterbody, 100Cr6"])
+        self.assertEqual(len(set(after) - set(before)), 1)
+        self.assertEqual(self.index.search('100cr6'), [])
+        self.assertEqual(self.index.search('52100')[0]['knowledgeObject_id'], 0)
+
+    def test_background_updates(self):
+        self.index.submit("3", lambda: (_text([["Brass was tested."]]), []))
+        self.index.submit("4", lambda: (_text([["Brass was tested."]]), []))
+        self.index.discard("4")
+        self.assertTrue(self.index.flush(timeout=5))
+        self.assertEqual([_['document_id'] for _ in self.index.search('brass')], ["3"])
@@ -0,0 +1,61 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from app.database.history import VersionHistory, apply_patch, make_patch
+
+
+class TestPatch(TestCase):
+
+    def test_round_trip(self):
+        old = {'text': {'chapters': [{'p': ["a", "b", "c"]}, {'p': ["d"]}], 'title': "x/y~"}, 'tables': [1, 2]}
+        new = {'text': {'chapters': [{'p': ["a", "c"]}, {'p': ["d", "e"]}, {'p': []}]}, 'images': [], 'tables': [2]}
+        patch = make_patch(old, new)
+        self.assertEqual(apply_patch(old, patch), new)
+        self.assertEqual(old['tables'], [1, 2])
+        self.assertEqual(make_patch(new, new), [])
+
+
+class TestVersionHistory(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.history = VersionHistory(os.path.join(self.folder.name, "history.sqlite3"), snapshot_interval=3)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_database_is_created_on_first_use(self):
+        path = os.path.join(self.folder.name, "new", "history.sqlite3")
+        history = VersionHistory(path)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(history.get_versions('annotate', "1"), [])
+        self.assertTrue(os.path.isfile(path))
+
+    def test_snapshots_and_deltas(self):
+        document = {'id': "1", 'words': [str(_) for _ in range(50)]}
+        versions = [document]
+        for num in range(5):
+            document = dict(document, words=document['words'][:num] + ["edit"] + document['words'][num + 1:])
+            self.assertEqual(self.history.record('annotate', "1", versions[-1], document), num + 1)
+            versions.append(document)
+        self.assertIsNone(self.history.record('annotate', "1", document, document))
+
+        kinds = [_['kind'] for _ in self.history.get_versions('annotate', "1")]
+        self.assertEqual(kinds, ['snapshot', 'delta', 'delta', 'snapshot', 'delta', 'delta'])
+        for num, version in enumerate(versions):
+            self.assertEqual(self.history.get('annotate', "1", num), version)
+        self.assertEqual(self.history.diff('annotate', "1", 4, 5), [{'op': 'replace', 'path': '/words/4', 'value': "edit"}])
+        self.assertIsNone(self.history.get('annotate', "1", 6))
+
+    def test_background_versions_use_the_last_version(self):
+        document = {'id': "1", 'words': [str(_) for _ in range(50)]}
+        self.history.record('annotate', "1", None, document)
+        with patch.object(VersionHistory, '_get', side_effect=AssertionError):
+            for num in range(2):
+                document = dict(document, words=["edit"] + document['words'][1:], num=num)
+                self.history.submit('annotate', "1", None, json.dumps(document))
+            self.assertTrue(self.history.flush(timeout=5))
+        self.assertEqual([_['kind'] for _ in self.history.get_versions('annotate', "1")], ['snapshot', 'delta', 'delta'])
+        self.assertEqual(self.history.get('annotate', "1", 2), document)
@@ -0,0 +1,76 @@
+import os
+import tempfile
+from unittest import TestCase
+from app.database.index import Index
+
+
+class TestIndex(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "indexes/extracted.json")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_journal_is_replayed(self):
+        index = Index(self.path)
+        index.add_id("1", "/tmp/1.json", "1.pdf")
+        index.add_id("2", "/tmp/2.json", "2.pdf")
+        index.update_index("1", "/tmp/1b.json")
+        index.del_id("2")
+        index.save_index()
+
+        reloaded = Index(self.path)
+        self.assertEqual(list(reloaded.data), ["1"])
+        self.assertEqual(reloaded.data["1"].path, "/tmp/1b.json")
+        self.assertEqual(reloaded.data["1"].name, "1.pdf")
+
+    def test_files_are_created_on_the_first_write(self):
+        index = Index(self.path)
+        index.save_index()
+        self.assertEqual(index.data, {})
+        self.assertFalse(os.path.isdir(os.path.dirname(self.path)))
+        index.add_id("1", "/tmp/1.json", "1.pdf")
+        self.assertEqual(list(Index(self.path).data), ["1"])
+
+    def test_torn_write_keeps_previous_records(self):
+        index = Index(self.path)
+        index.add_id("1", "/tmp/1.json", "1.pdf")
+        with open(index.journal.path_to_journal, 'a') as journal:
+            journal.write('{"op": "put", "id": "2", "val')
+
+        reloaded = Index(self.path)
+        self.assertEqual(list(reloaded.data), ["1"])
+        reloaded.add_id("3", "/tmp/3.json", "3.pdf")
+        self.assertEqual(list(Index(self.path).data), ["1", "3"])
+
+    def test_compaction(self):
+        index = Index(self.path)
+        index.journal.max_records = 3
+        for num in range(5):
+            index.add_id(str(num), f"/tmp/{num}.json", f"{num}.pdf")
+        index.save_index(background=True)
+        index.journal.wait()
+        index.add_id("5", "/tmp/5.json", "5.pdf")
+
+        self.assertTrue(os.path.isfile(self.path))
+        self.assertFalse(os.path.isfile(index.journal.path_to_old_journal))
+        self.assertEqual(index.journal.records_in_journal, 1)
+        self.assertEqual(list(Index(self.path).data), [str(_) for _ in range(6)])
+
+    def test_changes_of_other_workers(self):
+        worker_a = Index(self.path)
+        worker_b = Index(self.path)
+        worker_a.add_id("1", "/tmp/1.json", "1.pdf")
+        worker_b.add_id("2", "/tmp/2.json", "2.pdf")
+        worker_a.update_index("2", "/tmp/2b.json")
+        self.assertEqual(worker_b.data["2"].path, "/tmp/2b.json")
+        self.assertEqual(worker_b.data["2"].version, 1)
+
+        worker_a.journal.max_records = 1
+        worker_a.save_index(background=False)
+        worker_b.del_id("1")
+        self.assertEqual(list(worker_a.data), ["2"])
+        self.assertEqual(list(worker_b.data), ["2"])
+        self.assertEqual(list(Index(self.path).data), ["2"])
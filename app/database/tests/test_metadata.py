@@ -0,0 +1,64 @@
+import os
+import tempfile
+from unittest import TestCase
+from app.database.metadata import MetadataIndex
+
+
+def _metadata(doi, title, authors, journal='Wear', issn='0043-1648'):
+    return {'doi': doi, 'issn': issn, 'title': title, 'subtitle': '', 'journal': journal, 'publisher': 'Elsevier',
+            'authors': [{'first_name': first, 'last_name': last} for first, last in authors]}
+
+
+class TestMetadataIndex(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "indexes/metadata.json")
+        self.index = MetadataIndex(self.path)
+        self.index.put("1", _metadata("10.1016/j.wear.2020.1", "Friction of steel at high sliding velocity",
+                                      [("Jürgen", "Schmidt"), ("Anna", "Meyer")]))
+        self.index.put("2", _metadata("10.1016/j.wear.2020.2", "Wear of polymers", [("Anna", "Müller")],
+                                      journal='Tribology International', issn='0301-679X'))
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_exact_lookups(self):
+        self.assertEqual(self.index.find(doi="https://doi.org/10.1016/J.WEAR.2020.1"), ["1"])
+        self.assertEqual(self.index.find(issn="0043 1648"), ["1"])
+        self.assertEqual(self.index.find(doi="10.1016/j.wear"), [])
+
+    def test_prefix_lookups(self):
+        self.assertEqual(self.index.find(title="fric STEEL"), ["1"])
+        self.assertEqual(self.index.find(author="anna"), ["1", "2"])
+        self.assertEqual(self.index.find(author="mull"), ["2"])
+        self.assertEqual(self.index.find(author="juergen"), [])
+        self.assertEqual(self.index.find(author="jurgen schm", journal="wear"), ["1"])
+        self.assertEqual(self.index.find(author="anna", journal="tribology"), ["2"])
+        self.assertEqual(self.index.find(), [])
+
+    def test_update_and_delete(self):
+        self.index.put("2", _metadata("10.1016/j.wear.2020.2", "Wear of ceramics", [("Anna", "Müller")]))
+        self.assertEqual(self.index.find(title="polymers"), [])
+        self.assertEqual(self.index.find(title="ceram"), ["2"])
+        self.index.delete("1")
+        self.assertEqual(self.index.find(author="anna"), ["2"])
+
+        reloaded = MetadataIndex(self.path)
+        self.assertEqual(reloaded.find(title="ceram"), ["2"])
+        self.assertIsNone(reloaded.get("1"))
+
+    def test_changes_of_other_workers(self):
+        worker = MetadataIndex(self.path)
+        # The changes are applied to the indexes of the worker, they are not built again.
+        worker._build = None
+        self.index.put("3", _metadata("10.1016/j.wear.2020.3", "Wear of brass", [("Jan", "Berg")]))
+        self.index.delete("2")
+        self.assertEqual(worker.find(title="wear"), ["3"])
+        self.assertEqual(worker.find(author="berg"), ["3"])
+
+        # After a compaction of another worker the records are loaded again.
+        self.index.put("4", _metadata("10.1016/j.wear.2020.4", "Friction of brass", [("Jan", "Berg")]))
+        self.index.journal.compact(self.index.records)
+        self.assertEqual(worker.find(title="brass"), ["3", "4"])
+        self.assertEqual(worker.find(doi="10.1016/j.wear.2020.4"), ["4"])
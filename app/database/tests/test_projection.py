@@ -0,0 +1,37 @@
+import json
+from unittest import TestCase
+from app.database.projection import load_fields
+from app.database.serialization import loads
+
+
+class TestLoadFields(TestCase):
+
+    def setUp(self):
+        self.data = {
+            "base64_file": "JVBERi0xLjQK" * 100,
+            "text": {"chapters": [{"paragraphs": [{"sentences": [{"text": "A \"quoted\" [text] {}"}]}]}]},
+            "tables": [[1, 2.5, -3e4], [], {}],
+            "images": [],
+            "file_name": "paper.pdf",
+            "flag": True,
+            "nothing": None,
+            "knowledgeObjects": [{"id": 1, "labels": ["steel", "}"]}]
+        }
+
+    def test_loads_only_the_requested_fields(self):
+        for content in [json.dumps(self.data), json.dumps(self.data, indent=2)]:
+            for fields in [["file_name"], ["knowledgeObjects", "tables"], ["nothing", "flag"], list(self.data)]:
+                self.assertEqual(load_fields(content, fields), {_: self.data[_] for _ in fields})
+
+    def test_missing_fields_are_left_out(self):
+        self.assertEqual(load_fields(json.dumps(self.data), ["file_name", "id"]), {"file_name": "paper.pdf"})
+
+
+class TestLoads(TestCase):
+
+    def test_documents_of_the_json_module(self):
+        content = json.dumps({"value": float('nan'), "limit": float('inf'), "text": "\ud800"})
+        data = loads(content)
+        self.assertNotEqual(data["value"], data["value"])
+        self.assertEqual(data["limit"], float('inf'))
+        self.assertEqual(data["text"], "\ud800")
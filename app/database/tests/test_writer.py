@@ -0,0 +1,117 @@
+import os
+import tempfile
+import threading
+from unittest import TestCase
+from app.database.backends import FileBackend
+from app.database.database import DataBase
+
+
+class Document:
+    def __init__(self, id, file_path, data):
+        self.id = id
+        self.file_name = f"{id}.pdf"
+        self.file_path = file_path
+        self.data = data
+
+    def to_json(self):
+        return self.data
+
+
+class CountingBackend(FileBackend):
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.batches = []
+
+    def write_many(self, items):
+        self.batches.append([element.id for _, element, _ in items])
+        super().write_many(items)
+
+
+class BlockingBackend(FileBackend):
+    ''' Fails the first writes and holds every write until it is released. '''
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.failures = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def write_many(self, items):
+        self.started.set()
+        self.release.wait()
+        if self.failures > 0:
+            self.failures -= 1
+            raise OSError("disk full")
+        super().write_many(items)
+
+
+class TestWriteBehindWriter(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.backend = CountingBackend({'annotate': os.path.join(self.folder.name, "indexes/annotated.json")})
+        self.db = DataBase(self.backend)
+        self.path = os.path.join(self.folder.name, "1.json")
+        self.db.add_file(Document("1", self.path, '{"version": 0}'), 'annotate')
+
+    def tearDown(self):
+        self.db.flush()
+        self.folder.cleanup()
+
+    def test_updates_are_coalesced(self):
+        for version in range(1, 6):
+            self.db.update_file(Document("1", self.path, f'{{"version": {version}}}'))
+            self.assertEqual(self.db.get_file('annotate', "1"), {"version": version})
+        self.assertTrue(self.db.flush(timeout=5))
+
+        self.assertEqual(self.backend.batches, [["1"], ["1"]])
+        with open(self.path) as file:
+            self.assertEqual(file.read(), '{"version": 5}')
+        self.assertEqual([_ for _ in os.listdir(self.folder.name) if _.endswith(".tmp")], [])
+
+    def test_deleted_files_are_not_written(self):
+        self.db.update_file(Document("1", self.path, '{"version": 1}'))
+        self.db.del_file_by_id("1", 'annotate')
+        self.assertTrue(self.db.flush(timeout=5))
+        self.assertFalse(os.path.isfile(self.path))
+
+
+class TestFailingWrites(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.backend = BlockingBackend({'upload': os.path.join(self.folder.name, "indexes/uploaded.json")})
+        self.db = DataBase(self.backend)
+        self.path = os.path.join(self.folder.name, "1.json")
+        self.db.add_file(Document("1", self.path, '{"version": 0}'), 'upload')
+
+    def tearDown(self):
+        self.backend.failures = 0
+        self.backend.release.set()
+        self.db.flush()
+        self.folder.cleanup()
+
+    def test_failed_writes_are_retried(self):
+        self.backend.failures = 1
+        self.db.update_file(Document("1", self.path, '{"version": 1}'))
+        with self.assertLogs('app.database.writer', 'ERROR'):
+            self.assertFalse(self.db.flush(timeout=5))
+        self.assertEqual(self.db.get_file('upload', "1"), {"version": 1})
+
+        self.assertTrue(self.db.flush(timeout=5))
+        with open(self.path) as file:
+            self.assertEqual(file.read(), '{"version": 1}')
+
+    def test_deletes_wait_for_running_writes(self):
+        self.backend.started.clear()
+        self.backend.release.clear()
+        self.db.update_file(Document("1", self.path, '{"version": 1}'))
+        self.assertTrue(self.backend.started.wait(5))
+        threading.Timer(0.1, self.backend.release.set).start()
+        self.db.del_file_by_id("1", 'upload')
+
+        self.assertTrue(self.db.flush(timeout=5))
+        self.assertFalse(os.path.isfile(self.path))
+        self.assertIsNone(self.db.get_file('upload', "1"))
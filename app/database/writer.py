@@ -0,0 +1,99 @@
+from __future__ import annotations
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from app.database.backends import StorageBackend
+from app.database.index import IndexElement
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindWriter:
+    ''' Writes updated documents in a background thread.
+
+    Updates of the same document that arrive while it waits to be written replace each other,
+    so only the last state is written. Pending documents stay visible through get_pending until
+    they are on the disk. A failed write stays pending and is retried with a growing backoff.
+    flush blocks until everything that was submitted before is written and reports failures.
+    '''
+
+    def __init__(self, backend: StorageBackend, delay: float = 0.2, max_backoff: float = 30):
+        self.backend: StorageBackend = backend
+        self.delay: float = delay
+        self.max_backoff: float = max_backoff
+        self.failures: int = 0
+        self._pending: Dict[Tuple[str, str], Tuple[IndexElement, str]] = {}
+        self._writing: Dict[Tuple[str, str], Tuple[IndexElement, str]] = {}
+        self._backoff: float = 0
+        self._condition = threading.Condition()
+        self._thread: threading.Thread = None
+
+    def submit(self, index: str, element: IndexElement, content: str) -> None:
+        ''' Schedules the document to be written. '''
+        with self._condition:
+            self._pending[(index, element.id)] = (element, content)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def get_pending(self, index: str, file_id: str) -> Optional[str]:
+        ''' Returns the content of a document that is not written yet. '''
+        with self._condition:
+            entry = self._pending.get((index, file_id))
+            return None if entry is None else entry[1]
+
+    def discard(self, index: str, file_id: str) -> None:
+        ''' Drops a pending update, e.g. because the document is deleted or replaced.
+
+        If the document is being written, the write is waited for, so it can not bring back the
+        document or overwrite what the caller writes next.
+        '''
+        with self._condition:
+            self._pending.pop((index, file_id), None)
+            self._condition.wait_for(lambda: (index, file_id) not in self._writing)
+
+    def flush(self, timeout: float = None) -> bool:
+        ''' Waits until all pending documents are written.
+
+        Returns False if a write failed meanwhile (the documents stay pending) or on the timeout.
+        '''
+        with self._condition:
+            failures = self.failures
+            # Retry failed writes now instead of after the backoff.
+            self._backoff = 0
+            self._condition.notify_all()
+            self._condition.wait_for(lambda: (len(self._pending) == 0 and len(self._writing) == 0) or
+                                     (self.failures > failures and len(self._writing) == 0), timeout)
+            return len(self._pending) == 0 and len(self._writing) == 0
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self._pending) > 0)
+                if self._backoff > 0:
+                    self._condition.wait_for(lambda: self._backoff == 0, self._backoff)
+            # Wait a moment, so quickly following updates of the same document are coalesced.
+            time.sleep(self.delay)
+            with self._condition:
+                batch = self._writing = dict(self._pending)
+            try:
+                self.backend.write_many([(index, element, content)
+                                         for (index, _), (element, content) in batch.items()])
+            except Exception:
+                logger.exception("Could not write the documents %s, they are retried.", list(batch))
+                with self._condition:
+                    self.failures += 1
+                    self._backoff = min(max(2 * self._backoff, self.delay), self.max_backoff)
+                    self._writing = {}
+                    self._condition.notify_all()
+                continue
+            with self._condition:
+                for key, entry in batch.items():
+                    # Keep entries that were updated again while they were written.
+                    if self._pending.get(key) is entry:
+                        del self._pending[key]
+                self._backoff = 0
+                self._writing = {}
+                self._condition.notify_all()
@@ -0,0 +1,198 @@
+from __future__ import annotations
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+from app.config import PATH_TO_TMP, TMP_MAX_SIZE, TMP_TTL
+from app.database.cleanup import CleanupReport, collect_tmp
+
+
+class Artifact:
+    ''' A temporary file: its size, when it was used last and how it is leased. '''
+    __slots__ = ('size', 'last_used', 'refs', 'pinned_until')
+
+    def __init__(self, size: int, last_used: float):
+        self.size: int = size
+        self.last_used: float = last_used
+        self.refs: int = 0
+        self.pinned_until: float = 0
+
+
+class ArtifactRegistry:
+    ''' Keeps track of the temporary files (pdfs, renditions, pages, downloads) in a folder.
+
+    Every artifact is created through the registry: it is written to a temporary file and moved
+    into place, a thread of the process creates it while the others wait. Artifacts that were not
+    used for ttl seconds are deleted, and once all artifacts need more than max_size bytes the
+    least recently used ones are deleted. A leased artifact is never deleted: a lease either holds
+    a reference until it is released or pins the artifact for some seconds, e.g. while a response
+    streams it. The files of other workers are found by scanning the folder before deleting.
+    '''
+
+    def __init__(self, folder: str, max_size: int, ttl: float):
+        self.folder: str = folder
+        self.max_size: int = max_size
+        self.ttl: float = ttl
+        self._entries: Optional[OrderedDict[str, Artifact]] = None
+        self._size: int = 0
+        self._lock = threading.RLock()
+        self._creating: Dict[str, threading.Lock] = {}
+
+    def path(self, name: str) -> str:
+        ''' Returns the path of an artifact, the name is relative to the folder (e.g. pages/x.png). '''
+        path = os.path.abspath(os.path.join(self.folder, name))
+        if not path.startswith(os.path.abspath(self.folder) + os.sep):
+            raise ValueError(f"Invalid artifact: {name}")
+        return path
+
+    def touch(self, name: str, pin: float = 0) -> bool:
+        ''' Checks if the artifact exists and marks it as used (and pins it for pin seconds). '''
+        path = self.path(name)
+        try:
+            os.utime(path)
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(path)
+            return False
+        with self._lock:
+            self._use(path, size, pin)
+        return True
+
+    def get(self, name: str, create: Callable[[], bytes], pin: float = 0) -> str:
+        ''' Returns the path of the artifact, create returns its content if it does not exist yet. '''
+        if self.touch(name, pin):
+            return self.path(name)
+        with self._lock:
+            lock = self._creating.setdefault(name, threading.Lock())
+        try:
+            with lock:
+                if not self.touch(name, pin):
+                    self.put(name, create(), pin)
+        finally:
+            with self._lock:
+                self._creating.pop(name, None)
+        return self.path(name)
+
+    def put(self, name: str, data: bytes, pin: float = 0) -> str:
+        ''' Stores the artifact, replaces an existing one and returns its path. '''
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        finally:
+            if os.path.isfile(tmp):
+                os.remove(tmp)
+        with self._lock:
+            self._use(path, len(data), pin)
+            if self._size > self.max_size:
+                self.evict(keep=path)
+        return path
+
+    @contextmanager
+    def lease(self, name: str, create: Callable[[], bytes] = None) -> Iterator[str]:
+        ''' Holds a reference to the artifact, it is not deleted until the lease is released. '''
+        path = self.get(name, create) if create is not None else self.path(name)
+        with self._lock:
+            entry = self._use(path, os.path.getsize(path), 0)
+            entry.refs += 1
+        try:
+            yield path
+        finally:
+            with self._lock:
+                entry.refs -= 1
+
+    def _use(self, path: str, size: int, pin: float) -> Artifact:
+        entries = self._get_entries()
+        now = time.time()
+        entry = entries.get(path)
+        if entry is None:
+            entry = entries[path] = Artifact(size, now)
+            self._size += size
+        else:
+            self._size += size - entry.size
+            entry.size, entry.last_used = size, now
+            entries.move_to_end(path)
+        entry.pinned_until = max(entry.pinned_until, now + pin)
+        return entry
+
+    def _forget(self, path: str) -> None:
+        entry = self._get_entries().pop(path, None)
+        if entry is not None:
+            self._size -= entry.size
+
+    def _get_entries(self) -> OrderedDict[str, Artifact]:
+        ''' Returns the artifacts, the least recently used first. The folder is scanned on the first use. '''
+        if self._entries is None:
+            self._entries = OrderedDict()
+            self._size = 0
+            self._scan()
+        return self._entries
+
+    def _scan(self) -> None:
+        ''' Adds the artifacts of other workers and drops the ones that were deleted. '''
+        found: Dict[str, os.stat_result] = {}
+        for root, _, files in os.walk(self.folder):
+            for file_name in files:
+                if not file_name.startswith(".") and not file_name.endswith(".tmp"):
+                    path = os.path.join(root, file_name)
+                    try:
+                        found[path] = os.stat(path)
+                    except FileNotFoundError:
+                        pass
+        entries = self._entries
+        for path in [_ for _ in entries if _ not in found]:
+            self._forget(path)
+        for path, stat in found.items():
+            entry = entries.get(path)
+            last_used = max(stat.st_atime, stat.st_mtime)
+            if entry is None:
+                entries[path] = Artifact(stat.st_size, last_used)
+                self._size += stat.st_size
+            else:
+                entry.last_used = max(entry.last_used, last_used)
+        for path in sorted(entries, key=lambda _: entries[_].last_used):
+            entries.move_to_end(path)
+
+    def leased(self) -> List[str]:
+        ''' Returns the paths of the artifacts that must not be deleted now. '''
+        now = time.time()
+        with self._lock:
+            return [path for path, entry in self._get_entries().items() if entry.refs > 0 or entry.pinned_until > now]
+
+    def evict(self, keep: str = None) -> CleanupReport:
+        ''' Deletes the expired artifacts and the least recently used ones above the size budget. '''
+        report = CleanupReport()
+        with self._lock:
+            entries = self._get_entries()
+            self._scan()
+            now = time.time()
+            for path, entry in list(entries.items()):
+                if self._size <= self.max_size and now - entry.last_used <= self.ttl:
+                    continue
+                if path == keep or entry.refs > 0 or entry.pinned_until > now:
+                    continue
+                self._forget(path)
+                try:
+                    report.freed_bytes += os.path.getsize(path)
+                    os.remove(path)
+                    report.tmp_files.append(path)
+                except FileNotFoundError:
+                    pass
+        return report
+
+    def sweep(self, dry_run: bool = False) -> CleanupReport:
+        ''' Deletes the expired artifacts and the oldest ones above the size budget, e.g. at the start. '''
+        with self._lock:
+            report = collect_tmp(self.folder, self.ttl, self.max_size, dry_run, keep=self.leased())
+            self._scan()
+        return report
+
+
+artifacts = ArtifactRegistry(PATH_TO_TMP, TMP_MAX_SIZE, TMP_TTL)
@@ -0,0 +1,62 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple, Type, TypeVar
+from pydantic import BaseModel
+from pydantic.fields import ModelField, SHAPE_LIST
+
+Model = TypeVar('Model', bound=BaseModel)
+
+# How to build a field: (name, alias, required, field, nested model, is a list of it)
+_Plan = List[Tuple[str, str, bool, ModelField, Optional[Type[BaseModel]], bool]]
+_plans: Dict[Type[BaseModel], _Plan] = {}
+
+
+def _nested_model(field: ModelField) -> Optional[Type[BaseModel]]:
+    ''' Returns the model a field holds, for unions the first model (pydantic tries them in order). '''
+    sub_fields = field.sub_fields or []
+    if field.shape == SHAPE_LIST and len(sub_fields) == 1:
+        sub_fields = sub_fields[0].sub_fields or []
+    for type_ in [_.type_ for _ in sub_fields] or [field.type_]:
+        if isinstance(type_, type) and issubclass(type_, BaseModel):
+            return type_
+    return None
+
+
+def _plan(model: Type[BaseModel]) -> _Plan:
+    plan = _plans.get(model)
+    if plan is None:
+        plan = [(name, field.alias, field.required, field, _nested_model(field), field.shape == SHAPE_LIST)
+                for name, field in model.__fields__.items()]
+        _plans[model] = plan
+    return plan
+
+
+def construct(model: Type[Model], data: Dict[str, Any]) -> Model:
+    ''' Builds a model and all nested models from trusted data without validating them.
+
+    The data has to be the output of dict() or json() of the same model, e.g. a document the
+    database stored. The fields are set in the order of the model and missing fields get their
+    default, so the result serializes exactly like a validated model.
+    '''
+    values = {}
+    fields_set = set()
+    for name, alias, required, field, nested, is_list in _plan(model):
+        if name in data:
+            value = data[name]
+        elif alias in data:
+            value = data[alias]
+        else:
+            if not required:
+                values[name] = field.get_default()
+            continue
+        fields_set.add(name)
+        if nested is not None and value is not None:
+            if is_list:
+                value = [construct(nested, _) if isinstance(_, dict) else _ for _ in value]
+            elif isinstance(value, dict):
+                value = construct(nested, value)
+        values[name] = value
+    instance = model.__new__(model)
+    object.__setattr__(instance, '__dict__', values)
+    object.__setattr__(instance, '__fields_set__', fields_set)
+    instance._init_private_attributes()
+    return instance
@@ -1,17 +1,22 @@
 from __future__ import annotations
 
-import time
+import hashlib
+import json
+from array import array
 
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, Field, PrivateAttr, validator
 from typing import List, Union, Tuple, Optional
-from segtok.segmenter import split_single
 from base64 import urlsafe_b64decode, urlsafe_b64encode
-import fitz
-import os
-from PIL import Image as pilImage
 import PIL as pil
-from io import BytesIO
-from app.config import PATH_TO_APP, PATH_TO_TMP
+from app.database.blobs import blob_store
+from app.internal.artifacts import artifacts
+from app.internal.construct import construct
+from app.internal.pages import mark_texts, pages
+from app.internal.renditions import renditions
+from app.internal.segmentation import segmenter
+from app.internal.tables import TableStore
+from app.internal.textview import TextView
+from app.internal.tokens import TokenStore, split_words
 from typing import Dict
 
 
@@ -20,6 +25,46 @@ class OptionSelection(BaseModel):
     mode: str
 
 
+class BinaryFile(BaseModel):
+    ''' A model with a binary file, either inline as base64 or as a reference into the blob store. '''
+    base64_file: str = Field(default='', description="The file in an base64 format.")
+    blob_ref: str = Field(default='', description="The SHA-256 reference of the file in the blob store.")
+    # The base64 file and its hash, if the file is not in the blob store.
+    _content_hash: Optional[Tuple[str, str]] = PrivateAttr(default=None)
+
+    def decode_file(self) -> bytes:
+        ''' Decodes the binary (base64) file or loads it from the blob store. '''
+        if self.blob_ref != '':
+            return blob_store.get(self.blob_ref)
+        return urlsafe_b64decode(self.base64_file.encode('utf-8'))
+
+    def get_base64_file(self) -> str:
+        ''' Returns the file in an base64 format. '''
+        if self.base64_file == '' and self.blob_ref != '':
+            return urlsafe_b64encode(self.decode_file()).decode('utf-8')
+        return self.base64_file
+
+    def get_content_hash(self) -> str:
+        ''' Returns the SHA-256 hash of the file, which is the reference of the file in the blob store. '''
+        if self.blob_ref != '':
+            return self.blob_ref
+        if self._content_hash is None or self._content_hash[0] is not self.base64_file:
+            self._content_hash = (self.base64_file, hashlib.sha256(self.decode_file()).hexdigest())
+        return self._content_hash[1]
+
+    def store_file(self) -> None:
+        ''' Moves the base64 file into the blob store and keeps only the reference. '''
+        if self.base64_file != '':
+            self.blob_ref = blob_store.put(urlsafe_b64decode(self.base64_file.encode('utf-8')))
+            self.base64_file = ''
+
+    def load_file(self) -> None:
+        ''' Inlines the file from the blob store as base64, e.g. for a self-contained export. '''
+        if self.blob_ref != '':
+            self.base64_file = self.get_base64_file()
+            self.blob_ref = ''
+
+
 class Word(BaseModel):
     id: int
     text: str
@@ -62,6 +107,56 @@ class KnowledgeObjectList(BaseModel):
     knowledgeObjects: List[KnowledgeObject]
 
 
+class KnowledgeObjectIndex:
+    ''' Lookups over the knowledge objects and annotations of a document.
+
+    Maps ids to knowledge objects and annotations, annotations to the knowledge objects that
+    contain them and labels to knowledge objects. The document keeps it up to date for its
+    own kObj operations and rebuilds it if the lists were replaced.
+    '''
+
+    def __init__(self, knowledgeObjects: List[KnowledgeObject], annotations: List[Annotation]):
+        self.knowledgeObjects: List[KnowledgeObject] = knowledgeObjects
+        self.annotations: List[Annotation] = annotations
+        self.kObjs: Dict[int, KnowledgeObject] = {}
+        self.kObjs_by_annotation: Dict[int, set] = {}
+        self.kObjs_by_label: Dict[str, set] = {}
+        self.annotation_by_id: Dict[int, Annotation] = {_.id: _ for _ in annotations}
+        self.annotation_positions: Dict[int, int] = {_.id: num for num, _ in reversed(list(enumerate(annotations)))}
+        self._annotation_texts: Dict[int, str] = {}
+        self.max_id: int = -1
+        for kObj in knowledgeObjects:
+            self.add(kObj)
+
+    def is_valid_for(self, doc: 'Document') -> bool:
+        return doc.knowledgeObjects is self.knowledgeObjects and doc.annotations is self.annotations and \
+            len(doc.knowledgeObjects) == len(self.kObjs)
+
+    def add(self, kObj: KnowledgeObject) -> None:
+        self.kObjs[kObj.id] = kObj
+        self.max_id = max(self.max_id, kObj.id)
+        for annotation_id in kObj.annotation_ids:
+            self.kObjs_by_annotation.setdefault(annotation_id, set()).add(kObj.id)
+        for label in kObj.labels:
+            self.kObjs_by_label.setdefault(label, set()).add(kObj.id)
+
+    def discard(self, kObj: KnowledgeObject) -> None:
+        ''' Removes the kObj from the lookups (not from the list of the document). '''
+        self.kObjs.pop(kObj.id, None)
+        for annotation_id in kObj.annotation_ids:
+            self.kObjs_by_annotation.get(annotation_id, set()).discard(kObj.id)
+        for label in kObj.labels:
+            self.kObjs_by_label.get(label, set()).discard(kObj.id)
+
+    def annotation_text(self, annotation_id: int) -> str:
+        ''' Returns the text of the words of an annotation, joined once and cached. '''
+        text = self._annotation_texts.get(annotation_id)
+        if text is None:
+            annotation = self.annotation_by_id[annotation_id]
+            text = self._annotation_texts[annotation_id] = " ".join([_.text for _ in annotation.words])
+        return text
+
+
 class Answer(BaseModel):
     ''' A single answer of the context analysis. '''
     pass
@@ -80,10 +175,46 @@ class Author(BaseModel):
 class Sentence(BaseModel):
     words: List[Word] = Field(default=[])
     text: str
+    # The token store and the range of the words, if the words were not built yet.
+    _tokens: Optional[Tuple[TokenStore, int, int]] = PrivateAttr(default=None)
 
     def __str__(self) -> str:
         return self.text
 
+    def set_tokens(self, store: TokenStore, start: int, end: int) -> None:
+        ''' Keeps the words in the token store, they are built on the first access of words. '''
+        self.__dict__.pop('words', None)
+        self._tokens = (store, start, end)
+
+    def __getattr__(self, name: str):
+        if name == 'words' and self._tokens is not None:
+            store, start, end = self._tokens
+            self.__dict__['words'] = [Word.construct(**_) for _ in store.to_dicts(start, end)]
+            self._tokens = None
+            return self.__dict__['words']
+        raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{name}'")
+
+    def get_annotation_ids(self) -> List[int]:
+        ''' Returns the annotation ids of the words without building the words. '''
+        if 'words' not in self.__dict__ and self._tokens is not None:
+            store, start, end = self._tokens
+            return store.get('annotation_id', start, end)
+        return [_.annotation_id for _ in self.words]
+
+    def _iter(self, to_dict: bool = False, **kwargs):
+        if 'words' in self.__dict__ or self._tokens is None:
+            yield from super()._iter(to_dict=to_dict, **kwargs)
+            return
+        if not to_dict or kwargs.get('include') is not None or kwargs.get('exclude') is not None:
+            self.words
+            yield from super()._iter(to_dict=to_dict, **kwargs)
+            return
+        # Serializing the words straight from the token store is lossless and skips the Word models.
+        store, start, end = self._tokens
+        if start != end or not kwargs.get('exclude_defaults'):
+            yield 'words', store.to_dicts(start, end)
+        yield from super()._iter(to_dict=to_dict, **kwargs)
+
 
 class Paragraph(BaseModel):
     sentences: List[Sentence] = Field(default=[])
@@ -100,38 +231,31 @@ class Chapter(BaseModel):
 
     def get_text(self) -> str:
         """ Returns the text of the chapter """
+        return "".join([sentence.text + " " for paragraph in self.paragraphs for sentence in paragraph.sentences])
+
+    def get_first_sentence_key(self) -> str:
+        """ Returns the text up to the first period, lower case and without spaces. """
         res = ""
         for paragraph in self.paragraphs:
             for sentence in paragraph.sentences:
                 res += sentence.text + " "
-        return res
-
-    def get_chapter_as_pdf(self, document: 'Document'):
-        ''' Gets the chapter as pdf. '''
-        has_page_position: bool = len(self.pages) > 0
-        if has_page_position:
+                if "." in sentence.text:
+                    return res.split(".")[0].lower().replace(" ", "")
+        return res.lower().replace(" ", "")
 
-            path_to_chapter: str = os.path.join(os.get_cwd(), f"static/tmp/document/{id(self)}.pdf")
+    def get_chapter_as_pdf(self, document: 'Document', pin: float = 0) -> str:
+        ''' Returns the path to a pdf with the pages of the chapter in which the chapter is highlighted. '''
+        return document.get_chapters_as_pdf([self], pin)[0]
 
-            # Create a new PDF for the area in which the chapter is
-            new_doc = fitz.open(path_to_chapter)
-            pdf = fitz.open(stream=document.decode_file(), filetype='pdf')
-            new_doc.insertPDF(pdf, from_page=min(self.pages), to_page=max(self.pages))
-
-            # mark the relevant area of the pages
-            new_doc = self._mark_relevant_area(new_doc)
-
-            # save it at the path
-            new_doc.save(path_to_chapter)
-
-        else:
-            path_to_chapter = document.get_path_to_file()
-
-        return path_to_chapter
+    def get_slice_key(self) -> str:
+        ''' Returns a key that changes with the pages and the sentences of the chapter. '''
+        data = json.dumps([self.pages, [sentence.text for paragraph in self.paragraphs
+                                        for sentence in paragraph.sentences]])
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()[:24]
 
     def _mark_relevant_area(self, document):
-        ''' Marks the relevant area of the file. '''
-        # todo: Implement the marking function
+        ''' Highlights the sentences of the chapter on its pages. '''
+        mark_texts(document, [sentence.text for paragraph in self.paragraphs for sentence in paragraph.sentences])
         return document
 
     def __str__(self) -> str:
@@ -148,17 +272,53 @@ class Text(BaseModel):
     title: str = Field(default="")
     authors: List[Author] = Field(default=[])
 
+    def get_view(self) -> TextView:
+        """ Returns the full text and the offset map of the text.
+
+        The view is built from the current text, cached views are kept by the database for the
+        version of the document (see DataBase.get_text_view).
+        """
+        return TextView(self)
+
+    def iter_sentences(self):
+        ''' Iterates over the sentences of the abstract and the chapters. '''
+        for chapter in [self.abstract] + self.chapters:
+            if chapter is not None:
+                for paragraph in chapter.paragraphs:
+                    yield from paragraph.sentences
+
     def update_text(self, text: str, doc) -> None:
-        """ Updates the text of the document. """
+        """ Updates the text of the document.
+
+        Only the paragraphs that changed are segmented again, the unchanged paragraphs are
+        reused together with their sentences and words.
+        """
+        # The paragraphs by their text, a text can occur several times. The lines of the full
+        # text end with a space, so trailing spaces are ignored.
+        old_paragraphs: Dict[str, List[Paragraph]] = {}
+        for chapter in self.chapters:
+            for paragraph in chapter.paragraphs:
+                old_paragraphs.setdefault(str(paragraph).rstrip(" "), []).append(paragraph)
 
         # Update the chapter text
-        _chapters = text.split("---\n\n")
+        _chapters = [_.rstrip("\n").rstrip("-").lstrip("\n").split("\n") for _ in text.split("---\n\n")]
+        # The full text ends with a separator, the empty rest after it is no chapter.
+        if len(_chapters) > 1 and _chapters[-1] == ['']:
+            _chapters.pop()
+        # The new and edited paragraphs are segmented together.
+        changed = [_ for chapter in _chapters for _ in chapter if _.rstrip(" ") not in old_paragraphs]
+        segmented = dict(zip(changed, segmenter.split_many(changed)))
         chapters = []
         for chapter in _chapters:
-            chapter = chapter.rstrip("\n").rstrip("-").lstrip("\n")
             paragraphs = []
-            for paragraph in chapter.split("\n"):
-                sentences = self.extractSentences(paragraph)
+            for paragraph in chapter:
+                reusable = old_paragraphs.get(paragraph.rstrip(" "))
+                if reusable:
+                    paragraphs.append(reusable.pop(0))
+                    continue
+                sentences = segmented.get(paragraph)
+                if sentences is None:
+                    sentences = self.extractSentences(paragraph)
                 sentences = [Sentence(text=sentence) for sentence in sentences]
 
                 # Check for empty sentences
@@ -166,39 +326,25 @@ class Text(BaseModel):
                 if len(sentences) > 0:
                     paragraphs.append(Paragraph(sentences=sentences))
 
-            chapters.append(Chapter(paragraphs=paragraphs))
+            # The paragraphs are already valid, validating them again would copy the reused ones.
+            chapters.append(Chapter.construct(paragraphs=paragraphs))
 
-        # Update the headers
+        # Update the headers, a chapter keeps the header (and the pages) of the first old chapter
+        # that starts with the same sentence.
+        headers: Dict[str, Chapter] = {}
         for chapter in self.chapters:
-            text = chapter.get_text()
-            first_sentence_in_chapter = text.split(".")[0].lower().replace(" ", "")
-            for _chapter in chapters:
-                if _chapter.header is None:
-                    text = _chapter.get_text()
-                    _first_sentence_in_chapter = text.split(".")[0].lower().replace(" ", "")
-                    if _first_sentence_in_chapter == first_sentence_in_chapter:
-                        _chapter.header = chapter.header
+            if chapter.header is not None:
+                headers.setdefault(chapter.get_first_sentence_key(), chapter)
+        for _chapter in chapters:
+            chapter = headers.get(_chapter.get_first_sentence_key())
+            if chapter is not None:
+                _chapter.header = chapter.header
+                _chapter.pages = list(chapter.pages)
 
         self.chapters = chapters
 
     def extractSentences(self, text):
-        sentences = []
-
-        zwerg = split_single(text)
-        for num, sentence in enumerate(zwerg):
-            sentence = sentence.rstrip()
-
-            if len(sentence) > 0 and len(sentences) > 0:
-                if sentences[-1][-1] != "." and num > 0:
-                    sentences[-1] += " " + sentence.lstrip()
-                    continue
-            if len(sentences) > 0 and num > 0:
-                if len(sentences[-1]) > 5:
-                    if sentences[-1][-6:] == "et al.":
-                        sentences[-1] += " " + sentence.lstrip()
-                        continue
-            sentences.append(sentence)
-        return sentences
+        return segmenter.split(text)
 
 
 class Header(BaseModel):
@@ -224,154 +370,146 @@ class Column(Line):
     type: str = Field(default='')
 
 
-class Table(BaseModel):
+class Table(BinaryFile):
     rows: List[Row] = Field(default=[])
     columns: List[Column] = Field(default=[])
     description: str = Field(default='')
     name: str = Field(default='')
-    base64_file: str = Field(default='')
     table_header: Union[Row, Column] = Field(default=None)
     units: List[str] = Field(default=[])
-
-    def update_table(self, data, doc) -> None:
-        ''' Updates the table according to the given data. '''
-
-        def mostly_numbers(text: str) -> bool:
-            """Checks if a text consits mostly of words"""
-            return [_.isdecimal() for _ in text].count(True) / len(text) >= 0.5
-
-        data = data['table']
-        _columns = [[] for i in range(len(data['0']))]
+    # The cells, if the rows and columns were not built yet.
+    _store: Optional[TableStore] = PrivateAttr(default=None)
+
+    def set_store(self, store: TableStore) -> None:
+        ''' Keeps the cells in the table store, the rows and columns are built on their first access. '''
+        self.__dict__.pop('rows', None)
+        self.__dict__.pop('columns', None)
+        self.__fields_set__.update(['rows', 'columns'])
+        self._store = store
+
+    def __getattr__(self, name: str):
+        if name in ('rows', 'columns') and self._store is not None:
+            self._build_lines()
+            return self.__dict__[name]
+        raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{name}'")
+
+    def __setattr__(self, name, value):
+        if name in ('rows', 'columns') and self._store is not None:
+            self._build_lines()
+        super().__setattr__(name, value)
+
+    def _build_lines(self) -> None:
+        ''' Builds the rows and the columns from the store, both share the same cells. '''
+        store = self._store
+        cells = [[Cell.construct(**store._cell(col, pos)) for pos in range(len(texts))]
+                 for col, texts in enumerate(store.texts)]
+        self.__dict__['rows'] = [Row.construct(cells=[cells[col][pos] for col, pos in row], type=type_)
+                                 for row, type_ in zip(store._positions(), store.row_types)]
+        self.__dict__['columns'] = [Column.construct(cells=column, type=type_)
+                                    for column, type_ in zip(cells, store.column_types)]
+        self._store = None
+
+    def _iter(self, to_dict: bool = False, **kwargs):
+        if self._store is None or 'rows' in self.__dict__:
+            yield from super()._iter(to_dict=to_dict, **kwargs)
+            return
+        if not to_dict or any(kwargs.get(_) for _ in ['by_alias', 'include', 'exclude', 'exclude_unset',
+                                                        'exclude_defaults', 'exclude_none']):
+            self._build_lines()
+            yield from super()._iter(to_dict=to_dict, **kwargs)
+            return
+        # Serializing the cells straight from the store skips the Cell models.
+        values = dict(super()._iter(to_dict=to_dict, **kwargs))
+        values['rows'] = self._store.row_dicts()
+        values['columns'] = self._store.column_dicts()
+        for name in self.__fields__:
+            if name in values:
+                yield name, values[name]
+
+    def get_values(self, column: int) -> array:
+        ''' Returns the numbers of a column, nan for cells that are no numbers. '''
+        return self._get_store().get_values(column)
+
+    def get_units(self, column: int) -> List[str]:
+        ''' Returns the units of the numbers of a column. '''
+        return self._get_store().get_units(column)
+
+    def _get_store(self) -> TableStore:
+        if self._store is not None:
+            return self._store
+        store = TableStore.from_dict({'rows': [_.dict() for _ in self.rows], 'columns': [_.dict() for _ in self.columns]})
+        if store is None:
+            store = TableStore.from_rows([[_.text for _ in row.cells] for row in self.rows])
+        return store
+
+    def set_cells(self, header: Optional[List[str]], rows: List[List[str]]) -> None:
+        ''' Replaces the cells, the header cells are WORDs, the other cells are typed as NUM or WORD.
+
+        The units are the most frequent unit of every column or the unit in its header, a column
+        without a unit keeps its previous unit.
+        '''
+        store = TableStore.from_rows(rows)
+        self.table_header = Row.construct(cells=[Cell.construct(text=_, type="WORD", category="WORD", annotation_ids=[])
+                                                 for _ in header]) if header is not None else None
+        self.set_store(store)
+        units = []
+        for num in range(len(store.texts)):
+            unit = store.get_column_unit(num, header[num] if header is not None and num < len(header) else '')
+            if unit == '' and num < len(self.units):
+                unit = self.units[num]
+            units.append(unit)
+        self.units = units if any(_ != '' for _ in units) else self.units
+
+    @staticmethod
+    def _split_rows(data: Dict, skip: int = 0) -> Tuple[Optional[List[str]], List[List[str]]]:
+        ''' Returns the header and the other rows of the edited table, the first skip cells of a row are dropped. '''
+        header = None
         rows = []
-        table_header = None
         for num_row, row in enumerate(data.values()):
             if len(row) == 0:
                 continue
+            if num_row == 0:
+                header = list(row[skip:])
             else:
-                _row = []
-                # If TableHeader
-                if num_row == 0:
-                    table_header = Row(cells=[Cell(text=_, type="WORD", category="WORD") for _ in row])
-                else:
-                    for num_col, _cell in enumerate(row):
-                        _type = "NUM" if mostly_numbers(_cell) else "WORD"
-                        cell = Cell(text=_cell, type=_type, category=_type)
-                        _columns[num_col].append(cell)
-                        _row.append(cell)
-                    rows.append(Row(cells=_row))
-        columns = []
-        for _column in _columns:
-            if len(_column) > 0:
-                columns.append(Column(cells=_column))
-        self.table_header = table_header
-        self.columns = columns
-        self.rows = rows
-
-    def decode_file(self) -> str:
-        ''' Decodes the binary (base64) file. '''
-        img_bytes: List[bytes] = urlsafe_b64decode(self.base64_file.encode('utf-8'))
-        return img_bytes
-
-    def get_path_to_file(self) -> str:
-        ''' Returns the path to the file. '''
+                rows.append(list(row[skip:]))
+        return header, rows
 
-        path_to_file: str = os.path.join(os.getcwd(), f"static/tmp/imgs/{id(self)}.png")
-
-        file_already_exists: bool = os.path.isfile(path_to_file)
-        if not file_already_exists:
-            img_bytes = self.decode_file()
-            img = pilImage.open(BytesIO(img_bytes))
-            img.save(path_to_file, 'png')
-
-        return f"../static/tmp/imgs/{id(self)}.png"
-
-    def __del__(self):
-        path_to_file: str = os.path.join(os.getcwd(), f"static/tmp/imgs/1{id(self)}.png")
+    def update_table(self, data, doc) -> None:
+        ''' Updates the table according to the given data. '''
+        self.set_cells(*self._split_rows(data['table']))
 
-        file_exits: bool = os.path.isfile(path_to_file)
-        if file_exits:
-            os.remove(path_to_file)
+    def get_path_to_file(self, spec: str = 'original') -> str:
+        ''' Returns the url of a rendition (original, thumbnail or webp-N) of the image. '''
+        return renditions.get(self.get_content_hash(), self.decode_file, spec)
 
 
-class Image(BaseModel):
-    base64_file: str = Field(default="", description="The image in an base64 format.")
+class Image(BinaryFile):
     description: str = Field(default='')
     name: str = Field(default='')
 
     def update_image(self, data, doc) -> None:
         ''' Updates the table according to the given data. '''
-
-        def mostly_numbers(text: str) -> bool:
-            """Checks if a text consits mostly of words"""
-            return [_.isdecimal() for _ in text].count(True) / len(text) >= 0.5
-
-        table_size = max([len(_) for _ in data.values()])
-        _columns = [[] for i in range(table_size)]
-        rows = []
-        table_header = None
-        for num_row, row in enumerate(data.values()):
-            if len(row) == 0:
-                continue
-            else:
-                _row = []
-                # If TableHeader
-                if num_row == 0:
-                    table_header = Row(cells=[Cell(text=_, type="WORD", category="WORD") for _ in row[1:]])
-                else:
-                    for num_col, _cell in enumerate(row[1:]):
-                        _type = "NUM" if mostly_numbers(_cell) else "WORD"
-                        cell = Cell(text=_cell, type=_type, category=_type)
-                        _columns[num_col].append(cell)
-                        _row.append(cell)
-                    rows.append(Row(cells=_row))
-        columns = []
-        for _column in _columns:
-            if len(_column) > 0:
-                columns.append(Column(cells=_column))
-
-        table = Table(rows=rows,
-                      columns=columns,
-                      table_header=table_header,
-                      base64_file=self.base64_file,
+        table = Table(base64_file=self.base64_file,
+                      blob_ref=self.blob_ref,
                       description=self.description
                       )
+        # The first cell of every row is the number of the row.
+        table.set_cells(*Table._split_rows(data, skip=1))
 
         doc.tables.append(table)
         doc.images.remove(self)
 
     def get_image(self):
-        return self.base64_file
-
-    def decode_file(self) -> str:
-        ''' Decodes the binary (base64) file. '''
-        img_bytes: List[bytes] = urlsafe_b64decode(self.base64_file.encode('utf-8'))
-        return img_bytes
-
-    def get_path_to_file(self) -> str:
-        ''' Returns the path to the file. '''
-
-        path_to_file: str = os.path.join(PATH_TO_TMP, f"imgs/{id(self)}.png")
-        print(path_to_file)
-        file_already_exists: bool = os.path.isfile(path_to_file)
-        if not file_already_exists:
-            img_bytes = self.decode_file()
-            img = pilImage.open(BytesIO(img_bytes))
-            img.save(path_to_file, 'png')
-            time.sleep(0.5)
+        return self.get_base64_file()
 
-        return f"../static/tmp/imgs/{id(self)}.png"
+    def get_path_to_file(self, spec: str = 'original') -> str:
+        ''' Returns the url of a rendition (original, thumbnail or webp-N) of the image. '''
+        return renditions.get(self.get_content_hash(), self.decode_file, spec)
 
     def convert_img_to_table(self, data) -> Table:
         ''' Converts the file to an table. '''
         pass
 
-    def __del__(self):
-        path_to_file: str = os.path.join(os.getcwd(), f"static/tmp/imgs/1{id(self)}.png")
-
-        file_exits: bool = os.path.isfile(path_to_file)
-        if file_exits:
-            os.remove(path_to_file)
-
 
 class Reference(BaseModel):
     doi: str = Field(default='')
@@ -496,34 +634,83 @@ class Metadata(BaseModel):
     doi: str = Field(default='')
 
 
-class Document(BaseModel):
+class Document(BinaryFile):
     ''' A Document is the '''
     text: Text = Field(default=None)
     tables: List[Table] = Field(default=[])
     images: List[Image] = Field(default=[])
     metadata: Metadata = Field(default=None)
-    base64_file: str = Field(default='')
     file_name: str = Field(default='')
     id: str = Field(alias="document_id")
     file_path: str = Field(default='')
     knowledgeObjects: List[KnowledgeObject] = Field(default=[])
     annotations: List[Annotation] = Field(default=[])
+    _kObj_index: Optional[KnowledgeObjectIndex] = PrivateAttr(default=None)
 
     class Config:
         allow_population_by_field_name = True
 
+    @classmethod
+    def load_columnar(cls, data: Dict, validate: bool = True) -> 'Document':
+        ''' Creates a document whose words are kept in a columnar token store and the cells of its tables in table stores.
+
+        Only the text without the words is validated, the words are built when a sentence
+        needs them. Without validate nothing is validated, which is only safe for documents
+        from the database, they were validated when they were stored.
+        '''
+        text, store, ranges = split_words(data.get('text'))
+        if text is not None:
+            data = dict(data, text=text)
+        tables = data.get('tables') or []
+        table_stores = [TableStore.from_dict(_) if isinstance(_, dict) else None for _ in tables]
+        if any(_ is not None for _ in table_stores):
+            data = dict(data, tables=[_ if table_store is None else dict(_, rows=[], columns=[])
+                                      for _, table_store in zip(tables, table_stores)])
+        doc = cls(**data) if validate else construct(cls, data)
+        if doc.text is not None:
+            for sentence, (start, end) in zip(doc.text.iter_sentences(), ranges):
+                sentence.set_tokens(store, start, end)
+        for table, table_store in zip(doc.tables, table_stores):
+            if table_store is not None:
+                table.set_store(table_store)
+        return doc
+
+    def get_kObj_index(self) -> KnowledgeObjectIndex:
+        ''' Returns the lookups over the kObjs and annotations, built on the first use. '''
+        if self._kObj_index is None or not self._kObj_index.is_valid_for(self):
+            self._kObj_index = KnowledgeObjectIndex(self.knowledgeObjects, self.annotations)
+        return self._kObj_index
+
+    def get_kObj(self, id: int) -> Optional[KnowledgeObject]:
+        return self.get_kObj_index().kObjs.get(int(id))
+
+    def get_kObjs_by_label(self, label: str) -> List[KnowledgeObject]:
+        index = self.get_kObj_index()
+        return [index.kObjs[_] for _ in sorted(index.kObjs_by_label.get(label, ()))]
+
+    def get_kObjs_by_annotation(self, annotation_id: int) -> List[KnowledgeObject]:
+        index = self.get_kObj_index()
+        return [index.kObjs[_] for _ in sorted(index.kObjs_by_annotation.get(annotation_id, ()))]
+
+    @staticmethod
+    def _parse_ids(ids) -> List[int]:
+        ''' Parses an id or a comma separated list of ids. '''
+        if isinstance(ids, (list, tuple)):
+            return [int(_) for _ in ids]
+        return [int(_) for _ in str(ids).replace(" ", "").split(",") if _ != '']
+
     def split_kObj(self, data: Dict):
         """ Splits a Kobj in two kObjs. """
+        index = self.get_kObj_index()
         # Get the data for the new kObj
-        id_ = max([_.id for _ in self.knowledgeObjects]) + 1
+        id_ = index.max_id + 1
         category = data['category']
-        old_kObj = [_ for _ in self.knowledgeObjects if _.id == int(data['id'])][0]
+        old_kObj = index.kObjs[int(data['id'])]
         labels = data['labels'].replace(" ", "").split(",")
-        new_annotations = []
-        for annotation in self.annotations:
-            if annotation.id in old_kObj.annotation_ids:
-                if " ".join([_.text for _ in annotation.words]) in labels:
-                    new_annotations.append(annotation)
+        _labels = set(labels)
+        new_annotations = [index.annotation_by_id[_] for _ in set(old_kObj.annotation_ids)
+                           if _ in index.annotation_by_id and index.annotation_text(_) in _labels]
+        new_annotations.sort(key=lambda _: index.annotation_positions[_.id])
 
         # Check if any data could be added
         if new_annotations == []:
@@ -534,37 +721,56 @@ class Document(BaseModel):
                                labels=labels,
                                annotation_ids=[_.id for _ in new_annotations])
         # Add the new kobj
+        index.discard(old_kObj)
         self.knowledgeObjects.append(kObj)
+        index.add(kObj)
 
         # Delete the ids from the old Kobj
-        for anno in new_annotations:
-            if anno.id in old_kObj.annotation_ids:
-                old_kObj.annotation_ids.remove(anno.id)
+        moved = {_.id for _ in new_annotations}
+        removed = set()
+        annotation_ids = []
+        for annotation_id in old_kObj.annotation_ids:
+            # Only the first occurrence of an id is moved.
+            if annotation_id in moved and annotation_id not in removed:
+                removed.add(annotation_id)
+            else:
+                annotation_ids.append(annotation_id)
+        old_kObj.annotation_ids = annotation_ids
 
         for label in labels:
             if label in old_kObj.labels:
                 old_kObj.labels.remove(label)
+        index.add(old_kObj)
 
     def remove_KObjs(self, data: Dict):
         """Removes one or several items from the dict"""
-        ids = data['id'].replace(" ", "")
-        ids = ids.split(",")
-        ids = [int(_) for _ in ids]
-
-        self.knowledgeObjects = [_ for _ in self.knowledgeObjects if _.id not in ids]
+        ids = set(self._parse_ids(data['id']))
+        index = self.get_kObj_index()
+        for id_ in ids:
+            if id_ in index.kObjs:
+                index.discard(index.kObjs[id_])
+        # Removed in place, so the index stays valid for the list.
+        self.knowledgeObjects[:] = [_ for _ in self.knowledgeObjects if _.id not in ids]
 
     def merge_kObjs(self, data: Dict):
-        """ Merges two kObjs together. """
-        kObj1 = [_ for _ in self.knowledgeObjects if _.id == int(data['id1'])][0]
-        kObj2 = [_ for _ in self.knowledgeObjects if _.id == int(data['id2'])][0]
-        kObj1.annotation_ids.extend(kObj2.annotation_ids)
-        kObj1.labels.extend(kObj2.labels)
-        self.knowledgeObjects.remove(kObj2)
+        """ Merges kObjs together, id2 can be a comma separated list of the kObjs that are merged into id1. """
+        index = self.get_kObj_index()
+        kObj1 = index.kObjs[int(data['id1'])]
+        others = [index.kObjs[_] for _ in self._parse_ids(data['id2']) if _ != kObj1.id]
+        index.discard(kObj1)
+        for kObj2 in others:
+            index.discard(kObj2)
+            kObj1.annotation_ids.extend(kObj2.annotation_ids)
+            kObj1.labels.extend(kObj2.labels)
+        index.add(kObj1)
+        merged = {id(_) for _ in others}
+        self.knowledgeObjects[:] = [_ for _ in self.knowledgeObjects if id(_) not in merged]
 
     def update_kObj(self, id, data):
-        """ Updates the kObj. """
-        kObj = [_ for _ in self.knowledgeObjects if _.id == int(id)][0]
-        kObj.category = data['category']
+        """ Updates the kObj, id can be a comma separated list to update several kObjs. """
+        index = self.get_kObj_index()
+        for id_ in self._parse_ids(id):
+            index.kObjs[id_].category = data['category']
 
     def get_knowledgeObjects(self) -> List[KnowledgeObject]:
         """ Returns a list of completly initailized kObjs. """
@@ -572,16 +778,7 @@ class Document(BaseModel):
 
     def get_fulltext(self) -> str:
         """ Returns the completly extracted text. """
-        text = ""
-        for chapter in self.text.chapters:
-
-            for paragraph in chapter.paragraphs:
-                for sentence in paragraph.sentences:
-                    text += sentence.text + " "
-                text += "\n"
-            text += 80 * "-" + "\n\n"
-
-        return text
+        return self.text.get_view().fulltext
 
     def get_image(self, id: int):
         if len(self.images) == 0:
@@ -598,32 +795,44 @@ class Document(BaseModel):
     def to_json(self):
         return self.json()
 
-    def decode_file(self) -> str:
-        ''' Decodes the binary (base64) file. '''
-        pdf_bytes: List[bytes] = urlsafe_b64decode(self.base64_file.encode('utf-8'))
-        return pdf_bytes
+    def store_files(self) -> None:
+        ''' Moves the pdf and the files of all tables and images into the blob store. '''
+        self.store_file()
+        for binary in self.tables + self.images:
+            binary.store_file()
 
-    def get_path_to_file(self) -> str:
-        ''' Returns the path to the file. '''
+    def load_files(self) -> None:
+        ''' Inlines the pdf and the files of all tables and images from the blob store. '''
+        self.load_file()
+        for binary in self.tables + self.images:
+            binary.load_file()
 
-        path_to_file: str = os.path.join(PATH_TO_TMP, f"document/{id(self)}.pdf")
-        print(path_to_file)
-        file_already_exists: bool = os.path.isfile(path_to_file)
-        if not file_already_exists:
-            pdf_bytes = self.decode_file()
-            doc = fitz.open(stream=pdf_bytes, filetype='pdf')
-            doc.save(path_to_file)
+    def get_page_count(self) -> int:
+        ''' Returns the number of pages of the pdf. '''
+        return pages.get_page_count(self.get_content_hash(), self.decode_file)
 
-        return f"../static/tmp/document/{id(self)}.pdf"
+    def get_page(self, num: int, zoom: float = 1.0, format: str = 'png', pin: float = 0) -> Optional[str]:
+        ''' Returns the path to a page of the pdf as png (at the zoom) or as single-page pdf.
 
-    def __del__(self):
-        if hasattr(self, "id"):
+        The page is kept for at least pin seconds, e.g. while it is sent.
+        '''
+        return pages.get_page(self.get_content_hash(), self.decode_file, num, zoom, format, pin)
 
-            path_to_file: str = os.path.join(PATH_TO_APP, f"static/tmp/document/{self.id}.png")
+    def get_chapters_as_pdf(self, chapters: List[Chapter], pin: float = 0) -> List[str]:
+        ''' Returns the paths to pdfs with the pages of each chapter, the pdf is opened once for all chapters.
 
-            file_exits: bool = os.path.isfile(path_to_file)
-            if file_exits:
-                os.remove(path_to_file)
+        The pdfs are cached by the pdf and the pages and sentences of the chapter. A chapter
+        without pages is highlighted in the whole pdf.
+        '''
+        slices = [(chapter.get_slice_key(), min(chapter.pages, default=0), max(chapter.pages, default=-1),
+                   chapter._mark_relevant_area) for chapter in chapters]
+        return pages.get_slices(self.get_content_hash(), self.decode_file, slices, pin)
+
+    def get_path_to_file(self) -> str:
+        ''' Returns the url of the pdf, it is kept as temporary file named by its content. '''
+        name = f"document/{self.get_content_hash()}.pdf"
+        artifacts.get(name, self.decode_file)
+        return f"../static/tmp/{name}"
 
 
 class ExtractionTaskDocument(BaseModel):
@@ -0,0 +1,121 @@
+from __future__ import annotations
+import os
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import fitz
+from app.internal.artifacts import ArtifactRegistry, artifacts
+
+FORMATS = ['png', 'pdf']
+# Sentences are searched by their beginning, long needles rarely match because of line breaks and hyphens.
+NEEDLE_LENGTH = 60
+MIN_ZOOM = 0.5
+MAX_ZOOM = 4.0
+
+
+def normalize_zoom(zoom: float) -> float:
+    ''' Rounds the zoom to quarter steps between MIN_ZOOM and MAX_ZOOM, so only few renderings per page exist. '''
+    return min(MAX_ZOOM, max(MIN_ZOOM, round(zoom * 4) / 4))
+
+
+def mark_texts(pdf: fitz.Document, texts: Iterable[str]) -> int:
+    ''' Highlights the occurrences of the texts on all pages and returns the number of highlights. '''
+    needles = list(dict.fromkeys(" ".join(_.split())[:NEEDLE_LENGTH] for _ in texts))
+    needles = [_ for _ in needles if len(_) > 3]
+    count = 0
+    for page in pdf:
+        textpage = page.get_textpage()
+        for needle in needles:
+            quads = page.search_for(needle, quads=True, textpage=textpage)
+            if len(quads) > 0:
+                page.add_highlight_annot(quads)
+                count += len(quads)
+    return count
+
+
+class PageCache:
+    ''' Renders single pages of pdfs as images or extracts them as single-page pdfs on demand.
+
+    The pages are stored by (document hash, page, zoom), so a page is rendered once and only
+    the pages a reader looks at are transferred. The pages are artifacts of the registry, which
+    deletes the least recently used ones once the temporary files exceed their budget.
+    '''
+
+    def __init__(self, registry: ArtifactRegistry, folder: str = 'pages'):
+        self.registry: ArtifactRegistry = registry
+        self.folder: str = folder
+        self._page_counts: Dict[str, int] = {}
+
+    def name(self, ref: str, page: int, zoom: float = 1.0, format: str = 'png') -> str:
+        if format == 'pdf':
+            return f"{self.folder}/{ref}-{page}.pdf"
+        return f"{self.folder}/{ref}-{page}-{normalize_zoom(zoom):g}.png"
+
+    def path(self, ref: str, page: int, zoom: float = 1.0, format: str = 'png') -> str:
+        return self.registry.path(self.name(ref, page, zoom, format))
+
+    def get_page_count(self, ref: str, load: Callable[[], bytes]) -> int:
+        ''' Returns the number of pages of the pdf, the pdf is only opened the first time. '''
+        count = self._page_counts.get(ref)
+        if count is None:
+            with fitz.open(stream=load(), filetype='pdf') as pdf:
+                count = self._page_counts[ref] = pdf.page_count
+        return count
+
+    def get_page(self, ref: str, load: Callable[[], bytes], page: int, zoom: float = 1.0,
+                 format: str = 'png', pin: float = 0) -> Optional[str]:
+        ''' Returns the path to the page or None if the pdf has no such page. '''
+        return self.get_pages(ref, load, [page], zoom, format, pin)[0]
+
+    def get_pages(self, ref: str, load: Callable[[], bytes], pages: Iterable[int], zoom: float = 1.0,
+                  format: str = 'png', pin: float = 0) -> List[Optional[str]]:
+        ''' Returns the paths to the pages, the pdf is opened once for all pages that are not stored yet.
+
+        The pages are pinned for pin seconds, e.g. while they are sent.
+        '''
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format: {format}")
+        pages = list(pages)
+        names = [self.name(ref, page, zoom, format) for page in pages]
+        missing = [(page, name) for page, name in zip(pages, names) if not self.registry.touch(name, pin)]
+        if len(missing) > 0:
+            with fitz.open(stream=load(), filetype='pdf') as pdf:
+                self._page_counts[ref] = pdf.page_count
+                for page, name in missing:
+                    if 0 <= page < pdf.page_count:
+                        self.registry.put(name, self._render(pdf, page, zoom, format), pin)
+        return [self.registry.path(name) if 0 <= page < self._page_counts.get(ref, 0)
+                or os.path.isfile(self.registry.path(name)) else None
+                for page, name in zip(pages, names)]
+
+    def get_slices(self, ref: str, load: Callable[[], bytes],
+                   slices: List[Tuple[str, int, int, Callable[[fitz.Document], fitz.Document]]],
+                   pin: float = 0) -> List[str]:
+        ''' Returns the paths to pdfs with a page range of the pdf each.
+
+        A slice is (key, first page, last page, mark), mark draws on the extracted pages and
+        the key has to change whenever the marks would change. A last page of -1 is the last
+        page of the pdf. The pdf is opened once for all slices that are not stored yet.
+        '''
+        names = [f"{self.folder}/{ref}-slice-{key}.pdf" for key, _, _, _ in slices]
+        missing = [(name, _slice) for name, _slice in zip(names, slices) if not self.registry.touch(name, pin)]
+        if len(missing) > 0:
+            with fitz.open(stream=load(), filetype='pdf') as pdf:
+                self._page_counts[ref] = pdf.page_count
+                for name, (_, first, last, mark) in missing:
+                    last = pdf.page_count - 1 if last < 0 else min(last, pdf.page_count - 1)
+                    with fitz.open() as res:
+                        res.insert_pdf(pdf, from_page=max(first, 0), to_page=last)
+                        res = mark(res)
+                        self.registry.put(name, res.tobytes(garbage=3, deflate=True), pin)
+        return [self.registry.path(_) for _ in names]
+
+    @staticmethod
+    def _render(pdf: fitz.Document, page: int, zoom: float, format: str) -> bytes:
+        if format == 'pdf':
+            with fitz.open() as res:
+                res.insert_pdf(pdf, from_page=page, to_page=page)
+                return res.tobytes(garbage=3, deflate=True)
+        zoom = normalize_zoom(zoom)
+        return pdf[page].get_pixmap(matrix=fitz.Matrix(zoom, zoom)).tobytes('png')
+
+
+pages = PageCache(artifacts)
@@ -79,6 +79,7 @@ class AnnotationGraphParser(ABCParser):
             id = 1
             def __init__(self, paragraph):
                 self.sentences = paragraph.sentences
+                self.annotation_ids = {_ for sentence in self.sentences for _ in sentence.get_annotation_ids()}
                 self.id = P.id
                 P.id += 1
             def __str__(self):
@@ -120,10 +121,13 @@ class AnnotationGraphParser(ABCParser):
         _min = 999
         for kObj in doc.knowledgeObjects:
             triple = Triple(kObj)
+            annotation_ids = set(kObj.annotation_ids)
             for paragraph in paragraphs:
+                if paragraph.annotation_ids.isdisjoint(annotation_ids):
+                    continue
                 for sentence in paragraph.sentences:
-                    for word in sentence.words:
-                        if word.annotation_id in kObj.annotation_ids:
+                    for annotation_id in sentence.get_annotation_ids():
+                        if annotation_id in annotation_ids:
                             triple.add(paragraph)
 
             # ToDo: Add counting of tables
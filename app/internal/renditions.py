@@ -0,0 +1,69 @@
+from __future__ import annotations
+import os
+import re
+from io import BytesIO
+from typing import Callable, Tuple
+from PIL import Image as pilImage
+from app.config import RENDITION_URL
+from app.internal.artifacts import ArtifactRegistry, artifacts
+
+# original: the image as png, thumbnail: at most 256 px wide as png, webp-N: at most N px wide as webp.
+_SPEC = re.compile(r'^(original|thumbnail|webp-(\d{2,4}))$')
+THUMBNAIL_WIDTH = 256
+
+
+def parse_spec(spec: str) -> Tuple[int, str]:
+    ''' Returns the maximal width (0 for the original size) and the format of a rendition. '''
+    match = _SPEC.match(spec)
+    if match is None:
+        raise ValueError(f"Unknown rendition: {spec}")
+    if match.group(1) == 'original':
+        return 0, 'png'
+    if match.group(1) == 'thumbnail':
+        return THUMBNAIL_WIDTH, 'png'
+    return int(match.group(2)), 'webp'
+
+
+def render(data: bytes, spec: str) -> bytes:
+    ''' Converts an image into the rendition. '''
+    width, image_format = parse_spec(spec)
+    img = pilImage.open(BytesIO(data))
+    if width > 0 and img.width > width:
+        img = img.resize((width, max(1, round(img.height * width / img.width))), pilImage.LANCZOS)
+    if image_format == 'webp' and img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'transparency' in img.info or img.mode in ('LA', 'PA') else 'RGB')
+    res = BytesIO()
+    img.save(res, image_format)
+    return res.getvalue()
+
+
+class RenditionCache:
+    ''' Keeps renditions (png, thumbnail, webp) of images, addressed by the content hash of the image.
+
+    The file name depends only on the content and the rendition, so a rendition is generated
+    once and can be served with long-lived cache headers. The renditions are artifacts of the
+    registry, which writes them atomically and deletes them once they are no longer used.
+    '''
+
+    def __init__(self, registry: ArtifactRegistry, url: str, folder: str = 'renditions'):
+        self.registry: ArtifactRegistry = registry
+        self.url: str = url
+        self.folder: str = folder
+
+    def file_name(self, ref: str, spec: str) -> str:
+        return f"{ref}-{spec}.{parse_spec(spec)[1]}"
+
+    def path(self, ref: str, spec: str) -> str:
+        return self.registry.path(f"{self.folder}/{self.file_name(ref, spec)}")
+
+    def get(self, ref: str, load: Callable[[], bytes], spec: str = 'original') -> str:
+        ''' Returns the url of the rendition, load returns the image if it has to be generated. '''
+        path = self.get_path(ref, load, spec)
+        return f"{self.url}/{os.path.basename(path)}"
+
+    def get_path(self, ref: str, load: Callable[[], bytes], spec: str = 'original') -> str:
+        ''' Returns the path to the rendition and generates it if needed. '''
+        return self.registry.get(f"{self.folder}/{self.file_name(ref, spec)}", lambda: render(load(), spec))
+
+
+renditions = RenditionCache(artifacts, RENDITION_URL)
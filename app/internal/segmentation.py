@@ -0,0 +1,128 @@
+from __future__ import annotations
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional
+from segtok.segmenter import split_single
+from app.config import SEGMENTATION_CACHE_SIZE, SEGMENTATION_PARALLEL_THRESHOLD, SEGMENTATION_WORKERS
+
+
+def split_sentences(text: str) -> List[str]:
+    ''' Splits a paragraph into sentences.
+
+    Sentences that do not end with a period and abbreviations like "et al." are merged with
+    the following sentence.
+    '''
+    sentences = []
+
+    zwerg = split_single(text)
+    for num, sentence in enumerate(zwerg):
+        sentence = sentence.rstrip()
+
+        if len(sentence) > 0 and len(sentences) > 0:
+            if sentences[-1][-1] != "." and num > 0:
+                sentences[-1] += " " + sentence.lstrip()
+                continue
+        if len(sentences) > 0 and num > 0:
+            if len(sentences[-1]) > 5:
+                if sentences[-1][-6:] == "et al.":
+                    sentences[-1] += " " + sentence.lstrip()
+                    continue
+        sentences.append(sentence)
+    return sentences
+
+
+def _split_batch(paragraphs: List[str]) -> List[List[str]]:
+    return [split_sentences(_) for _ in paragraphs]
+
+
+class SentenceSegmenter:
+    ''' Splits paragraphs into sentences and memoizes the results by the hash of the paragraph.
+
+    Paragraphs that were segmented before (e.g. on a re-edit or a re-import) are taken from the
+    cache. If the uncached paragraphs of a call have more than parallel_threshold characters, they
+    are split in batches by a process pool, smaller calls are split in the calling process.
+    '''
+
+    def __init__(self, cache_size: int = 100000, workers: int = 0, parallel_threshold: int = 200000,
+                 batch_size: int = 64):
+        self.cache_size: int = cache_size
+        self.workers: int = workers
+        self.parallel_threshold: int = parallel_threshold
+        self.batch_size: int = batch_size
+        self._cache: OrderedDict[bytes, List[str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @staticmethod
+    def _key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+    def _get(self, key: bytes) -> Optional[List[str]]:
+        with self._lock:
+            sentences = self._cache.get(key)
+            if sentences is not None:
+                self._cache.move_to_end(key)
+            return sentences
+
+    def _put(self, key: bytes, sentences: List[str]) -> None:
+        with self._lock:
+            self._cache[key] = sentences
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def split(self, text: str) -> List[str]:
+        ''' Returns the sentences of a paragraph. '''
+        return self.split_many([text])[0]
+
+    def split_many(self, paragraphs: Iterable[str]) -> List[List[str]]:
+        ''' Returns the sentences of every paragraph, in the order of the paragraphs. '''
+        paragraphs = list(paragraphs)
+        keys = [self._key(_) for _ in paragraphs]
+        found: Dict[bytes, List[str]] = {}
+        missing: Dict[bytes, str] = {}
+        for key, paragraph in zip(keys, paragraphs):
+            if key in found or key in missing:
+                continue
+            sentences = self._get(key)
+            if sentences is None:
+                missing[key] = paragraph
+            else:
+                found[key] = sentences
+
+        texts = list(missing.values())
+        if self.workers > 1 and sum(len(_) for _ in texts) > self.parallel_threshold:
+            batches = [texts[num:num + self.batch_size] for num in range(0, len(texts), self.batch_size)]
+            results = [sentences for batch in self._get_pool().map(_split_batch, batches) for sentences in batch]
+        else:
+            results = _split_batch(texts)
+        for key, sentences in zip(missing, results):
+            self._put(key, sentences)
+            found[key] = sentences
+        # Callers may change the lists, the cached ones stay untouched.
+        return [list(found[_]) for _ in keys]
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def close(self) -> None:
+        ''' Shuts the process pool down, it is started again by the next large call. '''
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+
+segmenter = SentenceSegmenter(cache_size=SEGMENTATION_CACHE_SIZE, workers=SEGMENTATION_WORKERS,
+                              parallel_threshold=SEGMENTATION_PARALLEL_THRESHOLD)
+atexit.register(segmenter.close)
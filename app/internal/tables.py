@@ -0,0 +1,153 @@
+from __future__ import annotations
+import math
+import re
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# A unit: a (prefixed) SI unit or a common unit of the papers with an optional power, e.g. "mm²" or
+# "s^-1". Up to four units can be combined, e.g. "m/s", "N·m" or "mm³/Nm".
+_SIMPLE_UNIT = r'(?:%|‰|°[CF]?|min|h|rpm|ppm|HV\d*|HRC|HB|(?:wt|at|vol)\.?\s?%|' \
+               r'[pnµμumckMGT]?(?:m|g|s|N|Pa|J|W|V|A|Hz|L|l|bar|mol|K|Ω|eV))(?:\^?[-−]?\d|[²³¹⁻]+)?'
+_UNIT = rf'\(?{_SIMPLE_UNIT}\)?(?:\s?[/·*.]?\s?\(?{_SIMPLE_UNIT}\)?){{0,3}}'
+# A number with an optional uncertainty (± or +/-) and an optional unit, e.g. "12.5 ± 0.3 MPa".
+# The number has to be the whole cell, texts like "3 samples" or "2D model" are no numbers.
+_NUMBER = re.compile(r'\s*([-+−]?\d+(?:[.,]\d+)?(?:[eE][-+]?\d+)?)\s*'
+                     rf'(?:(?:±|\+/-)\s*\d+(?:[.,]\d+)?\s*)?({_UNIT})?\s*')
+# A unit in the header of a column, e.g. "Load (N)" or "Temperature [°C]".
+_HEADER_UNIT = re.compile(r'[(\[]\s*([^()\[\]]+?)\s*[)\]]\s*$')
+CELL_FIELDS = ['text', 'category', 'type', 'annotation_ids']
+
+
+def is_number(text: str) -> bool:
+    ''' Checks if at least half of the characters of a text are digits. '''
+    return len(text) > 0 and 2 * sum(map(str.isdecimal, text)) >= len(text)
+
+
+def parse_number(text: str) -> Tuple[float, str]:
+    ''' Returns the value and the unit of a cell, the value is nan if the cell is no number. '''
+    match = _NUMBER.fullmatch(text)
+    if match is None:
+        return math.nan, ''
+    value = match.group(1).replace(',', '.').replace('−', '-')
+    return float(value), match.group(2) or ''
+
+
+def classify(texts: List[str]) -> List[str]:
+    ''' Returns the type (NUM or WORD) of every cell of a column, every distinct text is classified once.
+
+    Cells that are mostly digits and numbers with a unit (e.g. "12.5 MPa") are NUM.
+    '''
+    types = {text: "NUM" if is_number(text) or _NUMBER.fullmatch(text) is not None else "WORD" for text in set(texts)}
+    return [types[_] for _ in texts]
+
+
+class TableStore:
+    ''' Keeps the cells of a table column by column.
+
+    Every column has a list of texts, categories and types, the annotation ids are kept only
+    for the cells that have some. Rows can have different lengths, column c holds the cells
+    of the rows that are longer than c. The numbers and units of the cells are parsed on the
+    first use. The Row and Column models (or their dicts) are built from the store when needed.
+    '''
+
+    def __init__(self, texts: List[List[str]], row_lengths: List[int], categories: List[List[str]] = None,
+                 types: List[List[str]] = None, row_types: List[str] = None, column_types: List[str] = None,
+                 annotation_ids: Dict[Tuple[int, int], List[int]] = None):
+        self.texts: List[List[str]] = texts
+        self.row_lengths: List[int] = row_lengths
+        self.types: List[List[str]] = types if types is not None else [classify(_) for _ in texts]
+        self.categories: List[List[str]] = categories if categories is not None else self.types
+        self.row_types: List[str] = row_types if row_types is not None else ['' for _ in row_lengths]
+        self.column_types: List[str] = column_types if column_types is not None else ['' for _ in texts]
+        # (column, position in the column) -> annotation ids
+        self.annotation_ids: Dict[Tuple[int, int], List[int]] = annotation_ids or {}
+        self._values: Dict[int, Tuple[array, List[str]]] = {}
+
+    @classmethod
+    def from_rows(cls, rows: List[List[str]]) -> TableStore:
+        ''' Creates the store from the texts of the rows, the cells are typed as NUM or WORD. '''
+        texts: List[List[str]] = [[] for _ in range(max([len(_) for _ in rows], default=0))]
+        for row in rows:
+            for num, text in enumerate(row):
+                texts[num].append(text)
+        return cls(texts, [len(_) for _ in rows])
+
+    @classmethod
+    def from_dict(cls, table: Dict) -> Optional[TableStore]:
+        ''' Creates the store from a serialized table.
+
+        Returns None if the columns of the table are not the cells of its rows, such a table
+        can not be stored without loss.
+        '''
+        rows = table.get('rows') or []
+        columns = table.get('columns') or []
+        if any(not isinstance(_, dict) or not isinstance(_.get('cells'), list) for _ in rows + columns):
+            return None
+        cells: List[List[Dict]] = [[] for _ in range(max([len(_['cells']) for _ in rows], default=0))]
+        for row in rows:
+            for num, cell in enumerate(row['cells']):
+                cells[num].append(cell)
+        if len(columns) != len(cells) or any(column['cells'] != _ for column, _ in zip(columns, cells)):
+            return None
+        if any(not isinstance(cell, dict) or list(cell) != CELL_FIELDS for column in cells for cell in column):
+            return None
+        annotation_ids = {(col, pos): list(cell['annotation_ids'])
+                          for col, column in enumerate(cells) for pos, cell in enumerate(column)
+                          if len(cell['annotation_ids']) > 0}
+        return cls([[_['text'] for _ in column] for column in cells], [len(_['cells']) for _ in rows],
+                   categories=[[_['category'] for _ in column] for column in cells],
+                   types=[[_['type'] for _ in column] for column in cells],
+                   row_types=[_.get('type', '') for _ in rows], column_types=[_.get('type', '') for _ in columns],
+                   annotation_ids=annotation_ids)
+
+    def __len__(self) -> int:
+        return len(self.row_lengths)
+
+    def _cell(self, col: int, pos: int) -> Dict:
+        return {'text': self.texts[col][pos], 'category': self.categories[col][pos], 'type': self.types[col][pos],
+                'annotation_ids': list(self.annotation_ids.get((col, pos), ()))}
+
+    def _positions(self) -> List[List[Tuple[int, int]]]:
+        ''' Returns (column, position in the column) of the cells of every row. '''
+        counters = [0 for _ in self.texts]
+        res = []
+        for length in self.row_lengths:
+            res.append([(col, counters[col]) for col in range(length)])
+            for col in range(length):
+                counters[col] += 1
+        return res
+
+    def row_dicts(self) -> List[Dict]:
+        return [{'cells': [self._cell(col, pos) for col, pos in row], 'type': type_}
+                for row, type_ in zip(self._positions(), self.row_types)]
+
+    def column_dicts(self) -> List[Dict]:
+        return [{'cells': [self._cell(col, pos) for pos in range(len(texts))], 'type': type_}
+                for col, (texts, type_) in enumerate(zip(self.texts, self.column_types))]
+
+    def get_values(self, col: int) -> array:
+        ''' Returns the values of the cells of a column, nan for cells that are no numbers. '''
+        return self._parse(col)[0]
+
+    def get_units(self, col: int) -> List[str]:
+        ''' Returns the units of the cells of a column, '' for cells without a unit. '''
+        return self._parse(col)[1]
+
+    def _parse(self, col: int) -> Tuple[array, List[str]]:
+        parsed = self._values.get(col)
+        if parsed is None:
+            numbers = {text: parse_number(text) for text in set(self.texts[col])}
+            values = array('d', [numbers[_][0] if type_ == "NUM" else math.nan
+                                 for _, type_ in zip(self.texts[col], self.types[col])])
+            units = [numbers[_][1] if type_ == "NUM" else '' for _, type_ in zip(self.texts[col], self.types[col])]
+            parsed = self._values[col] = (values, units)
+        return parsed
+
+    def get_column_unit(self, col: int, header: str = '') -> str:
+        ''' Returns the most frequent unit of the numbers of a column or the unit in its header. '''
+        units = Counter(_ for _ in self.get_units(col) if _ != '')
+        if len(units) > 0:
+            return units.most_common(1)[0][0]
+        match = _HEADER_UNIT.search(header)
+        return match.group(1) if match is not None else ''
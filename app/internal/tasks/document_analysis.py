@@ -2,8 +2,8 @@ from app.internal.internal_datamodels import Document
 from app.internal.parser.parsers import AnswerParser, AnnotationGraphParser, ContextGraphParser, QuestionTemplateParser
 from app.internal.agent.graph_agent import GraphAgent
 from typing import List
-from app.config import PATH_TO_TRIPLEFILE, PATH_TO_QUESTIONTEMPLATE, PATH_TO_TMP
-import os
+from app.config import PATH_TO_TRIPLEFILE, PATH_TO_QUESTIONTEMPLATE, TMP_LEASE
+from app.internal.artifacts import artifacts
 import json
 
 annotation_parser = AnnotationGraphParser()
@@ -110,8 +110,5 @@ def get_download_link(document: Document) -> str:
 
     res = g.get_graph(answers, linked_data_format=True)
 
-    file_path = os.path.join(PATH_TO_TMP, f"{document.id}.json_ld")
-    with open(file_path, "w") as file:
-        file.write(res)
-
-    return file_path
+    # The file is sent right away, it is leased until the response is done.
+    return artifacts.put(f"{document.id}.json_ld", res.encode("utf-8"), pin=TMP_LEASE)
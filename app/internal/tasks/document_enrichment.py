@@ -1,4 +1,5 @@
 import time
+from functools import wraps
 
 from fastapi import APIRouter, Request
 from fastapi.templating import Jinja2Templates
@@ -27,6 +28,20 @@ def wait_for_response(id: str, API: Dict):
             time.sleep(1)
 
 
+def record_errors(stage: str):
+    """ Records an exception of a pipeline stage as the last error of the document. """
+    def decorator(func: Callable):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            except Exception as error:
+                db.set_error(kwargs.get('id', args[0] if len(args) > 0 else ''), f"{stage}: {error}")
+                raise
+        return wrapper
+    return decorator
+
+
 def execute_enrichment_tasks(id: str):
 
     file = start_extraction(id)
@@ -36,7 +51,7 @@ def execute_enrichment_tasks(id: str):
 
 
 def start_task(document_id: str, index: str, API: str, REQUESTFORMAT, previous_document: Union[Dict, None] = None,
-               mapping_func: Callable = None):
+               mapping_func: Callable = None, with_file: bool = False):
 
     api_call = API['BASEURI'] + API['send_to']
     if previous_document is None:
@@ -44,6 +59,10 @@ def start_task(document_id: str, index: str, API: str, REQUESTFORMAT, previous_d
     else:
         file = previous_document.dict()
 
+    if with_file:
+        # The microservice needs the pdf itself and not the reference into the blob store.
+        file['base64_file'] = Document(**file).get_base64_file()
+
     if mapping_func is not None:
         request = REQUESTFORMAT(**mapping_func(file))
     else:
@@ -59,13 +78,16 @@ def get_data(id: str, API: Dict):
     data = get_response(api_call)
     return data
 
+@record_errors('extraction')
 def start_extraction(id: str, mapping_func: Callable = None):
 
     def update_document(doc: Document, file: Dict):
-        doc.base64_file = file["base64_file"]
+        doc.blob_ref = file.get("blob_ref", '')
+        if doc.blob_ref == '':
+            doc.base64_file = file["base64_file"]
         return doc
 
-    file = start_task(id, 'upload', EXTRACTION_MODULE_API, ExtractionInput, mapping_func)
+    file = start_task(id, 'upload', EXTRACTION_MODULE_API, ExtractionInput, mapping_func=mapping_func, with_file=True)
     wait_for_response(id, EXTRACTION_MODULE_API)
     data = get_data(id, EXTRACTION_MODULE_API)
 
@@ -79,17 +101,20 @@ def start_extraction(id: str, mapping_func: Callable = None):
     doc = update_document(doc, file)
     db.add_file(doc, 'extract')
     db.save_indexes()
+    db.set_state(id, 'extracted')
 
     return doc
 
 
 
+@record_errors('annotation')
 def start_annotation(id: str, document: Union[Document, None] = None, mapping_func: Callable = None):
 
     def update_document(doc: Document, file: Union[Dict, Document]):
         if not isinstance(file, dict):
             file = file.dict()
         doc.base64_file = file["base64_file"]
+        doc.blob_ref = file.get("blob_ref", '')
         doc.images = [Image(**_) for _ in file['images']]
         for table, _table_data in zip(doc.tables, file['tables']):
             units = table.units
@@ -102,6 +127,7 @@ def start_annotation(id: str, document: Union[Document, None] = None, mapping_fu
                 header = Column(**header)
             table.table_header = header
             table.base64_file = _table_data['base64_file']
+            table.blob_ref = _table_data.get('blob_ref', '')
             table.name = _table_data['name']
             table.description = _table_data['description']
             table.units = units if len(units) != 0 else ["" for _ in header.cells]
@@ -139,9 +165,11 @@ def start_annotation(id: str, document: Union[Document, None] = None, mapping_fu
     doc = update_document(doc, file)
     db.add_file(doc, 'annotate', True)
     db.save_indexes()
+    db.set_state(id, 'annotated')
 
     return doc
 
+@record_errors('analysis')
 def start_analysis(id: str, document: Union[Document, None] = None, mapping_func: Callable = None):
 
     file = start_task(id, 'annotate', ANALYSIS_MODULE_API, AnalysisInput, document, _map_data_for_analysis)
@@ -160,6 +188,7 @@ def start_analysis(id: str, document: Union[Document, None] = None, mapping_func
 
     db.add_file(doc, 'analyse', True)
     db.save_indexes()
+    db.set_state(id, 'analysed')
 
 
 def _map_data_for_analysis(data: Dict) -> Dict:
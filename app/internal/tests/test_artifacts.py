@@ -0,0 +1,66 @@
+import os
+import tempfile
+import time
+from unittest import TestCase
+from app.internal.artifacts import ArtifactRegistry
+
+
+def _age(path, age):
+    timestamp = time.time() - age
+    os.utime(path, (timestamp, timestamp))
+
+
+class TestArtifactRegistry(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.registry = ArtifactRegistry(self.folder.name, 25, 60)
+        self.creates = 0
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def _create(self) -> bytes:
+        self.creates += 1
+        return b"x" * 10
+
+    def test_created_once(self):
+        path = self.registry.get("document/a.pdf", self._create)
+        self.assertEqual(self.registry.get("document/a.pdf", self._create), path)
+        self.assertEqual(self.creates, 1)
+        self.assertEqual(os.listdir(os.path.join(self.folder.name, "document")), ["a.pdf"])
+        with self.assertRaises(ValueError):
+            self.registry.get("../a.pdf", self._create)
+
+    def test_least_recently_used_are_evicted(self):
+        first = self.registry.put("a", b"x" * 10)
+        second = self.registry.put("b", b"x" * 10)
+        self.registry.touch("a")
+        self.registry.put("c", b"x" * 10)
+        self.assertTrue(os.path.isfile(first))
+        self.assertFalse(os.path.isfile(second))
+
+    def test_leased_are_kept(self):
+        with self.registry.lease("a", self._create) as leased:
+            pinned = self.registry.put("b", b"x" * 10, pin=60)
+            self.registry.put("c", b"x" * 10)
+            self.registry.put("d", b"x" * 10)
+            self.assertTrue(os.path.isfile(leased))
+            self.assertTrue(os.path.isfile(pinned))
+        self.registry.put("e", b"x" * 10)
+        self.assertFalse(os.path.isfile(leased))
+
+    def test_sweep(self):
+        expired = self.registry.put("a", b"x" * 10)
+        leased = self.registry.put("b", b"x" * 10, pin=60)
+        _age(expired, 120)
+        _age(leased, 120)
+        with open(os.path.join(self.folder.name, "c"), 'wb') as f:
+            f.write(b"x" * 10)
+
+        report = self.registry.sweep()
+        self.assertEqual(report.tmp_files, [expired])
+        self.assertTrue(os.path.isfile(leased))
+        # Files of other workers are found when the budget is exceeded.
+        self.registry.put("d", b"x" * 10)
+        self.assertEqual(sorted(os.listdir(self.folder.name)), ["b", "d"])
@@ -0,0 +1,31 @@
+from unittest import TestCase
+from app.internal.construct import construct
+from app.internal.internal_datamodels import Document, Row
+from app.internal.tests.test_tokens import _document
+
+
+class TestConstruct(TestCase):
+
+    def test_same_as_validated(self):
+        data = dict(_document(),
+                    tables=[{'rows': [{'cells': [{'text': "1"}]}], 'table_header': {'type': 'column', 'cells': []}}],
+                    knowledgeObjects=[{'id': 1, 'category': "Material", 'labels': ["steel"], 'annotation_ids': [1, 2]}],
+                    metadata={'title': "Friction", 'authors': [{'first_name': "A", 'last_name': "B"}]})
+        expected = Document(**data)
+        stored = expected.dict()
+        doc = construct(Document, stored)
+        self.assertEqual(doc.json(), expected.json())
+        self.assertIsInstance(doc.tables[0].table_header, Row)
+        self.assertEqual(doc.metadata.authors[0].last_name, "B")
+        self.assertEqual(doc.knowledgeObjects[0].annotations, [])
+
+        doc = Document.load_columnar(stored, validate=False)
+        self.assertEqual(doc.json(), expected.json())
+        self.assertEqual(doc.text.chapters[0].paragraphs[0].sentences[0].words[2].text, "steel")
+
+    def test_alias_and_defaults(self):
+        doc = construct(Document, {'document_id': "1"})
+        self.assertEqual(doc.id, "1")
+        self.assertEqual(doc.tables, [])
+        doc.tables.append(None)
+        self.assertEqual(construct(Document, {'id': "2"}).tables, [])
@@ -0,0 +1,52 @@
+from unittest import TestCase
+from app.internal.internal_datamodels import Document
+from app.internal.tests.test_tokens import _word
+
+
+def _annotated_document():
+    annotations = [{'id': num, 'category': "Material", 'words': [_word(num, text, num)]}
+                   for num, text in enumerate(["steel", "brass", "oil", "steel"])]
+    knowledgeObjects = [{'id': 0, 'category': "Material", 'labels': ["steel", "brass"], 'annotation_ids': [0, 1, 3]},
+                        {'id': 1, 'category': "Lubricant", 'labels': ["oil"], 'annotation_ids': [2]},
+                        {'id': 4, 'category': "Material", 'labels': ["copper"], 'annotation_ids': []}]
+    return Document(id="1", file_name="1.pdf", annotations=annotations, knowledgeObjects=knowledgeObjects)
+
+
+class TestKnowledgeObjects(TestCase):
+
+    def test_split(self):
+        doc = _annotated_document()
+        doc.split_kObj({'id': "0", 'category': "Alloy", 'labels': "brass"})
+        new = doc.get_kObj(5)
+        self.assertEqual(new.annotation_ids, [1])
+        self.assertEqual(new.category, "Alloy")
+        self.assertEqual(doc.get_kObj(0).annotation_ids, [0, 3])
+        self.assertEqual(doc.get_kObj(0).labels, ["steel"])
+        self.assertEqual([_.id for _ in doc.get_kObjs_by_label("brass")], [5])
+        self.assertEqual([_.id for _ in doc.get_kObjs_by_annotation(1)], [5])
+
+        # Labels without an annotation do not create a kObj.
+        doc.split_kObj({'id': "0", 'category': "Alloy", 'labels': "copper"})
+        self.assertEqual(len(doc.knowledgeObjects), 4)
+
+    def test_merge_remove_update(self):
+        doc = _annotated_document()
+        doc.merge_kObjs({'id1': "0", 'id2': "1, 4"})
+        self.assertEqual([_.id for _ in doc.knowledgeObjects], [0])
+        self.assertEqual(doc.get_kObj(0).annotation_ids, [0, 1, 3, 2])
+        self.assertEqual([_.id for _ in doc.get_kObjs_by_label("oil")], [0])
+
+        doc = _annotated_document()
+        doc.update_kObj("0,1", {'category': "Other"})
+        self.assertEqual([_.category for _ in doc.knowledgeObjects], ["Other", "Other", "Material"])
+        doc.remove_KObjs({'id': "0, 4"})
+        self.assertEqual([_.id for _ in doc.knowledgeObjects], [1])
+        self.assertIsNone(doc.get_kObj(0))
+        self.assertEqual(doc.get_kObjs_by_annotation(0), [])
+
+    def test_index_follows_replaced_lists(self):
+        doc = _annotated_document()
+        self.assertIsNotNone(doc.get_kObj(4))
+        doc.knowledgeObjects = doc.knowledgeObjects[:1]
+        self.assertIsNone(doc.get_kObj(4))
+        self.assertEqual(doc.dict(), _annotated_document().copy(update={'knowledgeObjects': doc.knowledgeObjects}).dict())
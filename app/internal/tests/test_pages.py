@@ -0,0 +1,88 @@
+import os
+import tempfile
+from unittest import TestCase
+import fitz
+from app.internal.artifacts import ArtifactRegistry
+from app.internal.pages import PageCache
+
+
+def _pdf(pages: int = 3) -> bytes:
+    with fitz.open() as pdf:
+        for num in range(pages):
+            pdf.new_page().insert_text((72, 72), f"Page {num}")
+        return pdf.tobytes()
+
+
+class TestPageCache(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.loads = 0
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def _load(self) -> bytes:
+        self.loads += 1
+        return _pdf()
+
+    def test_pages(self):
+        cache = PageCache(ArtifactRegistry(self.folder.name, 10 * 1024 * 1024, 60))
+        paths = cache.get_pages("ab" * 32, self._load, [0, 1, 5], zoom=1.1)
+        self.assertEqual(self.loads, 1)
+        self.assertIsNone(paths[2])
+        self.assertTrue(paths[0].endswith("-0-1.png"))
+        self.assertEqual(cache.get_page("ab" * 32, self._load, 1, zoom=1.0), paths[1])
+        self.assertEqual(self.loads, 1)
+        self.assertEqual(cache.get_page_count("ab" * 32, self._load), 3)
+
+        path = cache.get_page("ab" * 32, self._load, 2, format='pdf')
+        with fitz.open(path) as page:
+            self.assertEqual(page.page_count, 1)
+            self.assertIn("Page 2", page[0].get_text())
+
+    def test_budget(self):
+        cache = PageCache(ArtifactRegistry(self.folder.name, 1, 60))
+        first = cache.get_page("ab" * 32, self._load, 0)
+        second = cache.get_page("ab" * 32, self._load, 1)
+        self.assertFalse(os.path.isfile(first))
+        self.assertTrue(os.path.isfile(second))
+
+        cache = PageCache(ArtifactRegistry(os.path.join(self.folder.name, "tmp"), 10 * 1024 * 1024, 60))
+        cache.get_page("ab" * 32, self._load, 0)
+        size = os.path.getsize(cache.path("ab" * 32, 0))
+        cache.registry.max_size = int(size * 1.5)
+        cache.get_page("ab" * 32, self._load, 1)
+        self.assertEqual(os.listdir(os.path.join(cache.registry.folder, cache.folder)),
+                         [os.path.basename(cache.path("ab" * 32, 1))])
+
+
+class TestChapterSlices(TestCase):
+
+    def test_chapters(self):
+        from app.internal.internal_datamodels import Chapter, Paragraph, Sentence
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        cache = PageCache(ArtifactRegistry(folder.name, 10 * 1024 * 1024, 60))
+        loads = []
+
+        def load() -> bytes:
+            loads.append(1)
+            return _pdf(4)
+
+        chapters = [Chapter(pages=[1, 2], paragraphs=[Paragraph(sentences=[Sentence(text="Page 2")])]),
+                    Chapter(paragraphs=[Paragraph(sentences=[Sentence(text="Page 0")])])]
+        slices = [(_.get_slice_key(), min(_.pages, default=0), max(_.pages, default=-1), _._mark_relevant_area)
+                  for _ in chapters]
+        paths = cache.get_slices("ab" * 32, load, slices)
+        self.assertEqual(cache.get_slices("ab" * 32, load, slices), paths)
+        self.assertEqual(len(loads), 1)
+        with fitz.open(paths[0]) as pdf:
+            self.assertEqual(pdf.page_count, 2)
+            self.assertEqual(len(list(pdf[1].annots())), 1)
+            self.assertEqual(len(list(pdf[0].annots())), 0)
+        with fitz.open(paths[1]) as pdf:
+            self.assertEqual(pdf.page_count, 4)
+
+        chapters[0].paragraphs[0].sentences[0].text = "Page 1"
+        self.assertNotEqual(chapters[0].get_slice_key(), slices[0][0])
@@ -0,0 +1,49 @@
+import os
+import tempfile
+from base64 import urlsafe_b64encode
+from io import BytesIO
+from unittest import TestCase
+from PIL import Image as pilImage
+from app.internal.artifacts import ArtifactRegistry
+from app.internal.internal_datamodels import Image
+from app.internal.renditions import RenditionCache
+
+
+def _png(width: int = 600, height: int = 300) -> bytes:
+    res = BytesIO()
+    pilImage.new('RGB', (width, height), (200, 30, 30)).save(res, 'png')
+    return res.getvalue()
+
+
+class TestRenditionCache(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.cache = RenditionCache(ArtifactRegistry(self.folder.name, 10 * 1024 * 1024, 60), '/renditions')
+        self.loads = 0
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def _load(self) -> bytes:
+        self.loads += 1
+        return _png()
+
+    def test_generated_once(self):
+        url = self.cache.get("ab" * 32, self._load)
+        self.assertEqual(url, f"/renditions/{'ab' * 32}-original.png")
+        self.assertEqual(self.cache.get("ab" * 32, self._load), url)
+        self.assertEqual(self.loads, 1)
+        self.assertEqual(os.listdir(os.path.join(self.folder.name, 'renditions')), [f"{'ab' * 32}-original.png"])
+
+    def test_specs(self):
+        path = self.cache.get_path("cd" * 32, self._load, 'thumbnail')
+        self.assertEqual(pilImage.open(path).size, (256, 128))
+        path = self.cache.get_path("cd" * 32, self._load, 'webp-300')
+        self.assertEqual(pilImage.open(path).format, 'WEBP')
+        with self.assertRaises(ValueError):
+            self.cache.get("cd" * 32, self._load, '../etc')
+
+    def test_same_content_same_url(self):
+        data = urlsafe_b64encode(_png()).decode('utf-8')
+        self.assertEqual(Image(base64_file=data).get_content_hash(), Image(base64_file=data).get_content_hash())
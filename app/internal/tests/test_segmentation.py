@@ -0,0 +1,25 @@
+from unittest import TestCase
+from app.internal.segmentation import SentenceSegmenter, split_sentences
+
+
+class TestSegmentation(TestCase):
+
+    def test_heuristics(self):
+        self.assertEqual(split_sentences("Smith et al. measured it. The wear rate drops."),
+                         ["Smith et al. measured it.", "The wear rate drops."])
+
+    def test_memoized(self):
+        segmenter = SentenceSegmenter(cache_size=2)
+        sentences = segmenter.split("Steel wears. Brass does not.")
+        sentences.append("changed")
+        self.assertEqual(segmenter.split("Steel wears. Brass does not."), ["Steel wears.", "Brass does not."])
+        segmenter.split_many(["A.", "B.", "A."])
+        self.assertEqual(len(segmenter._cache), 2)
+
+    def test_parallel_is_the_same(self):
+        paragraphs = [f"Sample {num} was tested. It wears {num} times faster." for num in range(50)]
+        segmenter = SentenceSegmenter(workers=2, parallel_threshold=0, batch_size=8)
+        try:
+            self.assertEqual(segmenter.split_many(paragraphs), [split_sentences(_) for _ in paragraphs])
+        finally:
+            segmenter.close()
@@ -0,0 +1,79 @@
+import math
+from unittest import TestCase
+from app.internal.internal_datamodels import Cell, Column, Document, Image, Row, Table
+from app.internal.tables import TableStore, classify, parse_number
+
+
+def _table_data():
+    return {'0': ["Material", "Load (N)", "Friction"],
+            '1': ["Steel", "10", "0.45"],
+            '2': ["Brass", "", "0.3 ± 0.02"],
+            '3': []}
+
+
+class TestTableStore(TestCase):
+
+    def test_typing(self):
+        self.assertEqual(classify(["12", "12.5 MPa", "", "Steel", "1-2"]), ["NUM", "NUM", "WORD", "WORD", "NUM"])
+        self.assertEqual(parse_number("25 °C"), (25.0, "°C"))
+        self.assertEqual(parse_number("-1,5e2"), (-150.0, ""))
+        self.assertTrue(math.isnan(parse_number("Steel")[0]))
+
+    def test_only_units_follow_numbers(self):
+        self.assertEqual(classify(["2D model", "1st", "3 samples", "5 mm ball"]), 4 * ["WORD"])
+        self.assertTrue(math.isnan(parse_number("3 samples")[0]))
+        self.assertEqual(classify(["0.1 m/s", "5 wt.%", "20 µm", "1.5 s^-1"]), 4 * ["NUM"])
+        self.assertEqual(parse_number("2.5e-3 mm³/Nm"), (0.0025, "mm³/Nm"))
+        self.assertEqual(parse_number("12.5 ± 0.3 MPa"), (12.5, "MPa"))
+
+    def test_ragged_rows(self):
+        store = TableStore.from_rows([["a", "1"], ["b"], ["c", "2", "x"]])
+        self.assertEqual([[_['text'] for _ in row['cells']] for row in store.row_dicts()],
+                         [["a", "1"], ["b"], ["c", "2", "x"]])
+        self.assertEqual([[_['text'] for _ in column['cells']] for column in store.column_dicts()],
+                         [["a", "b", "c"], ["1", "2"], ["x"]])
+        self.assertEqual(TableStore.from_dict({'rows': store.row_dicts(), 'columns': store.column_dicts()}).texts,
+                         store.texts)
+        self.assertIsNone(TableStore.from_dict({'rows': store.row_dicts(), 'columns': []}))
+
+
+class TestTable(TestCase):
+
+    def test_update_table(self):
+        table = Table()
+        table.update_table({'table': _table_data()}, None)
+        self.assertEqual([_.text for _ in table.table_header.cells], ["Material", "Load (N)", "Friction"])
+        self.assertEqual(table.units, ["", "N", ""])
+        self.assertEqual(list(table.get_values(2)), [0.45, 0.3])
+        self.assertEqual(table.dict()['rows'][1]['cells'][1],
+                         {'text': "", 'category': "WORD", 'type': "WORD", 'annotation_ids': []})
+
+        expected = Table(rows=[Row(cells=[Cell(text="Steel", type="WORD", category="WORD"),
+                                          Cell(text="10", type="NUM", category="NUM"),
+                                          Cell(text="0.45", type="NUM", category="NUM")]),
+                               Row(cells=[Cell(text="Brass", type="WORD", category="WORD"),
+                                          Cell(text="", type="WORD", category="WORD"),
+                                          Cell(text="0.3 ± 0.02", type="NUM", category="NUM")])],
+                         table_header=table.table_header, units=table.units)
+        expected.columns = [Column(cells=[row.cells[num] for row in expected.rows]) for num in range(3)]
+        self.assertEqual(table.json(), expected.json())
+
+        # The rows and the columns are built once and share their cells.
+        table.rows[0].cells[0].text = "Iron"
+        self.assertEqual(table.columns[0].cells[0].text, "Iron")
+        self.assertEqual(table.dict()['columns'][0]['cells'][0]['text'], "Iron")
+
+    def test_stored_tables_stay_columnar(self):
+        table = Table()
+        table.update_table({'table': _table_data()}, None)
+        doc = Document.load_columnar({'id': "1", 'file_name': "1.pdf", 'tables': [table.dict()]}, validate=False)
+        self.assertIsNotNone(doc.tables[0]._store)
+        self.assertEqual(doc.json(), Document(id="1", file_name="1.pdf", tables=[table.dict()]).json())
+
+    def test_update_image(self):
+        doc = Document(id="1", file_name="1.pdf", images=[Image(description="Friction")])
+        doc.images[0].update_image({'0': ["", "Speed [m/s]"], '1': ["1", "0.5 m/s"]}, doc)
+        self.assertEqual(len(doc.images), 0)
+        self.assertEqual(doc.tables[0].description, "Friction")
+        self.assertEqual(doc.tables[0].units, ["m/s"])
+        self.assertEqual(doc.tables[0].rows[0].cells[0].type, "NUM")
@@ -0,0 +1,37 @@
+from unittest import TestCase
+from app.internal.internal_datamodels import Header, Text
+from app.internal.tests.test_tokens import _word
+
+
+def _text():
+    chapters = [{'header': {'name': "Introduction"}, 'pages': [1, 2],
+                 'paragraphs': [{'sentences': [{'text': "Steel on steel.", 'words': [_word(0, "Steel", 1)]},
+                                               {'text': "It wears."}]},
+                                {'sentences': [{'text': "Oil helps."}]}]},
+                {'header': {'name': "Results"}, 'pages': [3],
+                 'paragraphs': [{'sentences': [{'text': "The friction drops."}]}]}]
+    return Text(chapters=chapters)
+
+
+class TestUpdateText(TestCase):
+
+    def test_unchanged_paragraphs_are_reused(self):
+        text = _text()
+        first = text.chapters[0].paragraphs[0]
+        edited = "Steel on steel. It wears.\nGrease helps. Water does not.\n---\n\nThe friction drops.\n---\n\n"
+        text.update_text(edited, None)
+
+        self.assertIs(text.chapters[0].paragraphs[0], first)
+        self.assertEqual(text.chapters[0].paragraphs[0].sentences[0].words[0].text, "Steel")
+        self.assertEqual([_.text for _ in text.chapters[0].paragraphs[1].sentences],
+                         ["Grease helps.", "Water does not."])
+        self.assertEqual(text.chapters[0].header, Header(name="Introduction"))
+        self.assertEqual(text.chapters[0].pages, [1, 2])
+        self.assertEqual(text.chapters[1].header, Header(name="Results"))
+
+    def test_new_chapters_have_no_header(self):
+        text = _text()
+        text.update_text("A new start.\n---\n\nThe friction drops.", None)
+        self.assertIsNone(text.chapters[0].header)
+        self.assertEqual(text.chapters[1].header, Header(name="Results"))
+        self.assertEqual(len(text.chapters), 2)
@@ -0,0 +1,61 @@
+import sys
+from array import array
+from unittest import TestCase
+from app.internal.internal_datamodels import Chapter, Document, Paragraph, Sentence, Word
+from app.internal.tests.test_text import _text
+from app.internal.tests.test_tokens import _word
+
+
+class TestTextView(TestCase):
+
+    def test_fulltext(self):
+        doc = Document(id="1", file_name="1.pdf", text=_text())
+        separator = 80 * "-" + "\n\n"
+        self.assertEqual(doc.get_fulltext(),
+                         "Steel on steel. It wears. \nOil helps. \n" + separator + "The friction drops. \n" + separator)
+        view = doc.text.get_view()
+        self.assertEqual(view.get_chapter_text(1), "The friction drops. \n")
+        self.assertEqual(view.get_chapter(len("Steel on steel. It wears. \nOil helps. \n") + 3), 0)
+        self.assertEqual(view.get_chapter(view.fulltext.index("The")), 1)
+
+    def test_locate(self):
+        text = _text()
+        sentence = text.chapters[0].paragraphs[0].sentences[1]
+        sentence.words = [Word(**_word(0, "It")), Word(**_word(1, "wears"))]
+        view = text.get_view()
+        offset = view.fulltext.index("wears")
+        self.assertEqual(view.locate(offset + 2), {'chapter': 0, 'paragraph': 0, 'sentence': 1, 'word': 1})
+        self.assertEqual(view.locate(offset - 1)['word'], None)
+        self.assertIsNone(view.locate(view.fulltext.index("-")))
+        self.assertEqual(view.get_span(0, 1, 0), (view.fulltext.index("Oil"), view.fulltext.index("Oil") + 10))
+        self.assertEqual(view.locate_range(offset, view.fulltext.index("Oil") + 1), [(0, 0, 1), (0, 1, 0)])
+
+    def test_keeps_only_offsets(self):
+        text = _text()
+        text.chapters.insert(1, Chapter(paragraphs=[Paragraph(sentences=[])]))
+        view = text.get_view()
+        self.assertEqual({type(_) for _ in vars(view).values()}, {array, str})
+        self.assertEqual(view.size(), sys.getsizeof(view.fulltext) +
+                         sum(sys.getsizeof(_) for _ in vars(view).values() if isinstance(_, array)))
+        self.assertEqual(view.locate_range(0, len(view.fulltext)), [(0, 0, 0), (0, 0, 1), (0, 1, 0), (2, 0, 0)])
+        self.assertIsNone(view.get_span(1, 0, 0))
+        self.assertEqual(view.get_span(2, 0, 0), (view.fulltext.index("The"), view.fulltext.index("The") + 19))
+
+    def test_follows_changes(self):
+        text = _text()
+        view = text.get_view()
+        text.update_text(view.fulltext.replace("Oil helps.", "Grease helps."), None)
+        self.assertEqual(text.get_view().fulltext, view.fulltext.replace("Oil helps.", "Grease helps."))
+
+        # Changes inside the chapters are part of the next view as well.
+        text.chapters[1].paragraphs.append(Paragraph(sentences=[Sentence(text="More.")]))
+        text.chapters[0].paragraphs[0].sentences[0].text = "Iron on steel."
+        self.assertIn("More.", text.get_view().fulltext)
+        self.assertTrue(text.get_view().fulltext.startswith("Iron on steel."))
+
+    def test_edit_round_trip_reuses_paragraphs(self):
+        text = _text()
+        first = text.chapters[0].paragraphs[0]
+        text.update_text(text.get_view().fulltext, None)
+        self.assertIs(text.chapters[0].paragraphs[0], first)
+        self.assertEqual(len(text.chapters), 2)
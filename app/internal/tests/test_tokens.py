@@ -0,0 +1,40 @@
+from unittest import TestCase
+from app.internal.internal_datamodels import Document
+from app.internal.tokens import TokenStore
+
+
+def _word(id, text, annotation_id=-1):
+    return {'id': id, 'text': text, 'normalized_text': text.lower(), 'enriched_text': text,
+            'annotation_id': annotation_id, 'start_pos': id * 2, 'end_pos': id * 2 + 1, 'prev_word_id': id - 1}
+
+
+def _document():
+    sentences = [{'text': "Steel on steel", 'words': [_word(0, "Steel", 1), _word(1, "on"), _word(2, "steel", 2)]},
+                 {'text': "", 'words': []}]
+    return {'id': "1", 'file_name': "1.pdf",
+            'text': {'abstract': {'paragraphs': [{'sentences': [{'text': "A", 'words': [_word(3, "A")]}]}]},
+                     'chapters': [{'paragraphs': [{'sentences': sentences}], 'pages': [1]}]}}
+
+
+class TestTokenStore(TestCase):
+
+    def test_strings_are_pooled(self):
+        store = TokenStore()
+        self.assertEqual(store.extend([_word(0, "steel"), _word(1, "steel")]), (0, 2))
+        self.assertEqual(store.strings, ["steel"])
+        self.assertEqual(store.to_dicts(1, 2), [_word(1, "steel")])
+
+    def test_lossless_round_trip(self):
+        data = _document()
+        expected = Document(**data)
+        doc = Document.load_columnar(data)
+        self.assertEqual(doc.json(), expected.json())
+        self.assertIn('words', data['text']['chapters'][0]['paragraphs'][0]['sentences'][0])
+
+        sentence = doc.text.chapters[0].paragraphs[0].sentences[0]
+        self.assertEqual(sentence.get_annotation_ids(), [1, -1, 2])
+        self.assertNotIn('words', sentence.__dict__)
+        self.assertEqual(sentence.words, expected.text.chapters[0].paragraphs[0].sentences[0].words)
+        sentence.words[0].text = "Iron"
+        self.assertEqual(doc.dict()['text']['chapters'][0]['paragraphs'][0]['sentences'][0]['words'][0]['text'],
+                         "Iron")
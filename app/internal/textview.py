@@ -0,0 +1,128 @@
+from __future__ import annotations
+import sys
+from array import array
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+
+CHAPTER_SEPARATOR = 80 * "-" + "\n\n"
+
+
+class TextView:
+    ''' The full text of a document and a map from its character offsets to the tokens.
+
+    The full text is built once (chapter by chapter, a paragraph per line, the chapters are
+    separated by a line of dashes). The start offsets of the chapters, paragraphs, sentences and
+    words are kept in sorted arrays, so an offset is mapped to its sentence and word with a binary
+    search. The view keeps no references to the models of the text, only the offsets.
+    '''
+
+    def __init__(self, text: 'Text'):
+        parts: List[str] = []
+        self.chapter_starts: array = array('q')
+        self.paragraph_starts: array = array('q')
+        self.sentence_starts: array = array('q')
+        self.sentence_ends: array = array('q')
+        # The number of the first paragraph of every chapter and of the first sentence of every paragraph.
+        self.first_paragraphs: array = array('q')
+        self.first_sentences: array = array('q')
+        # The words of all sentences: start, end and the number of the word in its sentence. Words that
+        # do not occur in the text of their sentence are left out.
+        self.word_starts: array = array('q')
+        self.word_ends: array = array('q')
+        self.word_numbers: array = array('q')
+        # The number of the first word of every sentence.
+        self.first_words: array = array('q')
+        pos = 0
+        for chapter in text.chapters:
+            self.chapter_starts.append(pos)
+            self.first_paragraphs.append(len(self.paragraph_starts))
+            for paragraph in chapter.paragraphs:
+                self.paragraph_starts.append(pos)
+                self.first_sentences.append(len(self.sentence_starts))
+                for sentence in paragraph.sentences:
+                    self.sentence_starts.append(pos)
+                    self.sentence_ends.append(pos + len(sentence.text))
+                    self._add_words(sentence, pos)
+                    parts.append(sentence.text)
+                    parts.append(" ")
+                    pos += len(sentence.text) + 1
+                parts.append("\n")
+                pos += 1
+            parts.append(CHAPTER_SEPARATOR)
+            pos += len(CHAPTER_SEPARATOR)
+        self.chapter_starts.append(pos)
+        self.first_paragraphs.append(len(self.paragraph_starts))
+        self.first_sentences.append(len(self.sentence_starts))
+        self.first_words.append(len(self.word_starts))
+        self.fulltext: str = "".join(parts)
+
+    def _add_words(self, sentence: 'Sentence', offset: int) -> None:
+        ''' Adds the offsets of the words of a sentence that starts at the offset. '''
+        self.first_words.append(len(self.word_starts))
+        pos = 0
+        for word_num, word in enumerate(sentence.words):
+            start = sentence.text.find(word.text, pos) if word.text != '' else -1
+            if start >= 0:
+                pos = start + len(word.text)
+                self.word_starts.append(offset + start)
+                self.word_ends.append(offset + pos)
+                self.word_numbers.append(word_num)
+
+    def size(self) -> int:
+        ''' Returns the number of bytes of the view. '''
+        return sys.getsizeof(self.fulltext) + sum(sys.getsizeof(_) for _ in vars(self).values() if isinstance(_, array))
+
+    def get_chapter_text(self, num: int) -> str:
+        ''' Returns the text of a chapter, without the separator. '''
+        return self.fulltext[self.chapter_starts[num]:self.chapter_starts[num + 1] - len(CHAPTER_SEPARATOR)]
+
+    def get_chapter(self, offset: int) -> Optional[int]:
+        ''' Returns the number of the chapter an offset is in. '''
+        if offset < 0 or offset >= len(self.fulltext):
+            return None
+        return bisect_right(self.chapter_starts, offset) - 1
+
+    def get_span(self, chapter: int, paragraph: int, sentence: int) -> Optional[Tuple[int, int]]:
+        ''' Returns the start and end offset of a sentence. '''
+        if not 0 <= chapter < len(self.first_paragraphs) - 1:
+            return None
+        paragraph += self.first_paragraphs[chapter]
+        if not self.first_paragraphs[chapter] <= paragraph < self.first_paragraphs[chapter + 1]:
+            return None
+        num = self.first_sentences[paragraph] + sentence
+        if not self.first_sentences[paragraph] <= num < self.first_sentences[paragraph + 1]:
+            return None
+        return self.sentence_starts[num], self.sentence_ends[num]
+
+    def _sentence(self, offset: int) -> Optional[int]:
+        num = bisect_right(self.sentence_starts, offset) - 1
+        if num < 0 or offset >= self.sentence_ends[num]:
+            return None
+        return num
+
+    def _location(self, num: int) -> Tuple[int, int, int]:
+        ''' Returns (chapter, paragraph, sentence) of a sentence. '''
+        # Empty paragraphs and chapters share their first number with the next one, bisect_right skips them.
+        paragraph = bisect_right(self.first_sentences, num) - 1
+        chapter = bisect_right(self.first_paragraphs, paragraph) - 1
+        return chapter, paragraph - self.first_paragraphs[chapter], num - self.first_sentences[paragraph]
+
+    def locate(self, offset: int) -> Optional[Dict]:
+        ''' Returns the chapter, paragraph, sentence and word (or None) at an offset.
+
+        Returns None for offsets between the sentences, e.g. on the chapter separators.
+        '''
+        num = self._sentence(offset)
+        if num is None:
+            return None
+        chapter, paragraph, sentence = self._location(num)
+        first, last = self.first_words[num], self.first_words[num + 1]
+        word_num = bisect_right(self.word_starts, offset, first, last) - 1
+        word = self.word_numbers[word_num] if word_num >= first and offset < self.word_ends[word_num] else None
+        return {'chapter': chapter, 'paragraph': paragraph, 'sentence': sentence, 'word': word}
+
+    def locate_range(self, start: int, end: int) -> List[Tuple[int, int, int]]:
+        ''' Returns (chapter, paragraph, sentence) of the sentences that overlap the range [start, end). '''
+        first = max(bisect_right(self.sentence_starts, start) - 1, 0)
+        last = bisect_right(self.sentence_starts, end - 1)
+        return [self._location(num) for num in range(first, last) if self.sentence_ends[num] > start]
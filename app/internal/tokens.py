@@ -0,0 +1,102 @@
+from __future__ import annotations
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# The fields of a Word in the order of the model.
+INT_FIELDS = ['id', 'annotation_id', 'start_pos', 'end_pos', 'prev_word_id']
+STR_FIELDS = ['text', 'normalized_text', 'enriched_text']
+WORD_FIELDS = ['id', 'text', 'normalized_text', 'enriched_text', 'annotation_id', 'start_pos', 'end_pos',
+               'prev_word_id']
+
+
+class TokenStore:
+    ''' Keeps the words of all sentences of a document column by column.
+
+    The integer fields are stored in arrays, the string fields as positions in a pool in which
+    every distinct string is stored once. A sentence refers to the range of its words, the
+    words are only built (as dicts or Word models) when they are needed.
+    '''
+
+    def __init__(self):
+        self.columns: Dict[str, array] = {field: array('q') for field in INT_FIELDS + STR_FIELDS}
+        self.strings: List[str] = []
+        self._positions: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.columns['id'])
+
+    def _intern(self, string: str) -> int:
+        position = self._positions.get(string)
+        if position is None:
+            position = self._positions[string] = len(self.strings)
+            self.strings.append(string)
+        return position
+
+    def extend(self, words: Iterable[Dict]) -> Tuple[int, int]:
+        ''' Adds the words of a sentence and returns the range they are stored at. '''
+        start = len(self)
+        columns = self.columns
+        for word in words:
+            for field in INT_FIELDS:
+                columns[field].append(word[field])
+            for field in STR_FIELDS:
+                columns[field].append(self._intern(word[field]))
+        return start, len(self)
+
+    def to_dicts(self, start: int, end: int) -> List[Dict]:
+        ''' Returns the words in the range as dicts, exactly like the serialized Word models. '''
+        strings = self.strings
+        columns = [(field, self.columns[field][start:end], field in STR_FIELDS) for field in WORD_FIELDS]
+        res = [{} for _ in range(end - start)]
+        for field, values, is_string in columns:
+            for word, value in zip(res, values):
+                word[field] = strings[value] if is_string else value
+        return res
+
+    def get(self, field: str, start: int, end: int) -> List:
+        ''' Returns one field of the words in the range, e.g. all annotation ids of a sentence. '''
+        values = self.columns[field][start:end]
+        if field in STR_FIELDS:
+            return [self.strings[_] for _ in values]
+        return values.tolist()
+
+    def size(self) -> int:
+        ''' Returns the approximate number of bytes of the columns and the string pool. '''
+        return sum(_.itemsize * len(_) for _ in self.columns.values()) + sum(len(_) for _ in self.strings)
+
+
+def iter_sentences(text: Optional[Dict]) -> Iterator[Dict]:
+    ''' Iterates over the serialized sentences of a text, the abstract first. '''
+    if text is None:
+        return
+    for chapter in [text.get('abstract')] + list(text.get('chapters') or []):
+        for paragraph in (chapter or {}).get('paragraphs') or []:
+            yield from paragraph.get('sentences') or []
+
+
+def split_words(text: Optional[Dict]) -> Tuple[Optional[Dict], TokenStore, List[Tuple[int, int]]]:
+    ''' Moves the words of a serialized text into a token store.
+
+    Returns a copy of the text without words, the store and the word range of every sentence
+    in the order of iter_sentences. The given text is not changed.
+    '''
+    store = TokenStore()
+    if text is None:
+        return None, store, []
+    ranges = []
+
+    def strip_chapter(chapter: Optional[Dict]) -> Optional[Dict]:
+        if chapter is None:
+            return None
+        paragraphs = []
+        for paragraph in chapter.get('paragraphs') or []:
+            sentences = []
+            for sentence in paragraph.get('sentences') or []:
+                ranges.append(store.extend(sentence.get('words') or []))
+                sentences.append({key: value for key, value in sentence.items() if key != 'words'})
+            paragraphs.append(dict(paragraph, sentences=sentences))
+        return dict(chapter, paragraphs=paragraphs)
+
+    stripped = dict(text, abstract=strip_chapter(text.get('abstract')))
+    stripped['chapters'] = [strip_chapter(_) for _ in text.get('chapters') or []]
+    return stripped, store, ranges
@@ -1,25 +1,53 @@
+import os
 import uvicorn
 from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
-from static.routers import advanced, analysis, enrichment, edit
+from static.routers import advanced, analysis, api, enrichment, edit
+from database.database import db
 from app.internal.tasks import document_enrichment, document_annotation
+from app.config import PATH_TO_RENDITIONS, RENDITION_MAX_AGE, RENDITION_URL
+
+
+class RenditionFiles(StaticFiles):
+    """ Serves the renditions of the images, their names depend on their content, so they never change. """
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers['Cache-Control'] = f"public, max-age={RENDITION_MAX_AGE}, immutable"
+        return response
+
 
 app = FastAPI()
 templates = Jinja2Templates(directory="static/templates")
+os.makedirs(PATH_TO_RENDITIONS, exist_ok=True)
+app.mount(RENDITION_URL, RenditionFiles(directory=PATH_TO_RENDITIONS), name="renditions")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 
 app.include_router(advanced.router)
 app.include_router(analysis.router)
+app.include_router(api.router)
 app.include_router(enrichment.router)
 app.include_router(edit.router)
 app.include_router(document_enrichment.router)
 app.include_router(document_annotation.router)
 
 
+@app.on_event("startup")
+def startup():
+    """ Removes the temporary files that were left behind by earlier runs. """
+    db.collect_tmp()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    """ Writes all pending document updates before the server stops. """
+    db.flush()
+
+
 @app.get("/", response_class=HTMLResponse)
 def hello_world(request: Request):
     id = 0
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Request
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, Response
 from fastapi.templating import Jinja2Templates
 from database.database import db
 from app.internal.tasks.document_analysis import create_annotation_graph, create_context_graph, get_download_link
@@ -16,21 +16,7 @@ router = APIRouter(
 @router.get("/start_page", response_class=HTMLResponse)
 async def read_item(request: Request):
     """The Entry point to this type of tasks. """
-    extracted_files = db.get_all_index_data('extract')
-    annotated_files = db.get_all_index_data('annotate')
-    analysed_files = db.get_all_index_data('analyse')
-    res = []
-    for file in extracted_files:
-        state = 'extracted'
-        if file.id in [_.id for _ in annotated_files]:
-            state = 'annotated'
-            if file.id in [_.id for _ in analysed_files]:
-                state = 'analysed'
-
-        # Create a list of dicts that can be handled by jinja
-        data = file.dict()
-        data.update({'state': state})
-        res.append(data)
+    res = db.get_states(['extracted', 'annotated', 'analysed'])
     return analysis_templates.TemplateResponse("start_analysis.html",
                                                {"request": request,
                                                 "status": res}
@@ -39,8 +25,7 @@ async def read_item(request: Request):
 
 @router.get("/annotation_graph", response_class=HTMLResponse)
 async def read_item(request: Request, id: str):
-    file = db.get_file('annotate', id)
-    doc = Document(**file)
+    doc = db.get_document('annotate', id)
 
     graph = create_annotation_graph(doc)
     return analysis_templates.TemplateResponse("annotation_graph.html",
@@ -64,16 +49,20 @@ async def read_item(request: Request, id: str):
     path = get_download_link(doc)
     return path
 
-@router.get("/download_annotatd_data", response_class=FileResponse)
+def _download(index: str, id: str) -> Response:
+    """ Returns the stored document as json attachment, the pdf and the images are inlined. """
+    file = db.get_file(index, id)
+    if file is None:
+        return JSONResponse({'error': f"Document {id} does not exist."}, status_code=404)
+    doc = Document.load_columnar(file, validate=False)
+    doc.load_files()
+    return Response(doc.to_json(), media_type='application/json',
+                    headers={'Content-Disposition': f'attachment; filename="{id}.json"'})
+
+@router.get("/download_annotatd_data", response_class=Response)
 async def read_item(request: Request, id: str):
-    file = db.get_file('annotate', id)
-    doc = Document(**file)
-    path = doc.file_path
-    return path
+    return _download('annotate', id)
 
-@router.get("/download_extracted_data", response_class=FileResponse)
+@router.get("/download_extracted_data", response_class=Response)
 async def read_item(request: Request, id: str):
-    file = db.get_file('extract', id)
-    doc = Document(**file)
-    path = doc.file_path
-    return path
\ No newline at end of file
+    return _download('extract', id)
@@ -1,5 +1,72 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
 from database.database import db
 
+router = APIRouter(
+    prefix="/api",
+    responses={404: {"description": "Not found"}},
+)
+
+
+@router.get("/documents")
+def find_documents(doi: str = None, issn: str = None, title: str = None, author: str = None, journal: str = None):
+    """ Finds annotated documents by their metadata.
+
+    DOI and ISSN have to match exactly. For title, author and journal every word of the
+    query has to be the start of a word, e.g. /api/documents?author=schm&title=friction
+    """
+    return JSONResponse(db.find_documents(doi=doi, issn=issn, title=title, author=author, journal=journal))
+
+
+@router.get("/search")
+def search(query: str, level: str = 'sentence', limit: int = 20):
+    """ Searches the sentences and knowledge object labels of all documents.
+
+    Quoted phrases have to occur, e.g. /api/search?query="sliding velocity" steel counterbody
+    The level (document, chapter, paragraph or sentence) is the granularity of the hits.
+    """
+    if level not in ['document', 'chapter', 'paragraph', 'sentence']:
+        return JSONResponse({'error': f"Unknown level {level}."}, status_code=400)
+    return JSONResponse(db.search(query, level, limit))
+
+
+@router.get("/documents/{index}/{id}/versions")
+def get_versions(index: str, id: str):
+    """ Lists the stored versions of a document. """
+    return JSONResponse(db.get_versions(index, id))
+
+
+@router.get("/documents/{index}/{id}/versions/{version}")
+def get_version(index: str, id: str, version: int):
+    """ Returns a previous version of a document. """
+    document = db.get_version(index, id, version)
+    if document is None:
+        return JSONResponse({'error': f"Version {version} of {id} does not exist."}, status_code=404)
+    return JSONResponse(document)
+
+
+@router.get("/documents/{index}/{id}/diff")
+def diff_versions(index: str, id: str, a: int, b: int):
+    """ Returns the changes from version a to version b as JSON Patch. """
+    patch = db.diff_versions(index, id, a, b)
+    if patch is None:
+        return JSONResponse({'error': f"Version {a} or {b} of {id} does not exist."}, status_code=404)
+    return JSONResponse(patch)
+
+
+@router.post("/documents/{index}/{id}/versions/{version}/restore")
+def restore_version(index: str, id: str, version: int):
+    """ Makes a previous version the current version of a document. """
+    if not db.restore_version(index, id, version):
+        return JSONResponse({'error': f"Version {version} of {id} does not exist."}, status_code=404)
+    return JSONResponse({'restored': version})
+
+@router.post("/gc")
+def collect_garbage(dry_run: bool = False):
+    """ Deletes orphaned database files, unreferenced blobs and expired temporary files. """
+    return JSONResponse(db.collect_garbage(dry_run).dict())
+
+
 # Get extracted document
 
 # get annotated document
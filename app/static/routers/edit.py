@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Request, BackgroundTasks
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, Request
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 from database.database import db
-from app.internal.internal_datamodels import Document, OptionSelection, KnowledgeObject
+from app.internal.internal_datamodels import Document, OptionSelection, KnowledgeObject, KnowledgeObjectList
+from app.internal.construct import construct
+from app.internal.pages import FORMATS
+from app.config import RENDITION_MAX_AGE, TMP_LEASE
 from pydantic import BaseModel, Field
 from typing import Dict, List
 from fastapi.encoders import jsonable_encoder
@@ -57,24 +60,9 @@ def table_as_html(table) -> str:
     return res
 
 
-def _get_status() -> Dict:
-    """ Gets all indexs states. """
-    uploaded_files = db.get_all_index_data('upload')
-    extracted_files = db.get_all_index_data('extract')
-    annotated_files = db.get_all_index_data('annotate')
-    res = []
-    for file in uploaded_files:
-        state = 'uploaded'
-        if file.id in [_.id for _ in extracted_files]:
-            state = 'extracted'
-            if file.id in [_.id for _ in annotated_files]:
-                state = 'annotated'
-
-        # Creata a dict of List that can be handled by jinja
-        data = file.dict()
-        data.update({'state': state})
-        res.append(data)
-    return res
+def _get_status() -> List[Dict]:
+    """ Gets the pipeline states of all documents. """
+    return db.get_states()
 
 @router.put("/delete_document")
 def delete_document(request: Request, id: str):
@@ -95,15 +83,13 @@ def get_status(request: Request) -> Dict:
     return _get_status()
 
 @router.put("/annotation/annotation_merge")
-async def merge_annotations(document_id: str, data: AnnotationItem, background_tasks: BackgroundTasks):
-    file = db.get_file('annotate', document_id, False)
-    if file is not None:
-        doc = Document(**file)
+async def merge_annotations(document_id: str, data: AnnotationItem):
+    doc = db.get_document('annotate', document_id)
+    if doc is not None:
         doc.merge_kObjs(data.data)
 
-    background_tasks.add_task(update_file, doc)
-    file = db.get_file('annotate', document_id, False)
-    doc = Document(**file)
+    db.update_file(doc)
+    doc = db.get_document('annotate', document_id)
     kObjs = doc.get_knowledgeObjects()
 
     return {"template": kObjs_as_html(kObjs)}
@@ -111,29 +97,23 @@ async def merge_annotations(document_id: str, data: AnnotationItem, background_t
 
 
 @router.put("/annotation/annotation_remove")
-async def remove_annotations(document_id: str, data: AnnotationItem, background_tasks: BackgroundTasks):
-    file = db.get_file('annotate', document_id, False)
-    if file is not None:
-        doc = Document(**file)
+async def remove_annotations(document_id: str, data: AnnotationItem):
+    doc = db.get_document('annotate', document_id)
+    if doc is not None:
         doc.remove_KObjs(data.data)
 
-    background_tasks.add_task(update_file, doc)
+    db.update_file(doc)
     kObjs = doc.get_knowledgeObjects()
 
 
     return {"template": kObjs_as_html(kObjs)}
 
-def update_file(document):
-    """ Updates the document. """
-    db.update_file(document)
-
 @router.put("/annotation/annotation_split")
-async def split_annotations(document_id: str, data: AnnotationItem, background_tasks: BackgroundTasks):
-    file = db.get_file('annotate', document_id, False)
-    if file is not None:
-        doc = Document(**file)
+async def split_annotations(document_id: str, data: AnnotationItem):
+    doc = db.get_document('annotate', document_id)
+    if doc is not None:
         doc.split_kObj(data.data)
-    background_tasks.add_task(update_file, doc)
+    db.update_file(doc)
 
   #  file = db.get_file('annotate', document_id, False)
   #  doc = Document(**file)
@@ -142,13 +122,12 @@ async def split_annotations(document_id: str, data: AnnotationItem, background_t
     return {"template": kObjs_as_html(kObjs)}
 
 @router.put("/annotation/change_category_annotations")
-async def change_category_annotations(document_id: str, data: AnnotationItem, background_tasks: BackgroundTasks):
-    file = db.get_file('annotate', document_id)
-    if file is not None:
-        doc = Document(**file)
+async def change_category_annotations(document_id: str, data: AnnotationItem):
+    doc = db.get_document('annotate', document_id)
+    if doc is not None:
         doc.update_kObj(data.data['id'], data.data)
 
-    background_tasks.add_task(update_file, doc)
+    db.update_file(doc)
    # file = db.get_file('annotate', document_id, False)
    # doc = Document(**file)
     kObjs = doc.get_knowledgeObjects()
@@ -157,9 +136,8 @@ async def change_category_annotations(document_id: str, data: AnnotationItem, ba
 
 @router.put("/update_document", response_model=Item)
 async def update_data(itemid: str, item: Item):
-    file = db.get_file('extract', itemid, False)
-    if file is not None:
-        doc = Document(**file)
+    doc = db.get_document('extract', itemid)
+    if doc is not None:
         if item.num.isnumeric():
             num = int(item.num)
         else:
@@ -179,16 +157,15 @@ async def update_data(itemid: str, item: Item):
 
 @router.get("/edit_document", response_class=HTMLResponse)
 async def read_item(request: Request, id: str):
-    file = db.get_file('extract', id, cached=False)
+    file = db.get_file('extract', id, fields=['images', 'tables', 'file_name'])
     state = file is not None
     has_images = False
     has_tables = False
     name = ''
     if state:
-        doc = Document(**file)
-        has_images = len(doc.images) > 0
-        has_tables = len(doc.tables) > 0
-        name = doc.file_name
+        has_images = len(file.get('images', [])) > 0
+        has_tables = len(file.get('tables', [])) > 0
+        name = file.get('file_name', '')
     return edit_templates.TemplateResponse("edit_document.html",
                                        {"request": request,
                                         "active": state,
@@ -207,25 +184,54 @@ async def read_item(request: Request, id: str):
 @router.get("/edit_text", response_class=HTMLResponse)
 async def read_item(request: Request, id: str):
 
-    file = db.get_file('extract', id)
-    doc = Document(**file)
-    path = doc.get_path_to_file()
+    file = db.get_file('extract', id, fields=['base64_file', 'blob_ref'])
+    doc = Document.load_columnar(dict(file, id=id), validate=False)
+    view = db.get_text_view('extract', id)
     return edit_templates.TemplateResponse("edit_text.html",
                                       {"request": request,
                                        "id": id,
                                        "title": "Item",
                                        "active": True,
-                                       "pdf_file": path,
-                                       "text": doc.get_fulltext(),
+                                       "pages": doc.get_page_count(),
+                                       "ref": doc.get_content_hash(),
+                                       "text": view.fulltext,
                                        "type": 'text',
                                        "step": 2})
 
 
+@router.get("/page", response_class=FileResponse)
+async def get_page(id: str, num: int = 0, zoom: float = 1.5, format: str = 'png'):
+    """ Returns a page of the pdf as png or as single-page pdf, the pages are rendered on demand. """
+    if format not in FORMATS:
+        return JSONResponse({'error': f"Unknown format {format}."}, status_code=400)
+    file = db.get_file('extract', id, fields=['base64_file', 'blob_ref'])
+    if file is None:
+        return JSONResponse({'error': f"Document {id} does not exist."}, status_code=404)
+    doc = Document.load_columnar(dict(file, id=id), validate=False)
+    path = doc.get_page(num, zoom, format, pin=TMP_LEASE)
+    if path is None:
+        return JSONResponse({'error': f"Page {num} of {id} does not exist."}, status_code=404)
+    # The page urls contain the hash of the pdf (ref), so the content of an url never changes.
+    return FileResponse(path, headers={'Cache-Control': f"private, max-age={RENDITION_MAX_AGE}"})
+
+
+@router.get("/chapter", response_class=FileResponse)
+async def get_chapter(id: str, num: int = 0):
+    """ Returns the pages of a chapter as pdf, the sentences of the chapter are highlighted. """
+    file = db.get_file('extract', id, fields=['text', 'base64_file', 'blob_ref'])
+    if file is None:
+        return JSONResponse({'error': f"Document {id} does not exist."}, status_code=404)
+    doc = Document.load_columnar(dict(file, id=id), validate=False)
+    if doc.text is None or not 0 <= num < len(doc.text.chapters):
+        return JSONResponse({'error': f"Chapter {num} of {id} does not exist."}, status_code=404)
+    return FileResponse(doc.text.chapters[num].get_chapter_as_pdf(doc, pin=TMP_LEASE), media_type='application/pdf')
+
+
 @router.get("/edit_images", response_class=HTMLResponse)
 async def read_item(request: Request, id: str, num: int = 0):
 
-    file = db.get_file('extract', id, False)
-    doc = Document(**file)
+    file = db.get_file('extract', id, fields=['images'])
+    doc = Document.load_columnar(dict(file, id=id), validate=False)
     image = doc.get_image(num)
     image_base_64 = image.get_path_to_file()
 
@@ -242,8 +248,8 @@ async def read_item(request: Request, id: str, num: int = 0):
 
 @router.get("/edit_tables", response_class=HTMLResponse)
 async def read_item(request: Request, id: str, num: int = 0):
-    file = db.get_file('extract', id, False)
-    doc = Document(**file)
+    file = db.get_file('extract', id, fields=['tables'])
+    doc = Document.load_columnar(dict(file, id=id), validate=False)
     table = doc.get_table(num)
 
     num = abs(num) % len(doc.tables)
@@ -267,13 +273,9 @@ async def read_item(request: Request, id: str, num: int = 0):
 @router.get("/edit_annotations", response_class=HTMLResponse)
 async def read_item(request: Request, id: str, reload: str = ''):
 
-    file = db.get_file('annotate', id, False)
-
-
-
-    doc = Document(**file)
+    file = db.get_file('annotate', id, fields=['knowledgeObjects'])
 
-    knowledgeObjects: List[KnowledgeObject] = doc.get_knowledgeObjects()
+    knowledgeObjects: List[KnowledgeObject] = construct(KnowledgeObjectList, file).knowledgeObjects
 
 
     return edit_templates.TemplateResponse("edit_annotations.html",
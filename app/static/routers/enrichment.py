@@ -1,4 +1,3 @@
-import base64
 import os.path
 from uuid import uuid4
 
@@ -6,13 +5,14 @@ from fastapi import APIRouter, Request, BackgroundTasks
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from database.database import db
+from database.blobs import blob_store
 from app.internal.internal_datamodels import Document, OptionSelection
 import starlette.datastructures as star_data
 from app.config import DATABASE_PATHS
 from app.internal.tasks import document_enrichment as enrichment
 from pydantic import BaseModel
 
-from typing import List
+from typing import Dict, Iterator
 
 enrichment_templates = Jinja2Templates(directory="static/templates/enrichment")
 templates = Jinja2Templates(directory="static/templates")
@@ -49,7 +49,7 @@ async def read_item(request: Request):
 @router.get("/options", response_class=HTMLResponse)
 async def read_item(request: Request):
     """ Loads the Option Page that lists all avaible options for the enrichment process. """
-    docs: List[Document] = [Document(**_) for _ in db.get_all_files('upload', False)]
+    docs: Iterator[Dict] = db.iter_files('upload', fields=['id', 'file_name'])
     return enrichment_templates.TemplateResponse("options.html",
                                       {"request": request,
                                        "id": id,
@@ -73,11 +73,12 @@ async def upload_file(request: Request):
 
             doc = Document(**{
                 "file_name": upload_file.filename,
-                "base64_file": base64.urlsafe_b64encode(file).decode('utf-8'),
+                "blob_ref": blob_store.put(file),
                 "id": id,
                 "file_path": os.path.join(DATABASE_PATHS['upload'], f"{id}.json")
             })
             db.add_file(doc, 'upload')
+            db.set_state(id, 'uploaded', upload_file.filename)
         else:
             return {'result': 500}
 